@@ -0,0 +1,67 @@
+"""并发重命名基准测试
+
+用在每次 rename 前休眠的函数模拟 SMB/NFS 的网络往返延迟，比较不同
+并发数下 RenameEngine 的耗时:
+
+    python benchmarks/bench_parallel_rename.py --files 2000 --latency-ms 5
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rename_core import RenameEngine  # noqa: E402
+from rename_fs import DirectoryRenamer  # noqa: E402
+
+
+class LatencyRenamer(DirectoryRenamer):
+    """在真实 rename 之前加入固定延迟，模拟高延迟文件系统"""
+
+    def __init__(self, directory, latency):
+        super().__init__(directory)
+        self.latency = latency
+
+    def rename(self, old_name, new_name):
+        time.sleep(self.latency)
+        super().rename(old_name, new_name)
+
+
+def run_once(files, latency, workers):
+    """在临时目录中创建文件并重命名，返回 (耗时秒数, 成功数量)"""
+    directory = tempfile.mkdtemp(prefix="rename_bench_")
+    try:
+        for i in range(files):
+            open(os.path.join(directory, f"file_{i:07d}.txt"), 'w').close()
+
+        engine = RenameEngine(directory, ".txt", ".md", "replace",
+                              journal_dir=None, workers=workers)
+        engine.renamer_factory = lambda d: LatencyRenamer(d, latency)
+        start = time.perf_counter()
+        success_count, _ = engine.execute()
+        return time.perf_counter() - start, success_count
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发重命名基准测试")
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=5.0,
+                        help="每次 rename 模拟的延迟（毫秒）")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16, 32])
+    args = parser.parse_args()
+
+    print(f"{args.files} 个文件，每次 rename 延迟 {args.latency_ms} ms")
+    for workers in args.workers:
+        elapsed, success_count = run_once(
+            args.files, args.latency_ms / 1000, workers)
+        print(f"workers={workers:<3d} {elapsed:8.3f} s  "
+              f"{args.files / elapsed:10.0f} 文件/秒  成功 {success_count}")
+
+
+if __name__ == "__main__":
+    main()
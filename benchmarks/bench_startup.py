@@ -0,0 +1,108 @@
+"""启动时间基准测试和回归检查
+
+多次启动程序，测量从启动进程到主窗口第一次绘制的时间（图形界面通过
+RENAME_STARTUP_PROBE 环境变量在第一次绘制后输出标记并退出），以及
+命令行模式导入核心模块的时间，并检查命令行模式没有导入 PyQt6。
+中位数超过目标时以退出码 1 结束，可以放在 CI 中作为回归检查:
+
+    python benchmarks/bench_startup.py --runs 5 --target-ms 1500
+
+没有显示器时使用 Qt 的 offscreen 平台。测量打包后的程序时用 --command
+指定可执行文件，例如 --command "dist/文件重命名工具/文件重命名工具"。
+"""
+import os
+import sys
+import time
+import shlex
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_TARGET_MS = 1500  # 冷启动到第一次绘制的目标时间
+CLI_TARGET_MS = 300  # 命令行模式导入核心模块的目标时间
+PROBE_ENV = "RENAME_STARTUP_PROBE"  # 与 rename_gui.STARTUP_PROBE_ENV 相同
+PROBE_MARK = "first-paint"  # 与 rename_gui.STARTUP_PROBE_MARK 相同
+TIMEOUT = 60
+
+
+def measure_gui(command):
+    """启动一次图形界面，返回到第一次绘制的毫秒数"""
+    env = dict(os.environ)
+    env[PROBE_ENV] = "1"
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    start = time.perf_counter()
+    proc = subprocess.Popen(command, cwd=ROOT, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        for line in proc.stdout:
+            if line.strip() == PROBE_MARK:
+                return (time.perf_counter() - start) * 1000
+        raise RuntimeError(f"程序没有输出启动标记就退出了（退出码 {proc.wait()}）")
+    finally:
+        try:
+            proc.wait(timeout=TIMEOUT)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+# 在子进程中导入命令行模式用到的模块，输出是否导入了 PyQt6
+CLI_PROBE = ("import rename_files, rename_core, sys; "
+             "print(any(m.split('.')[0] == 'PyQt6' for m in sys.modules))")
+
+
+def measure_cli():
+    """启动一次命令行模式的导入，返回 (毫秒数, 是否导入了 PyQt6)"""
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", CLI_PROBE], cwd=ROOT,
+                            capture_output=True, text=True, check=True,
+                            timeout=TIMEOUT).stdout
+    return (time.perf_counter() - start) * 1000, output.strip() == "True"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动时间基准测试")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--target-ms", type=float, default=STARTUP_TARGET_MS,
+                        help=f"第一次绘制的中位数上限（默认 {STARTUP_TARGET_MS}）")
+    parser.add_argument("--cli-target-ms", type=float, default=CLI_TARGET_MS,
+                        help=f"命令行模式导入时间的中位数上限（默认 {CLI_TARGET_MS}）")
+    parser.add_argument("--command",
+                        help="启动图形界面的命令，默认用当前 Python 运行 rename_files.py")
+    parser.add_argument("--skip-gui", action="store_true",
+                        help="只测量命令行模式（没有安装 PyQt6 时）")
+    args = parser.parse_args()
+
+    failed = False
+
+    cli_times = []
+    for _ in range(args.runs):
+        elapsed, imported_qt = measure_cli()
+        cli_times.append(elapsed)
+        if imported_qt:
+            print("失败: 命令行模式导入了 PyQt6")
+            failed = True
+            break
+    cli_median = statistics.median(cli_times)
+    print(f"命令行导入   中位数 {cli_median:7.0f} ms  最小 {min(cli_times):7.0f} ms"
+          f"  目标 {args.cli_target_ms:.0f} ms")
+    if cli_median > args.cli_target_ms:
+        failed = True
+
+    if not args.skip_gui:
+        command = (shlex.split(args.command) if args.command
+                   else [sys.executable, os.path.join(ROOT, "rename_files.py")])
+        gui_times = [measure_gui(command) for _ in range(args.runs)]
+        gui_median = statistics.median(gui_times)
+        print(f"第一次绘制   中位数 {gui_median:7.0f} ms  最小 {min(gui_times):7.0f} ms"
+              f"  目标 {args.target_ms:.0f} ms")
+        if gui_median > args.target_ms:
+            failed = True
+
+    print("超过目标时间" if failed else "通过")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
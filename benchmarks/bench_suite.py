@@ -0,0 +1,312 @@
+"""端到端基准测试套件
+
+用 synthetic_tree 在 tmpfs 上生成合成文件夹（每种规模每次重复都重新生成），
+按 .txt -> .md 的规则分别计时各个阶段:
+
+    generate        生成合成文件夹（不计入比较）
+    listing         列目录并建立名称索引
+    planning        匹配规则、检查冲突并生成列式 RenamePlan（与 RenameWorker 相同的分批方式）
+    sort            按文件名排序
+    grouping        相似文件名分组
+    preview_gui     MainWindow 发起预览到表格显示完整结果（offscreen Qt，需要 PyQt6）
+    render          绘制整个窗口并滚动到预览表格末尾再绘制（需要 PyQt6）
+    execute         实际重命名（安装了 PyQt6 时运行 RenameWorker.run，否则直接调用引擎）
+    history_write   写入一条操作历史
+
+结果写入 JSON，带有当前提交，便于在不同提交之间比较:
+
+    python benchmarks/bench_suite.py --files 1000 10000 100000 --output before.json
+    python benchmarks/bench_suite.py --files 1000 10000 100000 --compare before.json
+
+历史记录写入临时数据库，重命名日志在测量后删除，不会影响正常使用的数据。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import rename_core  # noqa: E402
+import rename_journal  # noqa: E402
+from rename_history import HistoryStore  # noqa: E402
+from rename_plan import RenamePlan  # noqa: E402
+from synthetic_tree import make_tree, default_base_dir  # noqa: E402
+
+OLD_SUFFIX = ".txt"
+NEW_SUFFIX = ".md"
+FORMAT_VERSION = 1
+GUI_TIMEOUT = 600  # 等待界面预览完成的最长秒数
+
+
+class PhaseTimer:
+    """累计各阶段的耗时（秒）"""
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def load_qt():
+    """导入 PyQt6 和 rename_gui，返回 (QApplication, rename_gui)，没有安装时返回 None"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PyQt6.QtWidgets import QApplication
+        import rename_gui
+    except ImportError:
+        return None
+    app = QApplication.instance() or QApplication([])
+    return app, rename_gui
+
+
+def bench_engine(directory, timer, recursive):
+    """列目录、规划、排序和分组，与 RenameWorker 的预览使用相同的函数"""
+    cache = rename_core.SnapshotCache()
+    engine = rename_core.RenameEngine(directory, OLD_SUFFIX, NEW_SUFFIX, "replace",
+                                      snapshot_cache=cache, recursive=recursive,
+                                      journal_dir=None)
+    with timer.phase("listing"):
+        if recursive:
+            # 递归模式不使用快照缓存，之后的规划阶段会再遍历一次
+            listed = sum(len(names) for _, _, names in engine.iter_listing())
+        else:
+            listed = len(cache.get(directory).names)
+
+    with timer.phase("planning"):
+        plan = RenamePlan(engine.rules.rules, engine.show_new_name)
+        for chunk in engine.iter_plan_chunks():
+            plan.extend(chunk)
+    with timer.phase("sort"):
+        plan = plan.sorted()
+    with timer.phase("grouping"):
+        plan.set_groups(rename_core.group_similar_names(plan.iter_old_names()))
+    return listed, len(plan)
+
+
+def wait_until(app, condition):
+    """处理事件直到 condition() 为真"""
+    deadline = time.monotonic() + GUI_TIMEOUT
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("等待界面超时")
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def bench_gui(qt, directory, timer, recursive, expected_rows):
+    """通过 MainWindow 预览并绘制表格"""
+    app, rename_gui = qt
+    window = rename_gui.MainWindow()
+    window.resize(1200, 800)
+    window.show()
+    try:
+        # 等待启动时的后台读取完成，避免它和预览争用
+        wait_until(app, lambda: window.startup_worker is not None
+                   and window.startup_worker.isFinished())
+        window.path_input.setText(directory)
+        window.old_suffix_input.setText(OLD_SUFFIX)
+        window.new_suffix_input.setText(NEW_SUFFIX)
+        window.recursive_checkbox.setChecked(recursive)
+        window.preview_timer.stop()  # 不等防抖定时器，直接开始预览
+
+        with timer.phase("preview_gui"):
+            window.preview_changes(show_new_name=True)
+            worker = window.preview_worker
+            wait_until(app, lambda: worker.isFinished()
+                       and window.preview_model.rowCount() == expected_rows)
+            app.processEvents()
+
+        with timer.phase("render"):
+            window.grab()
+            window.preview_table.scrollToBottom()
+            window.preview_table.viewport().grab()
+    finally:
+        window.close()
+
+
+def bench_execute(qt, directory, timer, recursive):
+    """实际重命名并写入历史，返回 (成功数量, 文件总数)"""
+    if qt:
+        _, rename_gui = qt
+        worker = rename_gui.RenameWorker(directory, OLD_SUFFIX, NEW_SUFFIX, "replace",
+                                         recursive=recursive)
+        engine = worker.engine
+        run = worker.run  # 在当前线程中直接运行，计时不受线程调度影响
+    else:
+        engine = rename_core.RenameEngine(directory, OLD_SUFFIX, NEW_SUFFIX, "replace",
+                                          recursive=recursive)
+
+        def run():
+            success_count, total_files = engine.execute()
+            if total_files:
+                rename_core.save_history(engine.history_entry(success_count, total_files))
+
+    # history_write 单独计时，execute 不包含它
+    save_history = rename_core.save_history
+
+    def timed_save_history(entry):
+        with timer.phase("history_write"):
+            save_history(entry)
+
+    rename_core.save_history = timed_save_history
+    timer.phases["execute"] = 0.0
+    try:
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+    finally:
+        rename_core.save_history = save_history
+    timer.phases["execute"] = elapsed - timer.phases.get("history_write", 0.0)
+
+    if engine.run_id:
+        # 删除本次测量产生的重命名日志
+        path = rename_journal.journal_path(engine.run_id)
+        if os.path.exists(path):
+            os.remove(path)
+    return engine._success_count, engine._total_files
+
+
+def run_once(qt, files, args):
+    """生成一个合成文件夹并测量所有阶段，返回 (阶段耗时, 统计信息)"""
+    timer = PhaseTimer()
+    directory = tempfile.mkdtemp(prefix="rename_bench_", dir=args.base_dir)
+    try:
+        with timer.phase("generate"):
+            stats = make_tree(directory, files, args.seed, args.subdirs)
+        # 刚修改过的目录不会复用快照缓存，把修改时间调早，与预览已有文件夹时一致
+        mtime_ns = time.time_ns() - 60 * 10**9
+        os.utime(directory, ns=(mtime_ns, mtime_ns))
+        recursive = args.subdirs > 0
+        listed, planned = bench_engine(directory, timer, recursive)
+        if qt:
+            bench_gui(qt, directory, timer, recursive, planned)
+        success_count, total_files = bench_execute(qt, directory, timer, recursive)
+        stats.update(listed=listed, planned=planned,
+                     renamed=success_count, attempted=total_files)
+        return timer.phases, stats
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def git_revision():
+    """当前提交和工作区是否有未提交的修改，不在 git 仓库中时为 None"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    cwd=ROOT, check=True, capture_output=True,
+                                    text=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous_path):
+    """输出与之前结果相同规模的各阶段耗时变化"""
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = json.load(f)
+    old_runs = {run["files"]: run for run in previous.get("results", [])}
+    old_commit = (previous.get("git") or {}).get("commit", "?")[:10]
+    print(f"\n与 {previous_path}（{old_commit}）比较:")
+    for run in results:
+        old = old_runs.get(run["files"])
+        if old is None:
+            continue
+        print(f"  {run['files']} 个文件")
+        for phase, seconds in run["phases"].items():
+            before = old["phases"].get(phase)
+            if phase == "generate" or not before:
+                continue
+            change = (seconds - before) / before * 100
+            print(f"    {phase:<14s} {before:9.3f} s -> {seconds:9.3f} s  {change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端基准测试套件")
+    parser.add_argument("--files", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="每个合成文件夹的文件数，可以指定多个（最多到 1000000）")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="每种规模重复的次数，结果取各阶段的中位数")
+    parser.add_argument("--subdirs", type=int, default=0,
+                        help="把文件分散到多少个子文件夹中并使用递归模式，0 表示不递归")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--base-dir", default=default_base_dir(),
+                        help="在哪里生成合成文件夹（默认 tmpfs）")
+    parser.add_argument("--no-gui", action="store_true",
+                        help="不测量界面相关的阶段（没有安装 PyQt6 时自动跳过）")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", metavar="JSON", help="与之前的结果比较")
+    args = parser.parse_args()
+
+    qt = None if args.no_gui else load_qt()
+    if qt is None and not args.no_gui:
+        print("未安装 PyQt6，跳过 preview_gui 和 render 阶段")
+
+    # 历史记录写入临时数据库
+    history_dir = tempfile.mkdtemp(prefix="rename_bench_history_")
+    rename_core.HISTORY_STORE = HistoryStore(
+        os.path.join(history_dir, "history.db"), legacy_file=None)
+
+    results = []
+    try:
+        for files in args.files:
+            runs = [run_once(qt, files, args) for _ in range(args.repeat)]
+            names = list(runs[0][0])
+            phases = {name: statistics.median(r[0].get(name, 0.0) for r in runs)
+                      for name in names}
+            stats = runs[0][1]
+            results.append({
+                "files": files,
+                "stats": stats,
+                "phases": phases,
+                "files_per_second": {name: (stats["files"] / seconds if seconds else None)
+                                     for name, seconds in phases.items()},
+            })
+            print(f"{files} 个文件（实际 {stats['files']} 个，预览 {stats['planned']} 个，"
+                  f"重命名 {stats['renamed']}/{stats['attempted']}）")
+            for name, seconds in phases.items():
+                print(f"  {name:<14s} {seconds:9.3f} s  {stats['files'] / seconds if seconds else 0:12.0f} 文件/秒")
+    finally:
+        shutil.rmtree(history_dir, ignore_errors=True)
+
+    report = {
+        "format_version": FORMAT_VERSION,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "git": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "gui": qt is not None,
+        "base_dir": args.base_dir,
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "subdirs": args.subdirs,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""生成用于基准测试的合成文件夹
+
+文件名由固定的随机种子生成，同样的参数每次得到完全相同的目录:
+
+    - 多种后缀: .txt/.TXT（会被基准测试的规则处理）、.jpg、.pdf、.tar.gz、无后缀等
+    - 冲突: 一部分 .txt 文件旁边已有同名的 .md 文件
+    - 长文件名（约 200 个字符）和 Unicode 文件名（中文、带组合字符的拉丁字母、emoji）
+    - 共享前缀的文件名，相似分组有实际的组可分
+
+文件都是空文件，默认放在 tmpfs（/dev/shm）上，测量的是元数据操作而不是磁盘:
+
+    python benchmarks/synthetic_tree.py /dev/shm/rename_tree --files 100000
+"""
+import os
+import random
+import argparse
+import tempfile
+
+
+# (后缀, 权重)
+SUFFIXES = (
+    (".txt", 40), (".TXT", 5), (".jpg", 15), (".jpeg", 5), (".pdf", 10),
+    (".tar.gz", 5), (".md", 5), (".docx", 5), ("", 5), (".backup.txt", 5),
+)
+PREFIXES = ("IMG", "DSC", "report", "export", "报告", "照片", "scan", "data")
+UNICODE_PARTS = ("文件", "résumé", "café", "naïve", "데이터", "📷", "Ωμέγα", "файл")
+
+COLLISION_RATIO = 0.05  # .txt 文件中已有同名 .md 的比例
+LONG_NAME_RATIO = 0.05
+UNICODE_RATIO = 0.10
+LONG_NAME_LENGTH = 200
+
+
+def default_base_dir():
+    """优先使用 tmpfs，不存在时使用系统临时目录"""
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def iter_names(files, seed=0):
+    """按固定种子生成 files 个互不相同的文件名（冲突产生的 .md 文件另算）
+
+    产出 (文件名, 是否需要同时创建冲突文件)。
+    """
+    rng = random.Random(seed)
+    suffixes = [suffix for suffix, _ in SUFFIXES]
+    weights = [weight for _, weight in SUFFIXES]
+    for i in range(files):
+        prefix = rng.choice(PREFIXES)
+        roll = rng.random()
+        if roll < LONG_NAME_RATIO:
+            stem = f"{prefix}_{i:07d}_" + "x" * (LONG_NAME_LENGTH - len(prefix) - 9)
+        elif roll < LONG_NAME_RATIO + UNICODE_RATIO:
+            stem = f"{prefix}_{rng.choice(UNICODE_PARTS)}_{i:07d}"
+        else:
+            stem = f"{prefix}_{i:07d}"
+        suffix = rng.choices(suffixes, weights)[0]
+        collide = suffix.lower() == ".txt" and rng.random() < COLLISION_RATIO
+        yield stem + suffix, collide
+
+
+def make_tree(root, files, seed=0, subdirs=0):
+    """在 root 下创建合成文件，返回 {"files": 文件数, "collisions": 冲突数, "dirs": 文件夹数}
+
+    subdirs 大于 0 时把文件轮流放入这么多个子文件夹（用于递归模式）。
+    """
+    os.makedirs(root, exist_ok=True)
+    dirs = [root]
+    if subdirs:
+        dirs = [os.path.join(root, f"sub_{i:04d}") for i in range(subdirs)]
+        for path in dirs:
+            os.makedirs(path, exist_ok=True)
+
+    created = collisions = 0
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL
+    for i, (name, collide) in enumerate(iter_names(files, seed)):
+        directory = dirs[i % len(dirs)]
+        os.close(os.open(os.path.join(directory, name), flags))
+        created += 1
+        if collide:
+            stem = name[:-len(".txt")]
+            os.close(os.open(os.path.join(directory, stem + ".md"), flags))
+            collisions += 1
+    return {"files": created + collisions, "collisions": collisions,
+            "dirs": len(dirs) + (1 if subdirs else 0)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成用于基准测试的合成文件夹")
+    parser.add_argument("root", nargs="?",
+                        help=f"目标文件夹（默认在 {default_base_dir()} 下新建）")
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--subdirs", type=int, default=0,
+                        help="把文件分散到多少个子文件夹中，0 表示都放在根目录")
+    args = parser.parse_args()
+
+    root = args.root or tempfile.mkdtemp(prefix="rename_tree_", dir=default_base_dir())
+    stats = make_tree(root, args.files, args.seed, args.subdirs)
+    print(f"{root}: {stats['files']} 个文件（其中冲突 {stats['collisions']} 个），"
+          f"{stats['dirs']} 个文件夹")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1519 @@
+"""文件后缀处理核心逻辑
+
+本模块只依赖标准库，不会导入 PyQt6，命令行模式和图形界面共用这里的
+预览与重命名逻辑。
+"""
+import os
+import sys
+import stat
+import json
+import time
+import queue
+import shutil
+import logging
+import threading
+import bisect
+from collections import OrderedDict, deque
+from contextlib import closing
+from concurrent.futures import (ThreadPoolExecutor, FIRST_COMPLETED, wait,
+                                as_completed)
+from logging.handlers import RotatingFileHandler
+
+import rename_journal
+import rename_trace
+from rename_fs import DirectoryRenamer
+from rename_walk import NameFilter, TreeWalker, WALK_WORKERS
+from rename_plan import (RenamePlan, PlanWriter, read_plan_header, iter_plan_file,
+                         CODE_READY, CODE_EXISTS, CODE_WAITING, CODE_RENAME,
+                         CODE_OVERWRITE, ACTIONABLE_CODES, STATUS_TEXTS)
+from rename_history import HistoryStore
+import rename_metrics
+from rename_metrics import RunMetrics
+from datetime import datetime
+
+
+LOG_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "logs", "rename.log")
+LOG_MAX_BYTES = 10 * 1024 * 1024  # 单个日志文件大小上限
+LOG_BACKUP_COUNT = 5  # 保留的旧日志文件数量
+
+HISTORY_STORE = HistoryStore()
+
+PREVIEW_BATCH_SIZE = 2000  # 预览分批发送给界面的行数
+MTIME_GRANULARITY_NS = 2 * 10**9  # 常见文件系统中最粗的修改时间精度（FAT）
+PIPELINE_BATCH_SIZE = 1000  # 实际处理时列目录阶段每批传递的文件名数
+PIPELINE_QUEUE_SIZE = 4  # 列目录阶段和规划阶段之间最多缓存的批数
+
+# 备份方式
+BACKUP_MANIFEST = "manifest"  # 只记录将被重命名的文件名
+BACKUP_HARDLINK = "hardlink"  # 将匹配的文件硬链接（或 reflink）到备份目录
+BACKUP_COPY = "copy"  # 完整复制整个目录
+BACKUP_MODES = (BACKUP_MANIFEST, BACKUP_HARDLINK, BACKUP_COPY)
+
+# 目标文件名已存在时的处理方式
+COLLISION_SKIP = "skip"  # 跳过该文件
+COLLISION_NUMBER = "number"  # 改用 "名称 (1).后缀" 这样的编号名称
+COLLISION_TIMESTAMP = "timestamp"  # 在名称后加上原文件的修改时间
+COLLISION_OVERWRITE_OLDER = "overwrite-older"  # 已存在的文件比原文件旧时覆盖它，否则跳过
+COLLISION_STRATEGIES = (COLLISION_SKIP, COLLISION_NUMBER, COLLISION_TIMESTAMP,
+                        COLLISION_OVERWRITE_OLDER)
+
+FICLONE = 0x40049409  # Linux 上 reflink 克隆文件的 ioctl 请求号
+
+
+def normalize_suffix(suffix):
+    """去除空白，并确保非空后缀以点号开头"""
+    suffix = suffix.strip()
+    if suffix and not suffix.startswith('.'):
+        suffix = '.' + suffix
+    return suffix
+
+
+class SuffixRule:
+    """一条后缀规则，new_suffix 为空表示移除原后缀
+
+    exact 为 True 时按原样使用两个后缀，不做规范化。按内容匹配时原后缀
+    取自文件名本身，没有后缀的文件原后缀为空。
+    """
+
+    def __init__(self, old_suffix, new_suffix="", exact=False):
+        if exact:
+            self.old_suffix = old_suffix
+            self.new_suffix = new_suffix
+            return
+        self.old_suffix = normalize_suffix(old_suffix)
+        self.new_suffix = normalize_suffix(new_suffix)
+        if not self.old_suffix:
+            raise ValueError("原后缀不能为空")
+
+    def apply(self, file):
+        return file[:len(file) - len(self.old_suffix)] + self.new_suffix
+
+
+class RuleSet:
+    """编译后的多条后缀规则
+
+    以小写原后缀为键建立字典，并记录所有原后缀的长度；匹配时从最长的
+    长度开始取文件名末尾查字典，因此多条规则都能匹配时最长的后缀优先，
+    每个文件只需查找"不同后缀长度"次。
+    """
+
+    stat_count = 0  # 匹配时调用 stat 的次数，按后缀匹配不访问文件系统
+
+    def __init__(self, rules):
+        self.rules = []
+        self._lookup = {}
+        for rule in rules:
+            if not isinstance(rule, SuffixRule):
+                rule = SuffixRule(*rule)
+            key = rule.old_suffix.lower()
+            if key in self._lookup:
+                raise ValueError(f"原后缀重复: {rule.old_suffix}")
+            self._lookup[key] = len(self.rules)
+            self.rules.append(rule)
+        self._lengths = sorted({len(key) for key in self._lookup}, reverse=True)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def match_id(self, file):
+        """返回匹配的规则在 rules 中的序号，没有匹配时返回 None"""
+        lower = file.lower()
+        for length in self._lengths:
+            rule_id = self._lookup.get(lower[-length:])
+            if rule_id is not None:
+                return rule_id
+        return None
+
+    def match(self, file):
+        """返回匹配的规则，没有匹配时返回 None"""
+        rule_id = self.match_id(file)
+        return None if rule_id is None else self.rules[rule_id]
+
+    def prefetch(self, names):
+        """按后缀匹配不需要预先读取文件，保留与 ContentRules 相同的接口"""
+
+    def as_pairs(self):
+        return [[rule.old_suffix, rule.new_suffix] for rule in self.rules]
+
+
+def load_rules(path):
+    """从规则文件读取后缀规则
+
+    每行一条规则: "原后缀 新后缀"，只写原后缀表示移除；
+    也可以写作 "原后缀 -> 新后缀"。空行和 # 开头的行会被忽略。
+    """
+    rules = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            old, arrow, new = line.partition('->')
+            parts = old.split() + new.split()
+            # 使用 "->" 时箭头左边必须正好是一个原后缀
+            if len(parts) > 2 or (arrow and len(old.split()) != 1):
+                raise ValueError(f"规则文件第 {line_no} 行格式错误: {line}")
+            rules.append((parts[0], parts[1] if len(parts) == 2 else ""))
+    return rules
+
+
+def scan_directory(directory):
+    """用一次 os.scandir 列出目录下的所有名称"""
+    with os.scandir(directory) as entries:
+        return [entry.name for entry in entries]
+
+
+def iter_scandir(directory, batch_size=PIPELINE_BATCH_SIZE):
+    """边读取目录边分批产出名称，不在内存中保留完整列表"""
+    batch = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            batch.append(entry.name)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def similar_prefix(name, prefix_length=3):
+    """相似分组使用的前缀: 去掉后缀后的前 prefix_length 个字符，过短时返回 None"""
+    stem = os.path.splitext(os.path.basename(name))[0].lower()
+    return stem[:prefix_length] if len(stem) >= prefix_length else None
+
+
+def group_similar_names(names, prefix_length=3):
+    """为相似文件名分组，返回每个名称的组号列表
+
+    去掉后缀后前 prefix_length 个字符相同（不区分大小写）的文件视为相似。
+    按名称首次出现的顺序给成员多于一个的组编号，其余为 None。
+    只需一次遍历和一个以前缀为键的字典，复杂度为 O(N)。
+    """
+    first_seen = {}  # 前缀 -> 该前缀组在 members 中的位置
+    members = []  # 每个组的成员下标
+    for i, name in enumerate(names):
+        prefix = similar_prefix(name, prefix_length)
+        if prefix is None:
+            # 过短的名称不会与任何名称相似
+            members.append([i])
+            continue
+        group = first_seen.get(prefix)
+        if group is None:
+            first_seen[prefix] = len(members)
+            members.append([i])
+        else:
+            members[group].append(i)
+
+    # names 可以是生成器，总数由各组成员数相加得到
+    groups = [None] * sum(len(indices) for indices in members)
+    color_index = 0
+    for indices in members:
+        if len(indices) > 1:
+            for idx in indices:
+                groups[idx] = color_index
+            color_index += 1
+    return groups
+
+
+def merge_preview_diff(plan, chunk, removed, recheck, next_group):
+    """把 RenameEngine.diff_preview 的结果合并到已排序并分组的预览计划中
+
+    返回 (新计划, 下一个可用的组号)。删除和新增的行一次性合并，各列只
+    重建一次。删除后组内只剩一行时取消它的分组；新增的行与前后前缀相同
+    的行归为一组，计划按文件名排序，前缀相同的行相邻，只需检查相邻的行。
+    recheck 为 [(原文件名, 新状态码)]。
+    """
+    removed_rows = set()
+    for name in removed:
+        start, end = plan.find(name.lower())
+        for row in range(start, end):
+            if plan.old_name(row) == name:
+                removed_rows.add(row)
+                break
+
+    # 在原计划上找出删除后只剩一行的组
+    ungroup = []
+    for row in removed_rows:
+        group = plan.groups[row]
+        if group < 0:
+            continue
+        members = []
+        for step, neighbor in ((-1, row - 1), (1, row + 1)):
+            while 0 <= neighbor < len(plan) and plan.groups[neighbor] == group and len(members) < 2:
+                if neighbor not in removed_rows:
+                    members.append(neighbor)
+                neighbor += step
+        if len(members) == 1:
+            ungroup.append(members[0])
+
+    merged, inserted = plan.merged(removed_rows, chunk)
+    removed_sorted = sorted(removed_rows)
+    for row in ungroup:
+        # 原行号减去排在它前面的删除行数，再加上排在它前面的新增行数
+        new_row = row - bisect.bisect_left(removed_sorted, row)
+        for inserted_row in inserted:
+            if inserted_row > new_row:
+                break
+            new_row += 1
+        merged.groups[new_row] = -1
+
+    # 连续的新增行与两端前缀相同的行归为一组。原有的同前缀行已在同一组中，
+    # 每个方向遇到第一个原有行即可停止
+    is_inserted = set(inserted)
+    done = set()
+    for row in inserted:
+        if row in done:
+            continue
+        prefix = similar_prefix(merged.old_name(row))
+        if prefix is None:
+            continue
+        block = [row]
+        group = -1
+        for step in (-1, 1):
+            neighbor = row + step
+            while 0 <= neighbor < len(merged) and similar_prefix(merged.old_name(neighbor)) == prefix:
+                block.append(neighbor)
+                if neighbor not in is_inserted:
+                    group = max(group, merged.groups[neighbor])
+                    break
+                neighbor += step
+        done.update(block)
+        if len(block) > 1:
+            if group < 0:
+                group = next_group
+                next_group += 1
+            for member in block:
+                merged.groups[member] = group
+
+    for file, code in recheck:
+        start, end = merged.find(file.lower())
+        for row in range(start, end):
+            if merged.old_name(row) == file:
+                merged.codes[row] = code
+    return merged, next_group
+
+
+class NameIndex:
+    """目录名称的内存索引，用于判断目标文件是否已存在
+
+    macOS 和 Windows 的文件系统默认不区分大小写，此时按 casefold 后的
+    名称比较，与 os.path.exists 的结果保持一致。
+    """
+
+    def __init__(self, names=(), case_insensitive=None):
+        if case_insensitive is None:
+            case_insensitive = sys.platform in ("darwin", "win32")
+        self.case_insensitive = case_insensitive
+        self._names = {self._key(name) for name in names}
+
+    def _key(self, name):
+        return name.casefold() if self.case_insensitive else name
+
+    def __contains__(self, name):
+        return self._key(name) in self._names
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, name):
+        self._names.add(self._key(name))
+
+    def update(self, names):
+        self._names.update(self._key(name) for name in names)
+
+    def discard(self, name):
+        self._names.discard(self._key(name))
+
+    def move(self, old_name, new_name):
+        """重命名成功后更新索引"""
+        self.discard(old_name)
+        self.add(new_name)
+
+
+class NameAllocator:
+    """根据目录列表为重名的文件分配空闲名称
+
+    每个文件夹第一次需要分配名称时列一次目录建立 NameIndex，之后判断名称
+    是否被占用以及分配 "名称 (n).后缀" 都只查内存，不会在文件系统上循环
+    试探。每个基础名称记录下一个待尝试的编号，编号只增不减，因此同名文件
+    再多，平均每次分配也只需查找常数次。名称可以是相对于 directory 的路径。
+    列目录失败时抛出 OSError，不会把无法读取的文件夹当作空文件夹。
+    """
+
+    def __init__(self, directory, case_insensitive=None):
+        self.directory = directory
+        self.case_insensitive = case_insensitive  # None 表示按平台判断
+        self._indexes = {}  # 文件夹相对路径 -> NameIndex
+        self._next_numbers = {}  # 基础名称 -> 下一个待尝试的编号
+
+    def _index(self, name, create=True):
+        """名称所在文件夹的索引；create 为 False 时不列目录，尚未列过时返回 None"""
+        rel_dir = os.path.dirname(name)
+        index = self._indexes.get(rel_dir)
+        if index is None and create:
+            path = os.path.join(self.directory, rel_dir) if rel_dir else self.directory
+            index = self._indexes[rel_dir] = NameIndex(os.listdir(path), self.case_insensitive)
+        return index
+
+    @property
+    def dirs_listed(self):
+        """已经列过目录的文件夹数"""
+        return len(self._indexes)
+
+    def __contains__(self, name):
+        return os.path.basename(name) in self._index(name)
+
+    def known_taken(self, name):
+        """名称是否在已经列过的文件夹中被占用，不会为此列目录"""
+        index = self._index(name, create=False)
+        return index is not None and os.path.basename(name) in index
+
+    def add(self, name):
+        """记录名称已被占用；文件夹尚未列过时不需要记录，之后列目录会包含它"""
+        index = self._index(name, create=False)
+        if index is not None:
+            index.add(os.path.basename(name))
+
+    def discard(self, name):
+        index = self._index(name, create=False)
+        if index is not None:
+            index.discard(os.path.basename(name))
+
+    def allocate(self, name):
+        """返回第一个空闲的 "名称 (n).后缀" 并占用它"""
+        index = self._index(name)
+        stem, suffix = os.path.splitext(name)
+        key = name.casefold() if index.case_insensitive else name
+        number = self._next_numbers.get(key, 1)
+        while True:
+            candidate = f"{stem} ({number}){suffix}"
+            number += 1
+            if os.path.basename(candidate) not in index:
+                break
+        self._next_numbers[key] = number
+        index.add(os.path.basename(candidate))
+        return candidate
+
+
+class DirectorySnapshot:
+    """某一时刻的目录列表及其名称索引
+
+    stat_key 为列目录前目录的 (修改时间, 大小, inode)；trusted 表示列目录时
+    距目录的修改时间已超过时间戳粒度，之后的任何变化都会改变修改时间。
+    """
+
+    def __init__(self, directory, mtime_ns, names, stat_key=None, trusted=False):
+        self.directory = directory
+        self.mtime_ns = mtime_ns
+        self.names = names
+        self.index = NameIndex(names)
+        self.stat_key = stat_key
+        self.trusted = trusted
+
+
+class SnapshotCache:
+    """按目录路径缓存目录列表，按最近使用淘汰
+
+    目录内增删或重命名文件会改变目录的修改时间，缓存随之失效；
+    只修改后缀或处理方式时可以直接复用缓存，无需重新列目录。
+    修改时间精度较粗的文件系统（FAT 为 2 秒，部分网络共享为 1 秒）上，
+    同一时间粒度内的两次变化修改时间相同，因此目录在列目录前不久刚被修改
+    时不复用这次的列表；同时比较大小和 inode，目录被整个替换时也会失效。
+    缓存只用于预览，实际处理总是重新列目录。
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, directory):
+        """返回目录的最新快照，必要时重新扫描"""
+        st = os.stat(directory)
+        stat_key = (st.st_mtime_ns, st.st_size, st.st_ino)
+        with self._lock:
+            snapshot = self._snapshots.get(directory)
+            if snapshot is not None and snapshot.trusted and snapshot.stat_key == stat_key:
+                self._snapshots.move_to_end(directory)
+                return snapshot
+
+        with rename_trace.span("listing.scan") as span:
+            trusted = time.time_ns() - st.st_mtime_ns >= MTIME_GRANULARITY_NS
+            snapshot = DirectorySnapshot(
+                directory, st.st_mtime_ns, scan_directory(directory), stat_key, trusted)
+            span["names"] = len(snapshot.names)
+        with self._lock:
+            self._snapshots[directory] = snapshot
+            self._snapshots.move_to_end(directory)
+            while len(self._snapshots) > self.max_entries:
+                self._snapshots.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, directory):
+        """丢弃目录的缓存，例如在重命名之后"""
+        with self._lock:
+            self._snapshots.pop(directory, None)
+
+
+def backup_path(directory):
+    """生成备份路径: <目录>_backup_<时间>"""
+    return (os.path.normpath(directory) + "_backup_"
+            + datetime.now().strftime("%Y%m%d_%H%M%S"))
+
+
+def reflink_file(src, dst):
+    """尝试用 reflink 克隆文件（只复制元数据），不支持时返回 False"""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+        return True
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+
+def link_or_copy(src, dst):
+    """依次尝试硬链接、reflink，都不支持时才复制文件内容"""
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    if not reflink_file(src, dst):
+        shutil.copy2(src, dst)
+
+
+class BackupWriter:
+    """边处理边备份
+
+    创建时准备备份位置（完整复制模式在此时复制整个目录），之后在每个
+    文件重命名之前调用 add()，因此不需要预先知道全部文件。清单模式
+    写入 JSON Lines 文件，与重命名日志一样只追加写入:
+
+        {"directory": ..., "timestamp": ...}
+        {"old": "a.txt", "new": "a.md"}
+
+    每条记录在重命名之前写入操作系统，fsync 按批进行，处理中途崩溃时
+    清单仍然可读，最多缺少最后一行。
+    """
+
+    def __init__(self, directory, mode, fsync_interval=rename_journal.FSYNC_INTERVAL):
+        if mode not in BACKUP_MODES:
+            raise ValueError(f"未知的备份方式: {mode}")
+        self.directory = directory
+        self.mode = mode
+        self.path = backup_path(directory)
+        self.fsync_interval = fsync_interval
+        self._manifest = None
+        self._unsynced = 0
+        if mode == BACKUP_MANIFEST:
+            self.path += ".jsonl"
+            self._manifest = open(self.path, 'w', encoding='utf-8')
+            self._write({
+                "directory": directory,
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            })
+        elif mode == BACKUP_HARDLINK:
+            os.makedirs(self.path)
+        else:
+            shutil.copytree(directory, self.path)
+
+    def _write(self, record):
+        self._manifest.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_interval:
+            self._sync()
+        else:
+            self._manifest.flush()
+
+    def _sync(self):
+        self._manifest.flush()
+        os.fsync(self._manifest.fileno())
+        self._unsynced = 0
+
+    def add(self, old, new):
+        """在重命名 old 之前备份它
+
+        重名后另选名称重试时会对同一文件再次调用: 清单中以最后一条为准，
+        硬链接备份已经存在时不再重复创建。
+        """
+        if self.mode == BACKUP_MANIFEST:
+            self._write({"old": old, "new": new})
+        elif self.mode == BACKUP_HARDLINK:
+            src = os.path.join(self.directory, old)
+            dst = os.path.join(self.path, old)
+            # 递归模式下文件名是相对路径
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if os.path.lexists(dst):
+                pass
+            elif os.path.isdir(src):
+                shutil.copytree(src, dst, copy_function=link_or_copy)
+            else:
+                link_or_copy(src, dst)
+
+    def close(self):
+        if self._manifest is not None:
+            self._sync()
+            self._manifest.close()
+            self._manifest = None
+
+
+_file_logger = None
+
+
+def get_file_logger():
+    """返回写入滚动日志文件的 logger，首次调用时创建"""
+    global _file_logger
+    if _file_logger is None:
+        logger = logging.getLogger("rename_files")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        try:
+            os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+            handler = RotatingFileHandler(
+                LOG_FILE, maxBytes=LOG_MAX_BYTES,
+                backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+            handler.setFormatter(logging.Formatter(
+                "%(asctime)s %(message)s"))
+            logger.addHandler(handler)
+        except OSError as e:
+            print(f"无法创建日志文件: {str(e)}")
+            logger.addHandler(logging.NullHandler())
+        _file_logger = logger
+    return _file_logger
+
+
+class LogSink:
+    """线程安全的日志缓冲区
+
+    工作线程调用 write() 写入日志，界面按固定频率调用 drain() 批量取出。
+    缓冲区是一个环形队列，界面来不及显示时丢弃最旧的行；完整日志同时
+    写入滚动日志文件。
+    """
+
+    def __init__(self, max_lines=5000, to_file=True):
+        self._pending = deque(maxlen=max_lines)
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._logger = get_file_logger() if to_file else None
+
+    def write(self, message):
+        with self._lock:
+            if len(self._pending) == self._pending.maxlen:
+                self._dropped += 1
+            self._pending.append(message)
+        if self._logger:
+            self._logger.info(message)
+
+    def drain(self):
+        """取出所有待显示的日志，返回 (日志行列表, 被丢弃的行数)"""
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+            dropped, self._dropped = self._dropped, 0
+        return lines, dropped
+
+
+class RenameEngine:
+    """后缀处理引擎
+
+    预览和实际处理都通过回调汇报进度，调用方可以把回调接到 Qt 信号、
+    命令行输出或其他地方。将 is_running 置为 False 可以中途停止；因备份
+    失败等错误中止时同样会把 is_running 置为 False，并在 abort_reason 中
+    记录原因，调用方据此区分用户停止和出错中止。
+    """
+
+    def __init__(self, directory, old_suffix, new_suffix, operation_mode, show_new_name=True,
+                 rules=None, snapshot_cache=None, backup_mode=None,
+                 journal_dir=rename_journal.JOURNAL_DIR, workers=1,
+                 recursive=False, name_filter=None, walk_workers=WALK_WORKERS,
+                 collision=COLLISION_SKIP):
+        self.directory = directory
+        if operation_mode == "sniff":
+            # 按内容匹配时原后缀是可选的筛选条件，可以是分号分隔的多个后缀
+            self.old_suffix = old_suffix.strip()
+        else:
+            self.old_suffix = normalize_suffix(old_suffix)
+        if operation_mode == "replace":
+            self.new_suffix = normalize_suffix(new_suffix)
+        else:
+            self.new_suffix = new_suffix.strip()
+        self.operation_mode = operation_mode
+        self.show_new_name = show_new_name
+        # "rules" 模式使用给定的多条规则，"sniff" 模式使用按文件内容推断后缀的
+        # rename_sniff.ContentRules，否则由原后缀和新后缀组成一条规则
+        if operation_mode == "rules":
+            self.rules = rules if isinstance(rules, RuleSet) else RuleSet(rules or [])
+        elif operation_mode == "sniff":
+            # 从计划文件恢复时没有 ContentRules，此时只按计划中的文件名执行
+            self.rules = rules if rules is not None else RuleSet([])
+        else:
+            self.rules = RuleSet([(self.old_suffix, self.new_suffix if operation_mode == "replace" else "")])
+        self.is_running = True
+        self.abort_reason = None  # 出错中止处理的原因，用户停止时为 None
+        self.names = None  # 目录名称索引，list_targets 时建立
+        self.snapshot_cache = snapshot_cache  # 预览时复用的目录缓存
+        self.snapshot = None  # 预览时使用的目录快照，用于之后的增量更新
+        self.backup_mode = backup_mode  # 处理前的备份方式，None 表示不备份
+        self.journal_dir = journal_dir  # 重命名日志目录，None 表示不记录
+        self.run_id = None  # 本次处理的编号，写入日志和历史记录
+        self.workers = max(1, workers)  # 并发重命名的线程数，1 表示逐个处理
+        # 递归模式下处理所有子文件夹中的文件（不重命名文件夹本身），
+        # 文件名使用相对于 directory 的路径
+        self.recursive = recursive
+        self.name_filter = name_filter or NameFilter()
+        self.walk_workers = walk_workers
+        self.plan_file = None  # 设置后按计划文件执行，见 from_plan_file
+        if collision not in COLLISION_STRATEGIES:
+            raise ValueError(f"未知的重名处理方式: {collision}")
+        self.collision = collision  # 目标文件名已存在时的处理方式
+        self._allocator = None  # 非跳过策略下第一次遇到重名时创建的 NameAllocator
+        self.metrics = None  # 最近一次处理的 RunMetrics，写入历史记录
+        # 创建目录重命名器的工厂，基准测试时可替换为模拟延迟的版本
+        self.renamer_factory = DirectoryRenamer
+        self._renamer = None
+        self._success_count = 0
+        self._total_files = 0
+        self._journal = None
+        self._backup = None
+        self._run_opened = False
+        self._listed_total = None  # 列目录结束后匹配的文件总数，用于汇报进度
+
+        # 回调函数，未设置时忽略
+        self.on_progress = None  # on_progress(message)
+        self.on_progress_value = None  # on_progress_value(percent)，-1 表示总数未知
+        self._last_percent = None
+
+    @classmethod
+    def from_plan_file(cls, path, directory=None, **kwargs):
+        """根据计划文件创建引擎，directory 为 None 时使用计划中记录的文件夹
+
+        规则和筛选条件从计划文件恢复，只用于日志和历史记录；执行时
+        逐行读取计划中的重命名，不会重新列目录。
+        """
+        header = read_plan_header(path)
+        params = header["params"]
+        operation_mode = params["operation"]
+        kwargs.setdefault("collision", params.get("collision", COLLISION_SKIP))
+        engine = cls(directory or header["directory"],
+                     params["old_suffix"], params["new_suffix"], operation_mode,
+                     rules=params["rules"] if operation_mode == "rules" else None,
+                     recursive=params.get("recursive", False),
+                     name_filter=NameFilter(params.get("include", ()),
+                                            params.get("exclude", ())),
+                     **kwargs)
+        engine.plan_file = path
+        return engine
+
+    def stop(self):
+        """请求停止处理"""
+        self.is_running = False
+
+    def _abort(self, reason):
+        """因错误中止处理，与用户停止不同，调用方仍应结束并保存历史记录"""
+        self._report(reason)
+        self.abort_reason = reason
+        self.is_running = False
+
+    def _report(self, message):
+        if self.on_progress:
+            self.on_progress(message)
+
+    def _report_value(self, value):
+        # 只在百分比变化时汇报，避免每个文件都发送一次
+        if self.on_progress_value and value != self._last_percent:
+            self._last_percent = value
+            self.on_progress_value(value)
+
+    def iter_listing(self, use_cache=False):
+        """逐批产出 (文件夹相对路径, 修改时间, 名称列表)，同时建立目录名称索引
+
+        非递归模式只有一批；递归模式每扫描完一个文件夹产出一批该文件夹
+        中的文件（相对路径），此时该文件夹的名称已全部加入索引。修改时间
+        在列目录之前读取，写入计划文件用于执行前的校验。
+        use_cache 为 True 且设置了 snapshot_cache 时复用缓存的目录列表，
+        此时名称索引与缓存共享，不能修改。递归模式不使用缓存。
+        """
+        if self.recursive:
+            yield from self._iter_tree()
+        elif use_cache and self.snapshot_cache is not None:
+            snapshot = self.snapshot_cache.get(self.directory)
+            self.snapshot = snapshot
+            self.names = snapshot.index
+            yield "", snapshot.mtime_ns, snapshot.names
+        else:
+            with rename_trace.span("listing.scan") as span:
+                mtime_ns = os.stat(self.directory).st_mtime_ns
+                all_names = scan_directory(self.directory)
+                self.names = NameIndex(all_names)
+                span["names"] = len(all_names)
+            yield "", mtime_ns, all_names
+
+    def _iter_tree(self, index=True, metrics=None):
+        """并行遍历目录树，定期汇报扫描速度
+
+        index 为 False 时不把扫描到的名称加入索引。设置了 metrics 时
+        记录列目录的系统调用次数和无法读取的文件夹。
+        """
+        if index:
+            self.names = NameIndex()
+
+        def on_error(rel_dir, e):
+            if metrics is not None:
+                metrics.error(e)
+            self._report(f"警告: 无法读取文件夹 '{rel_dir}': {str(e)}")
+
+        walker = TreeWalker(
+            self.directory, self.name_filter, self.walk_workers,
+            should_continue=lambda: self.is_running, on_error=on_error)
+        try:
+            yield from self._walk_tree(walker, index)
+        finally:
+            if metrics is not None:
+                # 每个文件夹一次 stat（修改时间）和一次 scandir
+                metrics.count("stat", walker.dirs_scanned)
+                metrics.count("scandir", walker.dirs_scanned)
+
+    def _walk_tree(self, walker, index):
+        """_iter_tree 的遍历部分"""
+        last_report = time.monotonic()
+        for rel_dir, mtime_ns, names, dir_names in walker.walk():
+            if rel_dir:
+                paths = [os.path.join(rel_dir, name) for name in names]
+                files = [os.path.join(rel_dir, name) for name in names
+                         if name not in dir_names]
+            else:
+                paths = names
+                files = [name for name in names if name not in dir_names]
+            if index:
+                self.names.update(paths)
+            yield rel_dir, mtime_ns, files
+
+            now = time.monotonic()
+            if now - last_report >= 1.0:
+                last_report = now
+                self._report(f"已扫描 {walker.dirs_scanned} 个文件夹"
+                             f"（{walker.dirs_per_second:.0f} 个/秒）")
+        if self.is_running:
+            self._report(f"扫描完成: {walker.dirs_scanned} 个文件夹, "
+                         f"{walker.entries_scanned} 个条目"
+                         f"（{walker.dirs_per_second:.0f} 个文件夹/秒）")
+
+    def is_target(self, name):
+        """名称是否匹配筛选条件和规则"""
+        # 先检查筛选条件，按内容匹配时被排除的文件不需要读取
+        if self.name_filter and not self.name_filter.accepts_file(name):
+            return False
+        return self.rules.match(name) is not None
+
+    def _prefetch(self, names):
+        """让规则集预先处理一批通过筛选的名称（按内容匹配时并行读取文件头）"""
+        if self.name_filter:
+            names = [name for name in names if self.name_filter.accepts_file(name)]
+        self.rules.prefetch(names)
+
+    def list_targets(self, use_cache=False):
+        """获取所有匹配的文件，同时建立目录名称索引"""
+        targets = []
+        for _, _, names in self.iter_listing(use_cache):
+            self._prefetch(names)
+            targets.extend(f for f in names if self.is_target(f))
+        return targets
+
+    def target_exists(self, new_name, names=None):
+        """目标文件名是否已被占用，names 默认为当前的目录名称索引"""
+        if names is None:
+            names = self.names
+        return not new_name or new_name in names
+
+    def target_code(self, file, new_name, names=None):
+        """预览中把 file 重命名为 new_name 的状态码"""
+        if new_name and not self.target_exists(new_name, names):
+            return CODE_READY
+        if not new_name or self.collision == COLLISION_SKIP:
+            return CODE_EXISTS
+        if self.collision == COLLISION_OVERWRITE_OLDER:
+            return CODE_OVERWRITE if self._target_is_older(file, new_name) else CODE_EXISTS
+        return CODE_RENAME
+
+    def _target_is_older(self, file, new_name):
+        """已存在的目标是普通文件且修改时间早于原文件"""
+        try:
+            source = os.stat(os.path.join(self.directory, file))
+            target = os.stat(os.path.join(self.directory, new_name))
+        except OSError:
+            return False
+        return stat.S_ISREG(target.st_mode) and target.st_mtime_ns < source.st_mtime_ns
+
+    def new_name_for(self, file):
+        """计算文件处理后的新文件名"""
+        return self.rules.match(file).apply(file)
+
+    def _iter_planned(self):
+        """逐个生成 (原文件名, 规则序号, 状态码, (文件夹相对路径, 修改时间))，
+        被停止时提前结束
+
+        递归模式下每个文件夹扫描完成后立即生成该文件夹的结果。
+        """
+        for rel_dir, mtime_ns, names in self.iter_listing(use_cache=True):
+            listing = rel_dir, mtime_ns
+            self._prefetch(names)
+            for file in names:
+                if not self.is_running:
+                    return
+                rule_id = self.rules.match_id(file)
+                if rule_id is None:
+                    continue
+                if self.name_filter and not self.name_filter.accepts_file(file):
+                    continue
+
+                if not self.show_new_name:
+                    # 只显示原文件名，新文件名留空
+                    yield file, rule_id, CODE_WAITING, listing
+                else:
+                    new_name = self.rules.rules[rule_id].apply(file)
+                    yield file, rule_id, self.target_code(file, new_name), listing
+
+    def iter_preview(self):
+        """逐个生成预览行 (原文件名, 新文件名, 状态)，被停止时提前结束"""
+        for file, rule_id, code, _ in self._iter_planned():
+            new_name = self.rules.rules[rule_id].apply(file) if self.show_new_name else ""
+            yield file, new_name, STATUS_TEXTS[code]
+
+    def iter_plan_chunks(self, batch_size=PREVIEW_BATCH_SIZE):
+        """按批生成预览结果，每批是一个最多 batch_size 行的 RenamePlan"""
+        chunk = RenamePlan(self.rules.rules, self.show_new_name)
+        for file, rule_id, code, (rel_dir, mtime_ns) in self._iter_planned():
+            chunk.add(file, rule_id, code)
+            chunk.dir_mtimes[rel_dir] = mtime_ns
+            if len(chunk) >= batch_size:
+                yield chunk
+                chunk = RenamePlan(self.rules.rules, self.show_new_name)
+        if len(chunk) and self.is_running:
+            yield chunk
+
+    def preview(self):
+        """生成预览数据
+
+        返回未排序的 RenamePlan；被停止时返回 None。
+        """
+        plan = RenamePlan(self.rules.rules, self.show_new_name)
+        for chunk in self.iter_plan_chunks():
+            plan.extend(chunk)
+        return plan if self.is_running else None
+
+    def diff_preview(self, old_snapshot, new_snapshot):
+        """比较同一目录的两个快照，返回预览的增量更新
+
+        返回 (已排序的新增行 RenamePlan, 被删除的原文件名列表,
+        状态需要更新的 [(原文件名, 新状态码)])。文件增删会使以它为新文件名的
+        行在"可以处理"和"文件已存在"之间变化，这些行通过新文件名反推出原
+        文件名来定位。状态按新快照计算，包括覆盖较旧文件时需要的 stat，因此
+        可以在后台线程调用；这里不修改引擎的状态，合并后由调用方通过
+        adopt_snapshot 切换到新快照。
+        """
+        added = [name for name in new_snapshot.names if name not in old_snapshot.index]
+        removed = [name for name in old_snapshot.names if name not in new_snapshot.index]
+        names = new_snapshot.index
+
+        chunk = RenamePlan(self.rules.rules, self.show_new_name)
+        self._prefetch(added)
+        for file in added:
+            rule_id = self.rules.match_id(file)
+            if rule_id is None or not self.is_target(file):
+                continue
+            if not self.show_new_name:
+                chunk.add(file, rule_id, CODE_WAITING)
+            else:
+                new_name = self.rules.rules[rule_id].apply(file)
+                chunk.add(file, rule_id, self.target_code(file, new_name, names))
+        removed_targets = [file for file in removed if self.is_target(file)]
+        return chunk.sorted(), removed_targets, self._recheck_codes(added, removed, new_snapshot)
+
+    def _recheck_codes(self, added, removed, snapshot):
+        """以 added 或 removed 中的名称为新文件名的已有行，按 snapshot 重新计算的状态码"""
+        if not self.show_new_name:
+            return []
+        keys = {}  # 小写原文件名 -> 规则序号集合
+        for name in added + removed:
+            lower = name.lower()
+            for rule_id, rule in enumerate(self.rules.rules):
+                new_suffix = rule.new_suffix.lower()
+                if lower.endswith(new_suffix):
+                    stem = lower[:len(lower) - len(new_suffix)]
+                    keys.setdefault(stem + rule.old_suffix.lower(), set()).add(rule_id)
+        if not keys:
+            return []
+
+        added = set(added)  # 新增行的状态已经按新快照计算过
+        codes = []
+        for file in snapshot.names:
+            rule_ids = keys.get(file.lower())
+            if rule_ids is None or file in added:
+                continue
+            rule_id = self.rules.match_id(file)
+            if rule_id not in rule_ids or not self.is_target(file):
+                continue
+            new_name = self.rules.rules[rule_id].apply(file)
+            codes.append((file, self.target_code(file, new_name, snapshot.index)))
+        return codes
+
+    def adopt_snapshot(self, snapshot):
+        """合并 diff_preview 的结果后切换到新快照，之后的状态检查使用它"""
+        self.snapshot = snapshot
+        self.names = snapshot.index
+
+    def export_plan(self, path):
+        """边列目录边把可以处理的文件写入计划文件，返回 (写入数量, 跳过数量)
+
+        不在内存中保留计划，被停止时删除写了一半的文件并返回 None。
+        """
+        skipped = 0
+        with PlanWriter(path, self.directory, self.job_params()) as writer:
+            last_listing = None
+            for file, rule_id, code, listing in self._iter_planned():
+                if listing is not last_listing:
+                    writer.add_dir(*listing)
+                    last_listing = listing
+                if code in ACTIONABLE_CODES:
+                    writer.add(file, self.rules.rules[rule_id].apply(file))
+                else:
+                    skipped += 1
+        if not self.is_running:
+            os.remove(path)
+            return None
+        return writer.count, skipped
+
+    def execute(self):
+        """实际处理文件，返回 (成功数量, 文件总数)
+
+        列目录、规划和重命名三个阶段以流水线方式执行: 列目录线程把匹配的
+        文件名分批放入有界队列，当前线程逐个检查冲突、备份并记录日志，
+        再交给重命名执行器。队列已满时列目录线程暂停，因此内存占用与
+        目录大小无关，重命名也不必等到列目录结束才开始。
+        实际处理总是重新列目录，不使用 snapshot_cache（处理结束后只使它
+        失效）。列目录结束后才知道文件总数，此前进度为 -1（总数未知）。
+        设置了 plan_file 时改为逐行读取计划文件，不再列目录。
+        """
+        # 索引只记录本次处理占用或产生的新文件名；目标是否已存在由
+        # 不覆盖的原子重命名检测。文件系统可能在处理中途才表明不支持该
+        # 标志，所以每个文件都重新读取 atomic，不可用时在重命名前逐个检查
+        self.names = NameIndex()
+        # 为重名文件另选名称时才创建，没有重名时不会额外列目录
+        self._allocator = None
+        self.metrics = RunMetrics()
+        self.metrics.start()
+        rule_stats = self.rules.stat_count
+        self._success_count = 0
+        self._total_files = 0
+        self._journal = None
+        self._backup = None
+        self._run_opened = False
+        self._listed_total = None
+        self.abort_reason = None
+        self._report_value(-1)
+
+        self._renamer = self.renamer_factory(self.directory)
+        try:
+            source = self._iter_plan_entries() if self.plan_file else self._iter_pipeline()
+            with closing(source) as renames, \
+                    rename_trace.span("engine.execute", workers=self.workers) as span:
+                if self.workers > 1:
+                    self._execute_parallel(renames)
+                else:
+                    self._execute_serial(renames)
+                span.update(total=self._total_files, success=self._success_count)
+        finally:
+            self._renamer.close()
+            if self._backup:
+                self._backup.close()
+                self._backup = None
+            if self._journal:
+                self._journal.close(self._success_count)
+                self._journal = None
+            # 按内容匹配时读取文件头之前的 stat，以及为重名文件分配名称时列的目录
+            self.metrics.count("stat", self.rules.stat_count - rule_stats)
+            if self._allocator is not None:
+                self.metrics.count("listdir", self._allocator.dirs_listed)
+            self.metrics.finish(self._success_count, self._total_files)
+
+        if self._total_files == 0:
+            if self.is_running and self.plan_file:
+                self._report("计划中没有需要处理的文件")
+            elif self.is_running:
+                self._report(f"未找到后缀为 {self.suffix_summary()[0]} 的文件")
+            return 0, 0
+        if self.snapshot_cache is not None:
+            self.snapshot_cache.invalidate(self.directory)
+        if self.is_running:
+            self._report_value(100)
+        return self._success_count, self._total_files
+
+    def _iter_pipeline(self):
+        """在后台线程中列目录，逐个产出 (原文件名, 新文件名)"""
+        batches = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        stop = threading.Event()
+        lister = threading.Thread(
+            target=self._listing_stage, args=(batches, stop), daemon=True)
+        lister.start()
+        done = 0  # 已取出的文件数
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    return
+                if isinstance(batch, Exception):
+                    raise batch
+                for file in batch:
+                    # 列目录结束后才知道总数，此前进度保持为未知
+                    total = self._listed_total
+                    if total:
+                        self._report_value(min(99, done * 100 // total))
+                    done += 1
+                    # 跳过本次处理产生的新文件名，避免边列目录边重命名时重复处理
+                    if file not in self.names:
+                        yield file, self.new_name_for(file)
+        finally:
+            stop.set()
+            lister.join()
+
+    def _listing_stage(self, batches, stop):
+        """列目录阶段: 把匹配的文件名分批放入队列，以 None 结束"""
+        def put(item):
+            # 队列已满时等待，同时响应停止请求
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        metrics = self.metrics
+        matched = 0
+        try:
+            if self.recursive:
+                listing = (files for _, _, files in self._iter_tree(index=False, metrics=metrics))
+            else:
+                metrics.count("scandir")
+                listing = iter_scandir(self.directory)
+            with closing(listing):
+                # 分别计时列目录和匹配规则，等待队列的时间不计入
+                start = time.perf_counter()
+                for names in listing:
+                    listed = time.perf_counter()
+                    metrics.add_time("listing", listed - start)
+                    if not self.is_running:
+                        break
+                    self._prefetch(names)
+                    batch = [f for f in names if self.is_target(f)]
+                    metrics.add_time("match", time.perf_counter() - listed)
+                    matched += len(batch)
+                    if batch and not put(batch):
+                        return
+                    start = time.perf_counter()
+        except Exception as e:
+            if not put(e):
+                return
+        if self.is_running:
+            self._listed_total = matched
+        put(None)
+
+    def _iter_plan_entries(self):
+        """逐行读取计划文件，产出需要执行的 (原文件名, 新文件名)
+
+        文件夹的修改时间与计划中记录的相同时，说明生成计划之后其中没有
+        文件增删，直接执行；否则逐个检查原文件是否仍然存在。目标是否
+        已存在始终由重命名时的检查保证。
+        """
+        recorded = {}  # 相对路径 -> 计划中记录的修改时间
+        unchanged = {}  # 相对路径 -> 当前修改时间是否与记录相同
+        for kind, first, second in self._read_plan_file():
+            if kind == "dir":
+                recorded[first] = second
+                continue
+
+            old_name, new_name = first, second
+            rel_dir = os.path.dirname(old_name)
+            same = unchanged.get(rel_dir)
+            if same is None:
+                # 第一次遇到该文件夹时其中还没有文件被本次处理重命名
+                self.metrics.count("stat")
+                try:
+                    mtime_ns = os.stat(os.path.join(self.directory, rel_dir)).st_mtime_ns
+                except OSError:
+                    mtime_ns = None
+                same = unchanged[rel_dir] = mtime_ns is not None and mtime_ns == recorded.get(rel_dir)
+                if not same:
+                    self._report(f"文件夹 '{rel_dir or self.directory}' 在生成计划后有变化，"
+                                 f"将逐个检查其中的文件")
+            if not same:
+                self.metrics.count("stat")
+            if not same and not os.path.lexists(os.path.join(self.directory, old_name)):
+                self._report(f"警告: '{old_name}' 已不存在，跳过")
+                self._total_files += 1
+                continue
+            yield old_name, new_name
+
+    def _read_plan_file(self):
+        """逐行读取计划文件，文件被截断或损坏时中止处理，已执行的部分照常记录"""
+        try:
+            yield from iter_plan_file(self.plan_file)
+        except ValueError as e:
+            self._abort(f"读取计划文件失败，已停止处理: {str(e)}")
+
+    def _open_run(self):
+        """遇到第一个需要处理的文件时创建备份和日志，失败时返回 False"""
+        if self.backup_mode:
+            try:
+                with rename_trace.span("backup.create", mode=self.backup_mode):
+                    self._backup = BackupWriter(self.directory, self.backup_mode)
+                self._report(f"备份位置: {self._backup.path}")
+            except Exception as e:
+                self._abort(f"创建备份失败，已取消处理: {str(e)}")
+                return False
+        if self.journal_dir:
+            self._journal = rename_journal.RenameJournal.create(
+                self.directory, self.job_params(), journal_dir=self.journal_dir)
+            self.run_id = self._journal.run_id
+        return True
+
+    def _target_on_disk(self, new_name):
+        """原子重命名不可用时，在重命名之前检查目标是否已存在
+
+        每次调用都读取重命名器当前的 atomic，不在处理开始时缓存。
+        """
+        if self._renamer.atomic:
+            return False
+        self.metrics.count("stat")
+        return os.path.lexists(os.path.join(self.directory, new_name))
+
+    def _begin_rename(self, file, new_name):
+        """检查冲突、备份并记录意图，返回 (原文件名, 新文件名, 日志序号)，跳过时返回 None
+
+        新文件名会先在索引中占用，避免并发时两个文件重命名为同一个名字。
+        """
+        if not self._run_opened:
+            if not self._open_run():
+                return None
+            self._run_opened = True
+        self._total_files += 1
+
+        overwrite = False
+        if self.target_exists(new_name) or self._target_taken(new_name):
+            new_name, overwrite = self._resolve_collision(file, new_name)
+            if new_name is None:
+                return None
+        return self._reserve(file, new_name, overwrite)
+
+    def _reserve(self, file, new_name, overwrite):
+        """备份、在索引中占用新文件名并记录意图，返回重命名任务；备份失败时返回 None"""
+        if self._backup:
+            try:
+                self._backup.add(file, new_name)
+                if overwrite:
+                    # 被覆盖的文件也加入备份，硬链接备份时可以找回
+                    self._backup.add(new_name, new_name)
+            except Exception as e:
+                self._abort(f"备份 '{file}' 失败，已停止处理: {str(e)}")
+                return None
+        self.names.add(new_name)
+        if self._allocator is not None:
+            self._allocator.add(new_name)
+        seq = self._journal.record_rename(file, new_name) if self._journal else None
+        return file, new_name, seq, overwrite
+
+    def _target_taken(self, new_name):
+        """重命名之前判断目标是否已被其他文件占用
+
+        原子重命名可用时只查已经列过的目录，目标是否存在由重命名时的
+        EEXIST 发现，见 _retry_collision。
+        """
+        if self._allocator is not None and self._allocator.known_taken(new_name):
+            return True
+        if not self._target_on_disk(new_name):
+            return False
+        if self._allocator is not None:
+            # 列目录之后才出现的文件，之后分配名称时也要避开
+            self._allocator.add(new_name)
+        return True
+
+    def _allocate(self, name):
+        """为重名的文件分配空闲名称，同时避开本次处理已占用但还未重命名的名称"""
+        if self._allocator is None:
+            self._allocator = NameAllocator(self.directory)
+        resolved = self._allocator.allocate(name)
+        while resolved in self.names:
+            resolved = self._allocator.allocate(name)
+        return resolved
+
+    def _resolve_collision(self, file, new_name):
+        """按重名策略处理已存在的目标，返回 (实际使用的新文件名, 是否覆盖)
+
+        跳过时新文件名为 None。第一次需要另选名称时才列出目标所在的文件夹，
+        无法列出时报告错误并跳过该文件。
+        """
+        try:
+            resolved = self._resolve_name(file, new_name)
+        except OSError as e:
+            self.metrics.error(e)
+            self._report(f"错误: 无法列出 '{os.path.dirname(new_name) or self.directory}' "
+                         f"为 '{file}' 另选名称，跳过: {str(e)}")
+            return None, False
+        if resolved is None:
+            return self._resolve_existing(file, new_name)
+        self._report(f"'{new_name}' 已存在，改为 '{resolved}'")
+        return resolved, False
+
+    def _resolve_name(self, file, new_name):
+        """编号和时间策略下另选的名称，其他策略返回 None"""
+        if self.collision == COLLISION_NUMBER:
+            return self._allocate(new_name)
+        if self.collision == COLLISION_TIMESTAMP:
+            self.metrics.count("stat")
+            try:
+                mtime = os.stat(os.path.join(self.directory, file)).st_mtime
+            except OSError:
+                mtime = time.time()
+            stem, suffix = os.path.splitext(new_name)
+            resolved = stem + time.strftime("_%Y%m%d_%H%M%S", time.localtime(mtime)) + suffix
+            if self._allocator is None:
+                self._allocator = NameAllocator(self.directory)
+            if resolved in self._allocator or resolved in self.names:
+                resolved = self._allocate(resolved)
+            return resolved
+        return None
+
+    def _resolve_existing(self, file, new_name):
+        """覆盖较旧的目标或跳过，返回 (新文件名或 None, 是否覆盖)"""
+        if (self.collision == COLLISION_OVERWRITE_OLDER and new_name not in self.names
+                and self._count_stats(2) and self._target_is_older(file, new_name)):
+            # 本次处理产生的文件不会被覆盖
+            self._report(f"'{new_name}' 已存在且较旧，将被覆盖")
+            return new_name, True
+        self._report(f"警告: '{new_name}' 已存在，跳过")
+        return None, False
+
+    def _count_stats(self, n):
+        """记录 n 次 stat，总是返回 True，便于放在条件表达式中"""
+        self.metrics.count("stat", n)
+        return True
+
+    def _rename_task(self, task):
+        """执行一次重命名系统调用，可在线程池中运行"""
+        file, new_name, _, overwrite = task
+        start = time.perf_counter()
+        try:
+            if overwrite:
+                self._renamer.replace(file, new_name)
+            else:
+                self._renamer.rename(file, new_name)
+        finally:
+            self.metrics.add_time("rename", time.perf_counter() - start)
+            self.metrics.count("rename")
+
+    def _end_rename(self, task, error, retry=True):
+        """根据重命名结果更新索引、日志和计数"""
+        file, new_name, seq, overwrite = task
+        if error is None:
+            if self._journal:
+                self._journal.record_done(seq)
+            # 只有可能再次被列出并匹配的新文件名需要留在索引中
+            if not self.is_target(new_name):
+                self.names.discard(new_name)
+            if self._allocator is not None:
+                self._allocator.discard(file)
+            self._success_count += 1
+            self._report(f"成功: {file} -> {new_name}")
+            return
+
+        self.metrics.error(error)
+        if self._journal:
+            self._journal.record_failed(seq, str(error))
+        self.names.discard(new_name)
+        if self._allocator is not None and not overwrite and not isinstance(error, FileExistsError):
+            self._allocator.discard(new_name)
+        if isinstance(error, FileExistsError):
+            # 目标已存在，由系统调用原子地检测到
+            if retry and self.collision != COLLISION_SKIP and not overwrite:
+                self._retry_collision(file, new_name)
+            else:
+                self._report(f"警告: '{new_name}' 已存在，跳过")
+        else:
+            self._report(f"错误: 无法重命名 '{file}': {str(error)}")
+
+    def _retry_collision(self, file, new_name):
+        """重命名时才发现目标已存在，按重名策略另选名称后在当前线程重试一次"""
+        if self._allocator is not None:
+            self._allocator.add(new_name)
+        resolved, overwrite = self._resolve_collision(file, new_name)
+        if resolved is None:
+            return
+        task = self._reserve(file, resolved, overwrite)
+        if task is None:
+            return
+        try:
+            self._rename_task(task)
+        except Exception as e:
+            error = e
+        else:
+            error = None
+        self._end_rename(task, error, retry=False)
+
+    def _execute_serial(self, renames):
+        """逐个重命名"""
+        for file, new_name in renames:
+            if not self.is_running:
+                break
+
+            start = time.perf_counter()
+            task = self._begin_rename(file, new_name)
+            self.metrics.add_time("prepare", time.perf_counter() - start)
+            if task is not None:
+                try:
+                    self._rename_task(task)
+                except Exception as e:
+                    error = e
+                else:
+                    error = None
+                start = time.perf_counter()
+                self._end_rename(task, error)
+                self.metrics.add_time("commit", time.perf_counter() - start)
+
+    def _execute_parallel(self, renames):
+        """用有界线程池并发重命名，适合每次重命名都需要网络往返的 SMB/NFS
+
+        冲突检查、日志和进度汇报都在当前线程完成，线程池只执行
+        rename 系统调用；同时在途的任务数不超过 workers 的 4 倍。
+        """
+        max_pending = self.workers * 4
+
+        def collect(futures):
+            start = time.perf_counter()
+            for future in futures:
+                self._end_rename(future.task, future.exception())
+            self.metrics.add_time("commit", time.perf_counter() - start)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = set()
+            for file, new_name in renames:
+                if not self.is_running:
+                    break
+
+                start = time.perf_counter()
+                task = self._begin_rename(file, new_name)
+                self.metrics.add_time("prepare", time.perf_counter() - start)
+                if task is None:
+                    continue
+
+                future = pool.submit(self._rename_task, task)
+                future.task = task
+                pending.add(future)
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+
+            # 已提交的任务即使被停止也要等待完成，保证计数和日志准确
+            collect(as_completed(pending))
+
+    def job_params(self):
+        """本次处理的参数，写入日志以便中断后继续"""
+        if self.operation_mode == "sniff":
+            # 保留原始的筛选后缀，继续处理时原样填回
+            old_suffix, new_suffix = self.old_suffix, ""
+        else:
+            old_suffix, new_suffix = self.suffix_summary()
+        return {
+            "old_suffix": old_suffix,
+            "new_suffix": new_suffix,
+            "operation": self.operation_mode,
+            "rules": self.rules.as_pairs(),
+            "collision": self.collision,
+            "recursive": self.recursive,
+            "include": self.name_filter.include,
+            "exclude": self.name_filter.exclude
+        }
+
+    def suffix_summary(self):
+        """用于日志和历史记录的 (原后缀, 新后缀) 文本，多条规则时用逗号连接"""
+        if self.operation_mode == "sniff":
+            return self.old_suffix or "(全部)", "(按内容)"
+        if self.operation_mode != "rules":
+            return self.old_suffix, self.new_suffix if self.operation_mode == "replace" else ""
+        pairs = self.rules.as_pairs()
+        return (", ".join(old for old, _ in pairs),
+                ", ".join(new or "(移除)" for _, new in pairs))
+
+    def history_entry(self, success_count, total_files):
+        """生成一条操作记录"""
+        return {
+            "run_id": self.run_id,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "directory": self.directory,
+            "old_suffix": self.suffix_summary()[0],
+            "new_suffix": self.suffix_summary()[1],
+            "operation": self.operation_mode,
+            "success_count": success_count,
+            "total_files": total_files,
+            "metrics": self.metrics.to_dict() if self.metrics else None
+        }
+
+
+def undo_history_entry(run_id, undone_count, total_files, metrics=None):
+    """生成撤销操作的记录，后缀与原处理相反"""
+    header = rename_journal.read_header(run_id)
+    params = header["params"]
+    return {
+        "run_id": run_id,
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "directory": header["directory"],
+        "old_suffix": params["new_suffix"] if params["operation"] != "remove" else "",
+        "new_suffix": params["old_suffix"],
+        "operation": "undo",
+        "success_count": undone_count,
+        "total_files": total_files,
+        "metrics": metrics.to_dict() if metrics else None
+    }
+
+
+def save_history(history_entry):
+    """保存操作历史，设置了 RENAME_METRICS_TEXTFILE 时同时更新指标文件"""
+    try:
+        HISTORY_STORE.add(history_entry)
+    except Exception as e:
+        print(f"保存历史记录失败: {str(e)}")
+        return
+    textfile = os.environ.get(rename_metrics.TEXTFILE_ENV)
+    if textfile:
+        try:
+            export_metrics(textfile)
+        except Exception as e:
+            print(f"导出性能指标失败: {str(e)}")
+
+
+def export_metrics(path):
+    """把每个文件夹最近一次处理的性能指标导出为 Prometheus 文本格式"""
+    rename_metrics.write_textfile(path, HISTORY_STORE.latest_runs())
+
+
+def clear_history():
+    """删除所有历史记录"""
+    HISTORY_STORE.clear()
+
+
+def load_last_directory():
+    """返回上次使用且仍然存在的目录，没有则返回 None"""
+    try:
+        last_dir = HISTORY_STORE.last_directory()
+        if last_dir and os.path.exists(last_dir):
+            return last_dir
+    except Exception:
+        pass
+    return None
@@ -0,0 +1,611 @@
+"""后台服务模式
+
+长期运行的服务进程通过本地 Unix socket 接收处理任务，适合脚本在一天中
+多次请求处理不同的文件夹: 不必每次启动新的解释器，目录快照和按内容识别
+的结果在任务之间保留，文件夹没有变化时预览直接复用缓存的目录列表。
+
+    python rename_files.py --daemon --concurrency 2
+    python rename_files.py --cli /data/inbox --old .txt --new .md --use-daemon
+
+协议是 UTF-8 的 JSON Lines: 客户端每行发送一个请求，服务端每行返回一个
+事件。同一个连接上可以依次发送多个请求。
+
+    {"op": "ping"}                               -> {"event": "pong", ...}
+    {"op": "submit", "job": {...}}               -> {"event": "accepted", "job_id": ...}
+                                                    之后是该任务的事件，直到结束事件
+    {"op": "submit", "job": {...}, "stream": false}  只返回 accepted
+    {"op": "watch", "job_id": ...}               -> 该任务的事件，直到结束事件
+    {"op": "cancel", "job_id": ...}              -> {"event": "cancelling" 或 "not_cancelled", ...}
+    {"op": "status"}                             -> {"event": "status", "jobs": [...], ...}
+    {"op": "shutdown"}                           -> {"event": "bye"}
+
+任务的字段与 RenameEngine.job_params 相同，另外加上 directory（绝对路径）:
+
+    {"directory": "/data/inbox", "operation": "replace", "old_suffix": ".txt",
+     "new_suffix": ".md", "rules": [], "collision": "skip", "recursive": false,
+     "include": [], "exclude": [], "backup": null, "workers": 1,
+     "preview": false, "history": true, "journal": true}
+
+operation 为 "rules" 时使用 rules 中的 [原后缀, 新后缀]，为 "sniff" 时
+old_suffix 是可选的筛选后缀；也可以只给出 plan_file 执行计划文件。
+任务事件: queued、started、progress（message）、progress_value（value）、
+preview（rows，预览任务）、dropped（客户端读取太慢时丢弃的事件数），最后是
+finished（success、total、run_id、metrics）、failed（error，因备份失败等
+错误中止时也带有 success 等字段）或 cancelled。
+错误的请求返回 {"event": "error", "error": ...}。
+"""
+import os
+import sys
+import json
+import queue
+import stat
+import signal
+import socket
+import tempfile
+import threading
+import socketserver
+from collections import OrderedDict, deque
+from itertools import islice
+
+import rename_core
+import rename_journal
+import rename_walk
+import rename_sniff
+
+
+SOCKET_ENV = "RENAME_DAEMON_SOCKET"
+PROTOCOL_VERSION = 1
+DEFAULT_CONCURRENCY = 2  # 同时执行的任务数，同一文件夹的任务总是依次执行
+DEFAULT_MAX_QUEUE = 64  # 最多排队的任务数，队列已满时拒绝新任务
+JOB_EVENT_BUFFER = 5000  # 每个任务保留的最近事件数，客户端落后更多时丢弃
+FINISHED_JOBS_KEPT = 200  # 保留多少个已结束的任务供 watch/status 查询
+PREVIEW_CHUNK = 1000  # 预览任务每个事件包含的行数
+CLIENT_TIMEOUT = 5  # 客户端连接和等待非流式回复的秒数
+
+# 任务状态
+STATE_QUEUED = "queued"
+STATE_RUNNING = "running"
+STATE_FINISHED = "finished"
+STATE_FAILED = "failed"
+STATE_CANCELLED = "cancelled"
+END_STATES = (STATE_FINISHED, STATE_FAILED, STATE_CANCELLED)
+
+
+class DaemonError(Exception):
+    """请求无效、队列已满或无法连接后台服务"""
+
+
+def default_socket_path():
+    """RENAME_DAEMON_SOCKET，否则放在 XDG_RUNTIME_DIR 或临时目录中（按用户区分）"""
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, "rename-tools.sock")
+    uid = os.getuid() if hasattr(os, "getuid") else os.getpid()
+    return os.path.join(tempfile.gettempdir(), f"rename-tools-{uid}.sock")
+
+
+def is_supported():
+    """当前平台是否支持 Unix socket"""
+    return hasattr(socket, "AF_UNIX") and hasattr(socketserver, "ThreadingUnixStreamServer")
+
+
+def job_from_engine(engine, preview=False):
+    """把已配置好的 RenameEngine 转换为任务，界面和命令行作为客户端时使用"""
+    # 服务进程的工作目录可能不同，路径都转换为绝对路径
+    job = {"directory": os.path.abspath(engine.directory), **engine.job_params(),
+           "backup": engine.backup_mode, "workers": engine.workers,
+           "preview": preview, "journal": engine.journal_dir is not None}
+    if engine.plan_file:
+        job["plan_file"] = os.path.abspath(engine.plan_file)
+    return job
+
+
+class Job:
+    """一个处理任务及其事件流
+
+    事件按顺序编号，只保留最近 JOB_EVENT_BUFFER 个；多个客户端可以同时
+    读取同一个任务的事件，读取太慢的客户端会收到 dropped 事件。
+    """
+
+    def __init__(self, job_id, spec):
+        self.job_id = job_id
+        self.spec = spec
+        self.state = STATE_QUEUED
+        self.engine = None
+        self.dir_key = None  # 文件夹的真实路径，同一文件夹的任务依次执行
+        self.result = None
+        self._events = deque(maxlen=JOB_EVENT_BUFFER)
+        self._next_seq = 0
+        self._changed = threading.Condition()
+
+    @property
+    def done(self):
+        return self.state in END_STATES
+
+    def emit(self, event, state=None):
+        with self._changed:
+            if state is not None:
+                self.state = state
+            event["job_id"] = self.job_id
+            event["seq"] = self._next_seq
+            self._next_seq += 1
+            self._events.append(event)
+            self._changed.notify_all()
+
+    def iter_events(self):
+        """从第一个事件开始产出事件，产出结束事件后停止"""
+        seq = 0  # 下一个要产出的事件编号
+        while True:
+            with self._changed:
+                while self._next_seq <= seq and not self.done:
+                    self._changed.wait()
+                first = self._events[0]["seq"] if self._events else self._next_seq
+                missed = max(0, first - seq)
+                pending = list(islice(self._events, max(0, seq - first), None))
+                seq = self._next_seq
+                finished = self.done
+            if missed:
+                yield {"event": "dropped", "job_id": self.job_id, "count": missed}
+            yield from pending
+            if finished:
+                return
+
+    def start(self):
+        """开始执行，已被取消时返回 False"""
+        with self._changed:
+            if self.state != STATE_QUEUED:
+                return False
+            self.emit({"event": "started"}, STATE_RUNNING)
+            return True
+
+    def cancel(self):
+        """取消任务: 排队中的任务不再执行，正在执行的任务尽快停止"""
+        with self._changed:
+            if self.state == STATE_QUEUED:
+                self.emit({"event": "cancelled"}, STATE_CANCELLED)
+                return True
+            if self.state == STATE_RUNNING and self.engine is not None:
+                self.engine.stop()
+                return True
+            return False
+
+    def summary(self):
+        return {"job_id": self.job_id, "state": self.state,
+                "directory": self.spec.get("directory"),
+                "operation": self.spec.get("operation"),
+                "preview": bool(self.spec.get("preview")),
+                "result": self.result}
+
+
+class RenameDaemon:
+    """任务队列和执行线程
+
+    concurrency 个线程从有界队列中取任务执行；同一文件夹（按真实路径）
+    的任务依次执行: 文件夹正忙时任务交给正在处理该文件夹的线程，排在它
+    的待办列表中，取到任务的线程不会等待，可以继续执行其他文件夹的任务。
+    预览使用的目录快照缓存和按内容识别的缓存在所有任务之间共享；实际
+    处理总是边列目录边重命名，不使用目录快照。
+    """
+
+    def __init__(self, socket_path=None, concurrency=DEFAULT_CONCURRENCY,
+                 max_queue=DEFAULT_MAX_QUEUE):
+        self.socket_path = socket_path or default_socket_path()
+        self.concurrency = max(1, concurrency)
+        self.snapshot_cache = rename_core.SnapshotCache(max_entries=64)
+        self.sniff_cache = rename_sniff.SniffCache()
+        self._queue = queue.Queue(maxsize=max(1, max_queue))
+        self._jobs = OrderedDict()  # 任务编号 -> Job
+        self._jobs_lock = threading.Lock()
+        # 正在处理的文件夹真实路径 -> 之后要依次执行的任务，文件夹空闲时删除
+        self._busy_dirs = {}
+        self._deferred = 0  # 排在忙碌文件夹之后的任务数
+        self._next_id = 1
+        self._workers = []
+        self.server = None
+
+    def build_engine(self, spec):
+        """根据任务创建 RenameEngine，任务无效时抛出 DaemonError"""
+        if not isinstance(spec, dict):
+            raise DaemonError("job 必须是对象")
+        directory = spec.get("directory")
+        journal_dir = rename_journal.JOURNAL_DIR if spec.get("journal", True) else None
+        options = {
+            "backup_mode": spec.get("backup"),
+            "snapshot_cache": self.snapshot_cache,
+            "journal_dir": journal_dir,
+        }
+        if options["backup_mode"] not in (None,) + rename_core.BACKUP_MODES:
+            raise DaemonError(f"未知的备份方式: {options['backup_mode']}")
+        if spec.get("collision"):
+            options["collision"] = spec["collision"]
+        try:
+            options["workers"] = int(spec.get("workers") or 1)
+            if spec.get("plan_file"):
+                engine = rename_core.RenameEngine.from_plan_file(
+                    spec["plan_file"], directory, **options)
+            else:
+                if not directory or not os.path.isabs(directory):
+                    raise DaemonError("directory 必须是绝对路径")
+                operation = spec.get("operation", "replace")
+                old_suffix = spec.get("old_suffix") or ""
+                rules = None
+                if operation == "rules":
+                    rules = rename_core.RuleSet(spec.get("rules") or [])
+                elif operation == "sniff":
+                    rules = rename_sniff.ContentRules(
+                        directory, rename_walk.split_patterns(old_suffix),
+                        cache=self.sniff_cache)
+                elif operation not in ("replace", "remove"):
+                    raise DaemonError(f"未知的处理方式: {operation}")
+                elif not old_suffix.strip():
+                    raise DaemonError("缺少 old_suffix")
+                engine = rename_core.RenameEngine(
+                    directory, old_suffix, spec.get("new_suffix") or "", operation,
+                    rules=rules, recursive=bool(spec.get("recursive")),
+                    name_filter=rename_walk.NameFilter(
+                        spec.get("include") or (), spec.get("exclude") or ()),
+                    **options)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise DaemonError(f"任务无效: {str(e)}")
+        if not os.path.isdir(engine.directory):
+            raise DaemonError(f"文件夹不存在: {engine.directory}")
+        return engine
+
+    def submit(self, spec):
+        """检查任务并放入队列，返回 Job；队列已满时抛出 DaemonError"""
+        engine = self.build_engine(spec)
+        with self._jobs_lock:
+            job = Job(self._next_id, spec)
+            self._next_id += 1
+        job.engine = engine
+        job.dir_key = os.path.realpath(engine.directory)
+        with self._jobs_lock:
+            # 排在忙碌文件夹之后的任务已离开队列，也计入上限
+            if self._pending() >= self._queue.maxsize:
+                raise DaemonError(f"任务队列已满（{self._queue.maxsize} 个）")
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise DaemonError(f"任务队列已满（{self._queue.maxsize} 个）")
+            self._jobs[job.job_id] = job
+            self._forget_finished()
+            position = self._pending()
+        job.emit({"event": "queued", "position": position})
+        return job
+
+    def _pending(self):
+        """等待执行的任务数"""
+        return self._queue.qsize() + self._deferred
+
+    def _forget_finished(self):
+        """只保留最近的 FINISHED_JOBS_KEPT 个已结束的任务"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]:
+            del self._jobs[job_id]
+
+    def job(self, job_id):
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise DaemonError(f"没有编号为 {job_id} 的任务")
+        return job
+
+    def status(self):
+        with self._jobs_lock:
+            jobs = [job.summary() for job in self._jobs.values()]
+        return {"event": "status", "version": PROTOCOL_VERSION,
+                "concurrency": self.concurrency, "queued": self._pending(),
+                "max_queue": self._queue.maxsize, "jobs": jobs}
+
+    def _claim_dir(self, job):
+        """占用任务的文件夹；文件夹正忙时把任务排到它的待办列表中，返回 False"""
+        with self._jobs_lock:
+            pending = self._busy_dirs.get(job.dir_key)
+            if pending is not None:
+                pending.append(job)
+                self._deferred += 1
+                return False
+            self._busy_dirs[job.dir_key] = deque()
+            return True
+
+    def _next_in_dir(self, key):
+        """取出文件夹待办列表中的下一个任务，没有时释放文件夹并返回 None"""
+        with self._jobs_lock:
+            pending = self._busy_dirs[key]
+            if pending:
+                self._deferred -= 1
+                return pending.popleft()
+            del self._busy_dirs[key]
+            return None
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                if not self._claim_dir(job):
+                    continue
+                key = job.dir_key
+                while job is not None:
+                    try:
+                        if job.state == STATE_QUEUED:
+                            self._run_job(job)
+                    finally:
+                        # 任务结束后不再持有引擎，释放名称索引等内存
+                        job.engine = None
+                    job = self._next_in_dir(key)
+            finally:
+                self._queue.task_done()
+
+    def _run_job(self, job):
+        engine = job.engine
+        engine.on_progress = lambda message: job.emit({"event": "progress", "message": message})
+        engine.on_progress_value = lambda value: job.emit({"event": "progress_value", "value": value})
+        if not job.start():
+            return  # 排队时被取消
+        try:
+            if job.spec.get("preview"):
+                total = 0
+                rows = []
+                for row in engine.iter_preview():
+                    rows.append(row)
+                    if len(rows) >= PREVIEW_CHUNK:
+                        job.emit({"event": "preview", "rows": rows})
+                        total += len(rows)
+                        rows = []
+                if rows:
+                    job.emit({"event": "preview", "rows": rows})
+                    total += len(rows)
+                job.result = {"total": total}
+            else:
+                success_count, total_files = engine.execute()
+                if total_files and job.spec.get("history", True):
+                    rename_core.save_history(engine.history_entry(success_count, total_files))
+                job.result = {"success": success_count, "total": total_files,
+                              "run_id": engine.run_id,
+                              "metrics": engine.metrics.to_dict() if engine.metrics else None}
+        except Exception as e:
+            job.emit({"event": "failed", "error": str(e)}, STATE_FAILED)
+            return
+        if engine.abort_reason:
+            # 备份失败等错误中止，已处理的文件写入了结果和历史记录
+            job.emit({"event": "failed", "error": engine.abort_reason, **(job.result or {})},
+                     STATE_FAILED)
+        elif not engine.is_running:
+            job.emit({"event": "cancelled", **(job.result or {})}, STATE_CANCELLED)
+        else:
+            job.emit({"event": "finished", **job.result}, STATE_FINISHED)
+
+    def _bind(self):
+        """监听 socket；已有服务在运行时抛出 DaemonError
+
+        残留的 socket 文件只有确实是当前用户的 socket 时才会被删除。
+        """
+        if not is_supported():
+            raise DaemonError("当前平台不支持 Unix socket")
+        try:
+            st = os.lstat(self.socket_path)
+        except FileNotFoundError:
+            st = None
+        except OSError as e:
+            raise DaemonError(f"无法检查 {self.socket_path}: {str(e)}")
+        if st is not None:
+            if not stat.S_ISSOCK(st.st_mode):
+                raise DaemonError(f"{self.socket_path} 已存在且不是 socket，不会删除它")
+            if hasattr(os, "getuid") and st.st_uid != os.getuid():
+                raise DaemonError(f"{self.socket_path} 属于其他用户，不会删除它")
+            try:
+                DaemonClient(self.socket_path).request("ping")
+            except DaemonError:
+                try:
+                    os.remove(self.socket_path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    raise DaemonError(f"无法删除残留的 socket 文件 {self.socket_path}: {str(e)}")
+            else:
+                raise DaemonError(f"后台服务已在运行: {self.socket_path}")
+        # socket 在 bind 时按 umask 创建并立即可以连接，先收紧 umask，
+        # 保证从创建起就只有当前用户可以连接
+        old_umask = os.umask(0o077)
+        try:
+            server = _Server(self.socket_path, _RequestHandler)
+        except OSError as e:
+            raise DaemonError(f"无法监听 {self.socket_path}: {str(e)}")
+        finally:
+            os.umask(old_umask)
+        server.daemon_instance = self
+        os.chmod(self.socket_path, 0o600)
+        return server
+
+    def serve_forever(self, on_ready=None):
+        """启动执行线程并处理请求，直到收到 shutdown 请求或被中断"""
+        self.server = self._bind()
+        for i in range(self.concurrency):
+            worker = threading.Thread(target=self._worker, name=f"daemon-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        if on_ready:
+            on_ready(self)
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            self._stop_workers()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def shutdown(self):
+        """停止接收请求（可以在请求处理线程中调用）"""
+        if self.server is not None:
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    def _stop_workers(self):
+        """取消排队的任务，停止正在执行的任务并等待执行线程结束"""
+        with self._jobs_lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel()
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+
+if is_supported():
+    class _Server(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+else:
+    _Server = None
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """处理一个客户端连接，每行一个 JSON 请求"""
+
+    def send(self, event):
+        self.wfile.write(json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+    def handle(self):
+        daemon = self.server.daemon_instance
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("请求必须是 JSON 对象")
+            except ValueError as e:
+                self.send({"event": "error", "error": f"无法解析请求: {str(e)}"})
+                continue
+            try:
+                if not self.dispatch(daemon, request):
+                    return
+            except DaemonError as e:
+                self.send({"event": "error", "error": str(e)})
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+    def dispatch(self, daemon, request):
+        """处理一个请求，返回 False 时关闭连接"""
+        op = request.get("op")
+        if op == "ping":
+            self.send({"event": "pong", "version": PROTOCOL_VERSION, "pid": os.getpid()})
+        elif op == "submit":
+            job = daemon.submit(request.get("job"))
+            self.send({"event": "accepted", "job_id": job.job_id})
+            if request.get("stream", True):
+                self.stream(job)
+        elif op == "watch":
+            self.stream(daemon.job(request.get("job_id")))
+        elif op == "cancel":
+            job = daemon.job(request.get("job_id"))
+            self.send({"event": "cancelling" if job.cancel() else "not_cancelled",
+                       "job_id": job.job_id, "state": job.state})
+        elif op == "status":
+            self.send(daemon.status())
+        elif op == "shutdown":
+            self.send({"event": "bye"})
+            daemon.shutdown()
+            return False
+        else:
+            raise DaemonError(f"未知的请求: {op}")
+        return True
+
+    def stream(self, job):
+        for event in job.iter_events():
+            self.send(event)
+
+
+class DaemonClient:
+    """后台服务的客户端
+
+    每次请求使用一个新连接，流式请求在收到结束事件后关闭连接。
+    """
+
+    def __init__(self, socket_path=None, timeout=CLIENT_TIMEOUT):
+        self.socket_path = socket_path or default_socket_path()
+        self.timeout = timeout
+
+    def _connect(self):
+        if not is_supported():
+            raise DaemonError("当前平台不支持 Unix socket")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise DaemonError(f"无法连接后台服务 {self.socket_path}: {str(e)}")
+        return sock
+
+    def _iter_replies(self, request, timeout):
+        sock = self._connect()
+        try:
+            sock.sendall(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+            sock.settimeout(timeout)
+            with sock.makefile("rb") as replies:
+                for line in replies:
+                    try:
+                        event = json.loads(line)
+                    except ValueError as e:
+                        # 服务进程退出时最后一行可能不完整
+                        raise DaemonError(f"后台服务的回复无法解析: {str(e)}")
+                    if not isinstance(event, dict):
+                        raise DaemonError(f"后台服务的回复不是 JSON 对象: {line[:200]!r}")
+                    if event.get("event") == "error":
+                        raise DaemonError(event.get("error"))
+                    yield event
+        except OSError as e:
+            raise DaemonError(f"与后台服务的连接中断: {str(e)}")
+        finally:
+            sock.close()
+
+    def request(self, op, **fields):
+        """发送一个请求，返回第一条回复"""
+        for event in self._iter_replies({"op": op, **fields}, self.timeout):
+            return event
+        raise DaemonError("后台服务没有回复")
+
+    def available(self):
+        """后台服务是否在运行"""
+        try:
+            self.request("ping")
+        except DaemonError:
+            return False
+        return True
+
+    def stream(self, op, **fields):
+        """发送一个流式请求，逐个产出事件直到任务结束（包含结束事件）"""
+        # 任务可能排队或执行很久，流式读取时不设超时
+        for event in self._iter_replies({"op": op, **fields}, None):
+            yield event
+            if event.get("event") in END_STATES:
+                return
+
+    def submit(self, job):
+        """提交任务并产出它的所有事件，第一个是 accepted"""
+        return self.stream("submit", job=job)
+
+
+def run_daemon(socket_path=None, concurrency=DEFAULT_CONCURRENCY, max_queue=DEFAULT_MAX_QUEUE):
+    """在前台运行后台服务，返回进程退出码"""
+    daemon = RenameDaemon(socket_path, concurrency, max_queue)
+    if hasattr(signal, "SIGTERM"):
+        # 被终止时也停止正在执行的任务、删除 socket 文件
+        signal.signal(signal.SIGTERM, lambda signum, frame: daemon.shutdown())
+    try:
+        daemon.serve_forever(on_ready=lambda d: print(
+            f"后台服务已启动: {d.socket_path}（并发 {d.concurrency}，队列 {max_queue}）",
+            flush=True))
+    except DaemonError as e:
+        print(f"错误: {str(e)}", file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        print("后台服务已停止", file=sys.stderr)
+    return 0
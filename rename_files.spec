@@ -1,6 +1,29 @@
 # -*- mode: python ; coding: utf-8 -*-
+#
+# 默认生成目录版（onedir）: dist/文件重命名工具/ 中的程序直接从所在目录
+# 加载 Python 模块和 Qt 动态库，不像单文件版那样每次启动都先解压到临时
+# 目录。不使用 UPX: 压缩过的 Qt 动态库每次加载都要先解压，还容易被杀毒
+# 软件误报。Python 模块仍保存在 PYZ 归档中，导入时才逐个读取。
+#
+# 需要单个可执行文件时:
+#     RENAME_BUILD_PROFILE=onefile pyinstaller rename_files.spec
+import os
 
 block_cipher = None
+ONEFILE = os.environ.get("RENAME_BUILD_PROFILE", "onedir") == "onefile"
+APP_NAME = '文件重命名工具'  # 设置中文名称
+
+# 程序只用到 QtCore、QtGui 和 QtWidgets，其余 Qt 模块不打包，减小体积
+# 和启动时需要扫描的文件
+EXCLUDES = [
+    'tkinter',
+    'PyQt6.QtNetwork', 'PyQt6.QtQml', 'PyQt6.QtQuick', 'PyQt6.QtQuickWidgets',
+    'PyQt6.QtSql', 'PyQt6.QtTest', 'PyQt6.QtPdf', 'PyQt6.QtPdfWidgets',
+    'PyQt6.QtMultimedia', 'PyQt6.QtMultimediaWidgets', 'PyQt6.QtWebEngineCore',
+    'PyQt6.QtWebEngineWidgets', 'PyQt6.QtBluetooth', 'PyQt6.QtPositioning',
+    'PyQt6.QtSensors', 'PyQt6.QtSerialPort', 'PyQt6.QtDesigner', 'PyQt6.QtHelp',
+    'PyQt6.QtOpenGL', 'PyQt6.QtOpenGLWidgets', 'PyQt6.Qt3DCore',
+]
 
 a = Analysis(
     ['rename_files.py'],
@@ -11,7 +34,7 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=EXCLUDES,
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
@@ -20,24 +43,53 @@ a = Analysis(
 
 pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
 
-exe = EXE(
-    pyz,
-    a.scripts,
-    a.binaries,
-    a.zipfiles,
-    a.datas,
-    [],
-    name='文件重命名工具',  # 设置中文名称
-    debug=False,
-    bootloader_ignore_signals=False,
-    strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
-    console=False,  # 设置为 False 来隐藏控制台窗口
-    disable_windowed_traceback=False,
-    argv_emulation=False,
-    target_arch=None,
-    codesign_identity=None,
-    entitlements_file=None,
-) 
\ No newline at end of file
+if ONEFILE:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        a.binaries,
+        a.zipfiles,
+        a.datas,
+        [],
+        name=APP_NAME,
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=False,
+        upx_exclude=[],
+        runtime_tmpdir=None,
+        console=False,  # 设置为 False 来隐藏控制台窗口
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
+else:
+    exe = EXE(
+        pyz,
+        a.scripts,
+        [],
+        exclude_binaries=True,
+        name=APP_NAME,
+        debug=False,
+        bootloader_ignore_signals=False,
+        strip=False,
+        upx=False,
+        console=False,  # 设置为 False 来隐藏控制台窗口
+        disable_windowed_traceback=False,
+        argv_emulation=False,
+        target_arch=None,
+        codesign_identity=None,
+        entitlements_file=None,
+    )
+    coll = COLLECT(
+        exe,
+        a.binaries,
+        a.zipfiles,
+        a.datas,
+        strip=False,
+        upx=False,
+        upx_exclude=[],
+        name=APP_NAME,
+    )
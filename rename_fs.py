@@ -0,0 +1,113 @@
+"""同一目录内不覆盖目标的原子重命名
+
+Linux 上使用 renameat2(RENAME_NOREPLACE)，macOS 上使用
+renameatx_np(RENAME_EXCL)，都基于预先打开的目录文件描述符和相对文件名，
+每个文件只需一次系统调用，目标已存在时由内核原子地返回 EEXIST。
+Windows 的 os.rename 本身就不会覆盖已存在的文件。其他情况（包括文件系统
+不支持上述标志时）先检查目标是否存在再调用 os.rename，检查和重命名之间
+不是原子的，调用方可以通过 atomic 属性了解这一点。
+"""
+import os
+import sys
+import errno
+import ctypes
+import ctypes.util
+
+
+RENAME_NOREPLACE = 1  # Linux renameat2 标志
+RENAME_EXCL = 0x4  # macOS renameatx_np 标志
+
+
+def _load_noreplace_rename():
+    """返回 (函数, 标志)，当前平台不支持时返回 (None, 0)"""
+    if sys.platform.startswith("linux"):
+        name, flag = "renameat2", RENAME_NOREPLACE
+    elif sys.platform == "darwin":
+        name, flag = "renameatx_np", RENAME_EXCL
+    else:
+        return None, 0
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        func = getattr(libc, name)  # glibc 2.28 之前没有 renameat2
+    except (OSError, AttributeError):
+        return None, 0
+    func.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                     ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    func.restype = ctypes.c_int
+    return func, flag
+
+
+_noreplace_rename, _noreplace_flag = _load_noreplace_rename()
+
+
+class DirectoryRenamer:
+    """在一个目录内按文件名重命名，目标已存在时抛出 FileExistsError
+
+    可以在多个线程中同时使用。用完后调用 close() 关闭目录描述符。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.dir_fd = None
+        self.atomic = _noreplace_rename is not None
+        if self.atomic:
+            try:
+                self.dir_fd = os.open(directory, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+            except OSError:
+                self.atomic = False
+
+    def rename(self, old_name, new_name):
+        if self.atomic:
+            result = _noreplace_rename(
+                self.dir_fd, os.fsencode(old_name),
+                self.dir_fd, os.fsencode(new_name), _noreplace_flag)
+            if result == 0:
+                return
+            err = ctypes.get_errno()
+            if err not in (errno.EINVAL, errno.ENOSYS, errno.ENOTSUP):
+                raise OSError(err, os.strerror(err), old_name, None, new_name)
+            # 文件系统不支持该标志（部分 NFS/FUSE），之后都使用普通 rename
+            self.atomic = False
+
+        # 普通 rename 在 POSIX 上会覆盖目标，先检查目标是否已存在。调用方
+        # 可能在 atomic 还为 True 时就跳过了自己的检查，所以这里每次都检查
+        if self._target_exists(new_name):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST),
+                                  old_name, None, new_name)
+        if self.dir_fd is not None and os.rename in os.supports_dir_fd:
+            os.rename(old_name, new_name,
+                      src_dir_fd=self.dir_fd, dst_dir_fd=self.dir_fd)
+        else:
+            os.rename(os.path.join(self.directory, old_name),
+                      os.path.join(self.directory, new_name))
+
+    def _target_exists(self, name):
+        """目标名称是否已存在（不跟随符号链接）"""
+        try:
+            if self.dir_fd is not None and os.stat in os.supports_dir_fd:
+                os.stat(name, dir_fd=self.dir_fd, follow_symlinks=False)
+            else:
+                os.lstat(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def replace(self, old_name, new_name):
+        """重命名并覆盖已存在的目标，只在明确选择覆盖时使用"""
+        if self.dir_fd is not None and os.replace in os.supports_dir_fd:
+            os.replace(old_name, new_name,
+                       src_dir_fd=self.dir_fd, dst_dir_fd=self.dir_fd)
+        else:
+            os.replace(os.path.join(self.directory, old_name),
+                       os.path.join(self.directory, new_name))
+
+    def close(self):
+        if self.dir_fd is not None:
+            os.close(self.dir_fd)
+            self.dir_fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
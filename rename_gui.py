@@ -0,0 +1,1630 @@
+import os
+import sys
+from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
+                             QHBoxLayout, QLineEdit, QPushButton, QLabel,
+                             QFileDialog, QTextEdit, QMessageBox, QComboBox,
+                             QTabWidget, QCheckBox, QProgressBar, QGroupBox,
+                             QHeaderView, QTableView, QSpinBox, QTableWidget,
+                             QTableWidgetItem)
+from PyQt6.QtCore import (Qt, QThread, QTimer, pyqtSignal, QPointF,
+                          QAbstractTableModel, QModelIndex, QFileSystemWatcher)
+from PyQt6.QtGui import QFont, QIcon, QColor, QAction, QPainter, QPen, QPolygonF
+
+import rename_core
+import rename_journal
+import rename_walk
+import rename_sniff
+import rename_trace
+import rename_metrics
+import rename_daemon
+from rename_metrics import RunMetrics
+from rename_core import RenameEngine, group_similar_names, merge_preview_diff
+from rename_plan import (RenamePlan, write_plan, read_plan_header, STATUS_READY,
+                         STATUS_WAITING, STATUS_RENAME, STATUS_OVERWRITE)
+
+
+STARTUP_PROBE_ENV = "RENAME_STARTUP_PROBE"  # 设置后窗口第一次绘制时输出标记并退出
+STARTUP_PROBE_MARK = "first-paint"
+
+
+class RenameWorker(QThread):
+    """后台重命名处理线程"""
+    progress = pyqtSignal(str)  # 进度信号
+    progress_value = pyqtSignal(int)  # 进度条信号，-1 表示总数未知
+    preview_batch = pyqtSignal(object, int)  # 分批预览信号: 本批 RenamePlan, 累计行数
+    preview_ready = pyqtSignal(object)  # 预览信号: 排序并分组后的 RenamePlan
+    finished = pyqtSignal(int)  # 完成信号
+
+    def __init__(self, directory, old_suffix, new_suffix, operation_mode, preview_only=False, show_new_name=True,
+                 rules=None, snapshot_cache=None, log_sink=None, backup_mode=None, workers=1,
+                 recursive=False, name_filter=None, plan_file=None,
+                 collision=rename_core.COLLISION_SKIP, daemon_client=None):
+        super().__init__()
+        if plan_file:
+            # 按计划文件执行，规则和筛选条件从计划文件恢复，重名策略使用界面中的选择
+            self.engine = RenameEngine.from_plan_file(
+                plan_file, directory or None,
+                backup_mode=backup_mode, workers=workers, collision=collision)
+        else:
+            self.engine = RenameEngine(directory, old_suffix, new_suffix,
+                                       operation_mode, show_new_name=show_new_name,
+                                       rules=rules, snapshot_cache=snapshot_cache,
+                                       backup_mode=backup_mode, workers=workers,
+                                       recursive=recursive, name_filter=name_filter,
+                                       collision=collision)
+        # 有日志缓冲区时写入缓冲区，由界面定时批量显示，否则逐条发送信号
+        self.log_sink = log_sink
+        self.engine.on_progress = log_sink.write if log_sink else self.progress.emit
+        self.engine.on_progress_value = self.progress_value.emit
+        self.preview_only = preview_only
+        # 设置了 rename_daemon.DaemonClient 时实际处理交给后台服务，
+        # 引擎只用于生成任务参数
+        self.daemon_client = daemon_client
+        self.daemon_job_id = None
+
+    @property
+    def is_running(self):
+        return self.engine.is_running
+
+    @property
+    def stopped_by_user(self):
+        """是否由用户停止（关闭窗口或重新开始），出错中止不算"""
+        return not self.engine.is_running and self.engine.abort_reason is None
+
+    def quit(self):
+        """停止线程"""
+        self.engine.stop()
+        if self.daemon_job_id is not None:
+            try:
+                self.daemon_client.request("cancel", job_id=self.daemon_job_id)
+            except rename_daemon.DaemonError:
+                pass
+        super().quit()
+
+    def run(self):
+        # 打开性能跟踪时记录整个运行的耗时，选择了 cProfile 时同时分析
+        mode = "preview" if self.preview_only else "execute"
+        with rename_trace.profile(mode), \
+                rename_trace.span(f"worker.{mode}", directory=self.engine.directory):
+            self._run()
+
+    def _run(self):
+        try:
+            # 预览模式
+            if self.preview_only:
+                # 先分批发送未排序的结果，让表格尽快显示；各批与完整
+                # 计划共享文件名字符串，界面和后台线程各保存一份只多占用列数组
+                plan = RenamePlan(self.engine.rules.rules, self.engine.show_new_name)
+                with rename_trace.span("preview.plan") as span:
+                    for chunk in self.engine.iter_plan_chunks():
+                        if not self.is_running:
+                            return
+                        plan.extend(chunk)
+                        self.preview_batch.emit(chunk, len(plan))
+                    span["rows"] = len(plan)
+                if not self.is_running:
+                    return
+                # 排序和相似分组都在后台线程完成
+                with rename_trace.span("preview.sort"):
+                    plan = plan.sorted()
+                with rename_trace.span("preview.group"):
+                    plan.set_groups(group_similar_names(plan.iter_old_names()))
+                if self.is_running:
+                    self.preview_ready.emit(plan)
+                return
+
+            if self.daemon_client is not None:
+                self._run_in_daemon()
+                return
+
+            # 实际处理文件
+            success_count, total_files = self.engine.execute()
+
+            # 只要处理过文件就保存操作记录，中途停止或出错中止时也一样，
+            # 否则已经重命名的文件无法从历史记录中撤销
+            if total_files:
+                with rename_trace.span("history.write"):
+                    rename_core.save_history(
+                        self.engine.history_entry(success_count, total_files))
+            if not self.stopped_by_user:
+                self.finished.emit(success_count)
+
+        except Exception as e:
+            if not self.stopped_by_user:
+                self.engine.on_progress(f"发生错误: {str(e)}")
+                self.finished.emit(0)
+
+    def _run_in_daemon(self):
+        """把处理交给后台服务，转发它的进度；历史记录由后台服务写入"""
+        success_count = 0
+        for event in self.daemon_client.submit(rename_daemon.job_from_engine(self.engine)):
+            kind = event["event"]
+            if kind == "accepted":
+                self.daemon_job_id = event["job_id"]
+                self.engine.on_progress(f"已提交到后台服务，任务编号 {event['job_id']}")
+            elif kind == "progress":
+                self.engine.on_progress(event["message"])
+            elif kind == "progress_value":
+                self.progress_value.emit(event["value"])
+            elif kind == "failed":
+                # 界面按出错中止显示，中止前处理的文件数也在事件中
+                self.engine.abort_reason = f"后台任务失败: {event['error']}"
+                self.engine.on_progress(self.engine.abort_reason)
+                success_count = event.get("success", 0)
+            elif kind in ("finished", "cancelled"):
+                success_count = event.get("success", 0)
+        self.daemon_job_id = None
+        if self.is_running:
+            self.finished.emit(success_count)
+
+
+class PreviewUpdateWorker(QThread):
+    """目录变化后在后台重新列目录，计算预览的增量更新"""
+    # (新快照, 新增行, 删除的原文件名, [(原文件名, 新状态码)])；变化太多时为 None，
+    # 表示应完整刷新预览
+    diff_ready = pyqtSignal(object)
+
+    MAX_CHANGES = 5000  # 超过这个数量的变化直接完整刷新
+
+    def __init__(self, engine, snapshot_cache):
+        super().__init__()
+        self.engine = engine
+        self.snapshot_cache = snapshot_cache
+        self.old_snapshot = engine.snapshot
+
+    def run(self):
+        try:
+            new_snapshot = self.snapshot_cache.get(self.engine.directory)
+        except OSError:
+            self.diff_ready.emit(None)
+            return
+        if new_snapshot is self.old_snapshot:
+            return
+        chunk, removed, recheck = self.engine.diff_preview(self.old_snapshot, new_snapshot)
+        if not (len(chunk) or removed or recheck):
+            # 刚修改过的目录不复用缓存，重新列出的内容可能没有变化
+            return
+        if len(chunk) + len(removed) + len(recheck) > self.MAX_CHANGES:
+            self.diff_ready.emit(None)
+        else:
+            self.diff_ready.emit((new_snapshot, chunk, removed, recheck))
+
+
+class UndoWorker(QThread):
+    """后台撤销线程，根据重命名日志把文件改回原名"""
+    finished = pyqtSignal(int)  # 完成信号: 成功撤销的数量
+
+    def __init__(self, run_id, log_sink):
+        super().__init__()
+        self.run_id = run_id
+        self.log_sink = log_sink
+
+    def run(self):
+        try:
+            metrics = RunMetrics()
+            metrics.start()
+            with rename_trace.span("worker.undo", run_id=self.run_id):
+                undone_count, total_files = rename_journal.undo_run(
+                    self.run_id, on_progress=self.log_sink.write, metrics=metrics)
+            metrics.finish(undone_count, total_files)
+            rename_core.save_history(rename_core.undo_history_entry(
+                self.run_id, undone_count, total_files, metrics))
+            self.finished.emit(undone_count)
+        except Exception as e:
+            self.log_sink.write(f"撤销失败: {str(e)}")
+            self.finished.emit(0)
+
+
+def abbreviate_filename(filename, max_length=30):
+    """文件名过长时缩略中间部分，保留后缀"""
+    name, ext = os.path.splitext(filename)
+    if len(name) > max_length:
+        return name[:max_length//2] + '...' + name[-max_length//2:] + ext
+    return filename
+
+
+class PreviewTableModel(QAbstractTableModel):
+    """预览表格数据模型
+
+    数据保存在列式的 RenamePlan 中，文件名、显示文本、颜色和工具提示
+    都在 data() 中按需计算，视图只会为可见的行调用 data()。
+    """
+    HEADERS = ["原文件名", "新文件名", "状态"]
+
+    # 相似文本的背景色
+    SIMILAR_COLORS = [
+        QColor(255, 230, 230),  # 浅红色
+        QColor(230, 255, 230),  # 浅绿色
+        QColor(230, 230, 255),  # 浅蓝色
+        QColor(255, 255, 230),  # 浅黄色
+        QColor(255, 230, 255),  # 浅紫色
+        QColor(230, 255, 255),  # 浅青色
+    ]
+
+    STATUS_COLORS = {
+        STATUS_READY: QColor(60, 179, 113),  # 绿色
+        STATUS_WAITING: QColor(70, 130, 180),  # 钢青色
+        STATUS_RENAME: QColor(218, 165, 32),  # 金色
+        STATUS_OVERWRITE: QColor(255, 140, 0),  # 橙色
+    }
+    STATUS_ERROR_COLOR = QColor(255, 69, 0)  # 红色
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._plan = RenamePlan([])
+        self._next_group = 0  # 增量更新时新建相似组使用的组号
+        self._bold_font = QFont()
+        self._bold_font.setBold(True)
+
+    @property
+    def plan(self):
+        return self._plan
+
+    def set_plan(self, plan):
+        """替换全部预览数据"""
+        self.beginResetModel()
+        self._plan = plan
+        self._next_group = max(plan.groups, default=-1) + 1
+        self.endResetModel()
+
+    def append_plan(self, chunk):
+        """在末尾追加一批未分组的预览数据"""
+        if not len(chunk):
+            return
+        first = len(self._plan)
+        self.beginInsertRows(QModelIndex(), first, first + len(chunk) - 1)
+        if not first:
+            # 第一批使用与之相同的规则和显示方式
+            self._plan = RenamePlan(chunk.rules, chunk.show_new_name)
+        self._plan.extend(chunk)
+        self.endInsertRows()
+
+    def clear(self):
+        self.set_plan(RenamePlan([]))
+
+    def apply_diff(self, chunk, removed, recheck):
+        """把目录的变化合并到已排序并分组的预览中
+
+        一批变化只重建一次计划并重置一次模型，状态码已在后台线程中算好。
+        """
+        self.beginResetModel()
+        self._plan, self._next_group = merge_preview_diff(
+            self._plan, chunk, removed, recheck, self._next_group)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._plan)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return str(section + 1)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+
+        row, column = index.row(), index.column()
+        if column == 0:
+            value = self._plan.old_name(row)
+        elif column == 1:
+            value = self._plan.new_name(row)
+        else:
+            value = self._plan.status(row)
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            return abbreviate_filename(value) if column < 2 else value
+
+        if role == Qt.ItemDataRole.ToolTipRole:
+            # 只在文件名列显示完整文件名
+            return value if column < 2 and value else None
+
+        if role == Qt.ItemDataRole.TextAlignmentRole:
+            if column == 2:
+                return Qt.AlignmentFlag.AlignCenter
+            return Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter
+
+        if role == Qt.ItemDataRole.ForegroundRole and column == 2:
+            return self.STATUS_COLORS.get(value, self.STATUS_ERROR_COLOR)
+
+        group = self._plan.group(row)
+        if group is None:
+            return None
+
+        if role == Qt.ItemDataRole.BackgroundRole:
+            return self.SIMILAR_COLORS[group % len(self.SIMILAR_COLORS)]
+
+        if role == Qt.ItemDataRole.FontRole:
+            # 为相似文本设置加粗字体
+            return self._bold_font
+
+        return None
+
+
+class StartupWorker(QThread):
+    """窗口显示后在后台读取历史记录第一页、上次使用的目录和中断的处理
+
+    这些操作都要访问磁盘（打开数据库、导入旧版历史、检查上次的目录是否
+    存在，它可能在网络共享上），放在后台线程中不会推迟窗口的第一次绘制。
+    """
+    # {"history": (总数, 第一页) 或 None, "last_directory": 目录或 None,
+    #  "interrupted": 中断的处理列表, "errors": 错误信息列表}
+    loaded = pyqtSignal(object)
+
+    def __init__(self, page_size):
+        super().__init__()
+        self.page_size = page_size
+
+    def run(self):
+        result = {"history": None, "last_directory": None, "interrupted": [], "errors": []}
+        try:
+            store = rename_core.HISTORY_STORE
+            result["history"] = store.count(""), store.page(0, self.page_size, "")
+        except Exception as e:
+            result["errors"].append(f"加载历史记录失败: {str(e)}")
+        result["last_directory"] = rename_core.load_last_directory()
+        try:
+            result["interrupted"] = rename_journal.incomplete_runs()
+        except Exception as e:
+            result["errors"].append(f"检查重命名日志失败: {str(e)}")
+        self.loaded.emit(result)
+
+
+class Sparkline(QWidget):
+    """迷你折线图，显示一组数值的变化趋势"""
+
+    def __init__(self, title, unit, color, parent=None):
+        super().__init__(parent)
+        self.title = title
+        self.unit = unit
+        self.color = QColor(color)
+        self.values = []
+        self.setMinimumHeight(36)
+
+    def set_values(self, values):
+        self.values = [value for value in values if value is not None]
+        latest = f"{self.values[-1]:.3g} {self.unit}" if self.values else "无数据"
+        self.setToolTip(f"{self.title}（最近 {len(self.values)} 次）: {latest}")
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        rect = self.rect().adjusted(2, 14, -2, -2)
+        painter.setPen(self.palette().text().color())
+        latest = f"  {self.values[-1]:.3g} {self.unit}" if self.values else ""
+        painter.drawText(2, 11, self.title + latest)
+        if len(self.values) < 2:
+            return
+        low, high = min(self.values), max(self.values)
+        span = (high - low) or 1
+        step = rect.width() / (len(self.values) - 1)
+        points = QPolygonF([
+            QPointF(rect.left() + i * step,
+                    rect.bottom() - (value - low) / span * rect.height())
+            for i, value in enumerate(self.values)])
+        painter.setPen(QPen(self.color, 1.5))
+        painter.drawPolyline(points)
+
+
+class HistoryTableModel(QAbstractTableModel):
+    """历史记录表格数据模型
+
+    按页从历史数据库读取，滚动到底部时才加载下一页。
+    """
+    HEADERS = ["时间", "文件夹", "原后缀", "新后缀", "操作", "处理结果",
+               "耗时", "文件/秒", "错误"]
+    METRIC_COLUMNS = (6, 7, 8)  # 性能指标列，提示信息中显示完整的指标
+    PAGE_SIZE = 200
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.directory_filter = ""
+        self._entries = []
+        self._total = 0
+
+    def reload(self, directory_filter=None):
+        """重新查询，只加载第一页"""
+        if directory_filter is not None:
+            self.directory_filter = directory_filter
+        self.set_first_page(self.store.count(self.directory_filter),
+                            self.store.page(0, self.PAGE_SIZE, self.directory_filter))
+
+    def set_first_page(self, total, entries):
+        """显示已经查询好的第一页，例如启动时在后台线程中读取的结果"""
+        self.beginResetModel()
+        self._total = total
+        self._entries = entries
+        self.endResetModel()
+
+    def entry(self, row):
+        """返回某一行对应的历史记录"""
+        return self._entries[row] if 0 <= row < len(self._entries) else None
+
+    def recent_metrics(self, limit):
+        """已加载的记录中最近 limit 条有性能指标的记录，按时间从旧到新"""
+        recent = [entry["metrics"] for entry in self._entries[:limit] if entry.get("metrics")]
+        recent.reverse()
+        return recent
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and len(self._entries) < self._total
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        entries = self.store.page(
+            len(self._entries), self.PAGE_SIZE, self.directory_filter)
+        if not entries:
+            self._total = len(self._entries)
+            return
+        first = len(self._entries)
+        self.beginInsertRows(QModelIndex(), first, first + len(entries) - 1)
+        self._entries.extend(entries)
+        self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._entries)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return str(section + 1)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+
+        entry = self._entries[index.row()]
+        column = index.column()
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return entry["timestamp"]
+            if column == 1:
+                return entry["directory"]
+            if column == 2:
+                return entry["old_suffix"]
+            if column == 3:
+                return entry["new_suffix"]
+            if column == 4:
+                return entry["operation"]
+            if column == 5:
+                return f"{entry['success_count']}/{entry['total_files']} 成功"
+            metrics = entry.get("metrics")
+            if not metrics:
+                return ""
+            if column == 6:
+                return f"{metrics['elapsed']:.2f} 秒"
+            if column == 7:
+                rate = metrics.get("files_per_second")
+                return f"{rate:.0f}" if rate is not None else ""
+            errors = sum(metrics.get("errors", {}).values())
+            return str(errors) if errors else ""
+
+        if role == Qt.ItemDataRole.ToolTipRole and column == 1:
+            return entry["directory"]
+        if role == Qt.ItemDataRole.ToolTipRole and column in self.METRIC_COLUMNS:
+            return rename_metrics.summary_text(entry.get("metrics"))
+
+        if role == Qt.ItemDataRole.TextAlignmentRole and column != 1:
+            return Qt.AlignmentFlag.AlignCenter
+
+        return None
+
+
+class MainWindow(QMainWindow):
+    """主窗口"""
+
+    PREVIEW_DELAY_MS = 300  # 输入停止多久后刷新预览
+    WATCH_DELAY_MS = 200  # 文件夹变化停止多久后增量更新预览
+    LOG_FLUSH_INTERVAL_MS = 33  # 日志刷新到界面的间隔，约 30 帧每秒
+    LOG_MAX_BLOCKS = 10000  # 日志框最多保留的行数
+    STALL_BEAT_MS = 50  # 性能跟踪时界面线程心跳的间隔
+    TREND_RUNS = 100  # 历史页面趋势图显示的最近处理次数
+
+    first_painted = pyqtSignal()  # 窗口第一次绘制完成，用于测量启动时间
+
+    def __init__(self):
+        super().__init__()
+        self._first_painted = False
+        # 初始化工作线程变量
+        self.worker = None
+        self.preview_worker = None
+        self.undo_worker = None
+        self.update_worker = None
+        self.startup_worker = None
+        self.stale_preview_workers = []  # 已停止但尚未退出的预览线程
+        # 最近使用目录的列表缓存，修改后缀时无需重新扫描
+        self.snapshot_cache = rename_core.SnapshotCache()
+        # 按内容修正后缀时的文件头识别结果缓存，文件未变时不再读取
+        self.sniff_cache = rename_sniff.SniffCache()
+
+        # 输入防抖，停止输入一段时间后才刷新预览
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(self.PREVIEW_DELAY_MS)
+        self.preview_timer.timeout.connect(self.refresh_preview)
+
+        # 监视预览中的文件夹，有文件增删时只把变化合并到预览中
+        self.dir_watcher = QFileSystemWatcher(self)
+        self.dir_watcher.directoryChanged.connect(self.on_directory_changed)
+        self.watch_timer = QTimer(self)
+        self.watch_timer.setSingleShot(True)
+        self.watch_timer.setInterval(self.WATCH_DELAY_MS)
+        self.watch_timer.timeout.connect(self.update_preview_incrementally)
+
+        # 处理日志先写入缓冲区，再按固定帧率批量显示
+        self.log_sink = None
+        self.log_timer = QTimer(self)
+        self.log_timer.setInterval(self.LOG_FLUSH_INTERVAL_MS)
+        self.log_timer.timeout.connect(self.flush_log)
+
+        # 性能跟踪打开时，界面线程每隔一段时间发出心跳，卡顿由 StallDetector 检测
+        self.stall_detector = None
+        self.stall_timer = QTimer(self)
+        self.stall_timer.setInterval(self.STALL_BEAT_MS)
+
+        self.initUI()
+        if rename_trace.is_enabled():
+            # 已通过环境变量打开
+            self.trace_action.setChecked(True)
+
+        # 历史记录、上次使用的目录和中断的处理都在窗口显示后由后台线程读取
+        QTimer.singleShot(0, self.start_deferred_startup)
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self._first_painted:
+            self._first_painted = True
+            self.first_painted.emit()
+
+    def start_deferred_startup(self):
+        """启动后台线程读取启动时需要的数据"""
+        self.startup_worker = StartupWorker(HistoryTableModel.PAGE_SIZE)
+        self.startup_worker.loaded.connect(self.on_startup_loaded)
+        self.startup_worker.start()
+
+    def on_startup_loaded(self, result):
+        """显示后台读取的启动数据"""
+        for message in result["errors"]:
+            self.update_log(message)
+
+        if result["history"] is not None:
+            if self.history_filter_input.text().strip():
+                # 读取期间用户已经输入了筛选条件
+                self.load_history()
+            else:
+                self.history_model.set_first_page(*result["history"])
+
+        last_dir = result["last_directory"]
+        if last_dir and not self.path_input.text().strip():
+            # 只恢复路径，不触发预览，避免一启动就重新扫描上次的（可能很大的）文件夹
+            self.path_input.blockSignals(True)
+            self.path_input.setText(last_dir)
+            self.path_input.blockSignals(False)
+
+        self.check_interrupted_runs(result["interrupted"])
+
+    def closeEvent(self, event):
+        """���口关闭事件处理"""
+        # 确保所有线程都已经停止
+        with rename_trace.span("gui.close_wait_workers"):
+            if self.worker and self.worker.isRunning():
+                self.worker.quit()
+                self.worker.wait()
+            if self.undo_worker and self.undo_worker.isRunning():
+                self.undo_worker.wait()
+            if self.startup_worker and self.startup_worker.isRunning():
+                self.startup_worker.wait()
+            self.preview_timer.stop()
+            self.watch_timer.stop()
+            for preview_worker in [self.preview_worker, self.update_worker] + self.stale_preview_workers:
+                if preview_worker and preview_worker.isRunning():
+                    preview_worker.quit()
+                    preview_worker.wait()
+        self.set_tracing(False)
+        event.accept()
+
+    def set_tracing(self, enabled):
+        """打开或关闭性能跟踪（"诊断"菜单）"""
+        if enabled:
+            path = rename_trace.enable(profile=self.profile_action.isChecked())
+            if self.stall_detector is None:
+                self.stall_detector = rename_trace.StallDetector(rename_trace.stall_threshold_ms())
+                self.stall_timer.timeout.connect(self.stall_detector.beat)
+                self.stall_detector.start()
+                self.stall_timer.start()
+            self.statusBar().showMessage(f'性能跟踪已打开: {path}')
+            return
+        if self.stall_detector is not None:
+            self.stall_timer.stop()
+            self.stall_timer.timeout.disconnect(self.stall_detector.beat)
+            self.stall_detector.stop()
+            self.stall_detector = None
+        path = rename_trace.disable()
+        if path:
+            self.statusBar().showMessage(f'性能跟踪已保存: {path}')
+            self.update_log(f"性能跟踪已保存到 {path}，可以附在问题报告中")
+
+    def initUI(self):
+        self.setWindowTitle('文件后缀处理工具')
+        self.setMinimumWidth(800)
+        self.setMinimumHeight(600)
+
+        # 创建中央部件和主布局
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        main_layout = QVBoxLayout(central_widget)
+
+        # 创建选项卡
+        self.tab_widget = QTabWidget()
+        main_layout.addWidget(self.tab_widget)
+
+        # 主操作页面
+        main_tab = QWidget()
+        self.tab_widget.addTab(main_tab, "文件处理")
+
+        # 历史记录页面
+        history_tab = QWidget()
+        self.tab_widget.addTab(history_tab, "操作历史")
+
+        # 设置主操作页面
+        self.setup_main_tab(main_tab)
+
+        # 设置历史记录页面
+        self.setup_history_tab(history_tab)
+
+        # 诊断菜单: 记录性能跟踪，附在问题报告中
+        diagnose_menu = self.menuBar().addMenu("诊断")
+        self.trace_action = QAction("记录性能跟踪", self)
+        self.trace_action.setCheckable(True)
+        self.trace_action.setToolTip("把各阶段耗时和界面卡顿（含调用栈）写入 logs/trace_*.json")
+        self.trace_action.toggled.connect(self.set_tracing)
+        diagnose_menu.addAction(self.trace_action)
+        self.profile_action = QAction("同时使用 cProfile 分析", self)
+        self.profile_action.setCheckable(True)
+        self.profile_action.toggled.connect(rename_trace.set_profile)
+        diagnose_menu.addAction(self.profile_action)
+
+    def setup_main_tab(self, tab):
+        """设置主操作页面"""
+        layout = QVBoxLayout(tab)
+
+        # 文件夹选择区域
+        folder_group = QGroupBox("文件夹选择")
+        folder_layout = QHBoxLayout()
+        folder_group.setLayout(folder_layout)
+
+        path_label = QLabel("目标文件夹:")
+        self.path_input = QLineEdit()
+        self.path_input.setPlaceholderText('请选择或输入文件夹路径...')
+        self.path_input.textChanged.connect(self.schedule_preview)
+        browse_btn = QPushButton('浏览...')
+        browse_btn.clicked.connect(self.browse_folder)
+
+        folder_layout.addWidget(path_label)
+        folder_layout.addWidget(self.path_input)
+        folder_layout.addWidget(browse_btn)
+        layout.addWidget(folder_group)
+
+        # 后缀设置区域
+        suffix_group = QGroupBox("后缀设置")
+        suffix_layout = QVBoxLayout()
+        suffix_group.setLayout(suffix_layout)
+
+        # 原后缀输入区域
+        self.old_suffix_container = QWidget()
+        old_suffix_layout = QHBoxLayout()
+        self.old_suffix_container.setLayout(old_suffix_layout)
+        self.old_suffix_label = QLabel("原后缀:")
+        self.old_suffix_input = QLineEdit()
+        self.old_suffix_input.setPlaceholderText('例如: .pdf')
+        self.old_suffix_input.textChanged.connect(self.schedule_preview)
+        old_suffix_layout.addWidget(self.old_suffix_label)
+        old_suffix_layout.addWidget(self.old_suffix_input)
+        suffix_layout.addWidget(self.old_suffix_container)
+
+        # 操作模式选择区域
+        operation_layout = QHBoxLayout()
+        operation_label = QLabel("处理方式:")
+        self.operation_mode = QComboBox()
+        # 改变顺序，使替换后缀为默认选项；数据为 RenameEngine 的处理模式
+        self.operation_mode.addItem("替换后缀", "replace")
+        self.operation_mode.addItem("移除后缀", "remove")
+        self.operation_mode.addItem("多条规则", "rules")
+        self.operation_mode.addItem("按内容修正后缀", "sniff")
+        self.operation_mode.currentTextChanged.connect(self.on_mode_changed)
+        operation_layout.addWidget(operation_label)
+        operation_layout.addWidget(self.operation_mode)
+        operation_layout.addStretch()
+        suffix_layout.addLayout(operation_layout)
+
+        # 新后缀输入区域
+        self.new_suffix_container = QWidget()
+        new_suffix_layout = QHBoxLayout()
+        self.new_suffix_container.setLayout(new_suffix_layout)
+        self.new_suffix_label = QLabel("新后缀:")
+        self.new_suffix_input = QLineEdit()
+        self.new_suffix_input.setPlaceholderText('例如: .txt')
+        self.new_suffix_input.textChanged.connect(self.schedule_preview)
+        new_suffix_layout.addWidget(self.new_suffix_label)
+        new_suffix_layout.addWidget(self.new_suffix_input)
+        suffix_layout.addWidget(self.new_suffix_container)
+
+        # 多条规则编辑区域，一次扫描同时应用所有规则
+        self.rules_container = QWidget()
+        rules_layout = QVBoxLayout()
+        rules_layout.setContentsMargins(0, 0, 0, 0)
+        self.rules_container.setLayout(rules_layout)
+        self.rules_table = QTableWidget(0, 2)
+        self.rules_table.setHorizontalHeaderLabels(["原后缀", "新后缀（留空表示移除）"])
+        self.rules_table.horizontalHeader().setSectionResizeMode(
+            QHeaderView.ResizeMode.Stretch)
+        self.rules_table.setMaximumHeight(150)
+        self.rules_table.cellChanged.connect(self.schedule_preview)
+        rules_layout.addWidget(self.rules_table)
+
+        rules_button_layout = QHBoxLayout()
+        add_rule_btn = QPushButton("添加规则")
+        add_rule_btn.clicked.connect(self.add_rule_row)
+        remove_rule_btn = QPushButton("删除所选规则")
+        remove_rule_btn.clicked.connect(self.remove_rule_rows)
+        load_rules_btn = QPushButton("从文件加载...")
+        load_rules_btn.clicked.connect(self.load_rules_file)
+        rules_button_layout.addWidget(add_rule_btn)
+        rules_button_layout.addWidget(remove_rule_btn)
+        rules_button_layout.addWidget(load_rules_btn)
+        rules_button_layout.addStretch()
+        rules_layout.addLayout(rules_button_layout)
+        self.rules_container.setVisible(False)
+        suffix_layout.addWidget(self.rules_container)
+
+        layout.addWidget(suffix_group)
+
+        # 选项设置
+        options_group = QGroupBox("选项")
+        options_group_layout = QVBoxLayout()
+        options_group.setLayout(options_group_layout)
+        options_layout = QHBoxLayout()
+        options_group_layout.addLayout(options_layout)
+
+        self.backup_checkbox = QCheckBox("处理前创建备份")
+        self.backup_checkbox.setChecked(True)
+        options_layout.addWidget(self.backup_checkbox)
+
+        # 备份方式，数据为 rename_core 中的备份模式
+        self.backup_mode = QComboBox()
+        self.backup_mode.addItem("仅记录文件名", rename_core.BACKUP_MANIFEST)
+        self.backup_mode.addItem("硬链接匹配文件", rename_core.BACKUP_HARDLINK)
+        self.backup_mode.addItem("完整复制目录", rename_core.BACKUP_COPY)
+        self.backup_checkbox.toggled.connect(self.backup_mode.setEnabled)
+        options_layout.addWidget(self.backup_mode)
+
+        self.case_sensitive_checkbox = QCheckBox("区分大小写")
+        options_layout.addWidget(self.case_sensitive_checkbox)
+
+        # 并发重命名线程数，网络文件系统上调大可以显著提速
+        options_layout.addWidget(QLabel("并发数:"))
+        self.workers_input = QSpinBox()
+        self.workers_input.setRange(1, 64)
+        self.workers_input.setValue(1)
+        self.workers_input.setToolTip("同时进行的重命名数量，SMB/NFS 等网络文件夹可设为 8~32")
+        options_layout.addWidget(self.workers_input)
+
+        # 目标文件名已存在时的处理方式，数据为 rename_core 中的重名策略
+        options_layout.addWidget(QLabel("重名时:"))
+        self.collision_mode = QComboBox()
+        self.collision_mode.addItem("跳过", rename_core.COLLISION_SKIP)
+        self.collision_mode.addItem("自动编号", rename_core.COLLISION_NUMBER)
+        self.collision_mode.addItem("添加修改时间", rename_core.COLLISION_TIMESTAMP)
+        self.collision_mode.addItem("覆盖较旧的文件", rename_core.COLLISION_OVERWRITE_OLDER)
+        self.collision_mode.setToolTip("自动编号: 改为 \"名称 (1).后缀\"；覆盖较旧的文件: "
+                                       "已存在的文件比原文件旧时覆盖它，否则跳过")
+        self.collision_mode.currentIndexChanged.connect(self.schedule_preview)
+        options_layout.addWidget(self.collision_mode)
+
+        # 交给正在运行的后台服务（rename_files.py --daemon）处理，预览仍在本地进行
+        self.daemon_checkbox = QCheckBox("交给后台服务")
+        self.daemon_checkbox.setToolTip(
+            f"通过 {rename_daemon.default_socket_path()} 把处理交给后台服务排队执行")
+        self.daemon_checkbox.setEnabled(rename_daemon.is_supported())
+        options_layout.addWidget(self.daemon_checkbox)
+
+        # 递归处理子文件夹，以及按文件名通配符筛选
+        walk_layout = QHBoxLayout()
+        self.recursive_checkbox = QCheckBox("包含子文件夹")
+        self.recursive_checkbox.toggled.connect(self.schedule_preview)
+        walk_layout.addWidget(self.recursive_checkbox)
+        walk_layout.addWidget(QLabel("包含:"))
+        self.include_input = QLineEdit()
+        self.include_input.setPlaceholderText("例如: IMG_*;*.jpg（留空表示全部）")
+        self.include_input.textChanged.connect(self.schedule_preview)
+        walk_layout.addWidget(self.include_input)
+        walk_layout.addWidget(QLabel("排除:"))
+        self.exclude_input = QLineEdit()
+        self.exclude_input.setPlaceholderText("例如: .git;node_modules;*.tmp")
+        self.exclude_input.textChanged.connect(self.schedule_preview)
+        walk_layout.addWidget(self.exclude_input)
+        options_group_layout.addLayout(walk_layout)
+
+        layout.addWidget(options_group)
+
+        # 预览表格
+        preview_group = QGroupBox("预览")
+        preview_layout = QVBoxLayout()
+        preview_group.setLayout(preview_layout)
+
+        self.preview_model = PreviewTableModel(self)
+        self.preview_table = QTableView()
+        self.preview_table.setModel(self.preview_model)
+
+        # 设置表格属性
+        self.preview_table.horizontalHeader().setSectionResizeMode(
+            0, QHeaderView.ResizeMode.Stretch)  # 原文件名自适应
+        self.preview_table.horizontalHeader().setSectionResizeMode(
+            1, QHeaderView.ResizeMode.Stretch)  # 新文件名自适应
+        self.preview_table.horizontalHeader().setSectionResizeMode(
+            2, QHeaderView.ResizeMode.Fixed)  # 状态列固定宽度
+        self.preview_table.setColumnWidth(2, 100)  # 设置状态列宽度
+
+        # 显示行号，固定行高避免逐行计算尺寸
+        self.preview_table.verticalHeader().setVisible(True)
+        self.preview_table.verticalHeader().setDefaultAlignment(
+            Qt.AlignmentFlag.AlignCenter)
+        self.preview_table.verticalHeader().setSectionResizeMode(
+            QHeaderView.ResizeMode.Fixed)
+
+        preview_layout.addWidget(self.preview_table)
+        layout.addWidget(preview_group)
+
+        # 进度条
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        layout.addWidget(self.progress_bar)
+
+        # 操作按钮
+        button_layout = QHBoxLayout()
+        self.start_btn = QPushButton('开始处理')
+        self.start_btn.clicked.connect(self.start_processing)
+        button_layout.addWidget(self.start_btn)
+        # 保存预览为计划文件，之后（或在其他电脑上）再执行
+        export_plan_btn = QPushButton('导出计划...')
+        export_plan_btn.clicked.connect(self.export_plan)
+        button_layout.addWidget(export_plan_btn)
+        self.apply_plan_btn = QPushButton('执行计划文件...')
+        self.apply_plan_btn.clicked.connect(self.apply_plan)
+        button_layout.addWidget(self.apply_plan_btn)
+        layout.addLayout(button_layout)
+
+        # 日志显示
+        log_group = QGroupBox("处理日志")
+        log_layout = QVBoxLayout()
+        log_group.setLayout(log_layout)
+
+        self.log_display = QTextEdit()
+        self.log_display.setReadOnly(True)
+        self.log_display.document().setMaximumBlockCount(self.LOG_MAX_BLOCKS)
+        log_layout.addWidget(self.log_display)
+        layout.addWidget(log_group)
+
+    def setup_history_tab(self, tab):
+        """设置历史记录页面"""
+        layout = QVBoxLayout(tab)
+
+        # 按文件夹筛选
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("筛选文件夹:"))
+        self.history_filter_input = QLineEdit()
+        self.history_filter_input.setPlaceholderText('输入文件夹路径的开头（不区分大小写）...')
+        self.history_filter_input.textChanged.connect(self.load_history)
+        filter_layout.addWidget(self.history_filter_input)
+        layout.addLayout(filter_layout)
+
+        self.history_model = HistoryTableModel(rename_core.HISTORY_STORE, self)
+        self.history_table = QTableView()
+        self.history_table.setModel(self.history_model)
+        self.history_table.setSelectionBehavior(
+            QTableView.SelectionBehavior.SelectRows)
+        self.history_table.verticalHeader().setSectionResizeMode(
+            QHeaderView.ResizeMode.Fixed)
+
+        # 设置表格属性
+        header = self.history_table.horizontalHeader()
+        header.setSectionResizeMode(
+            0, QHeaderView.ResizeMode.ResizeToContents)  # 时间列自适应内容
+        header.setSectionResizeMode(
+            1, QHeaderView.ResizeMode.Stretch)  # 文件夹列拉伸
+        header.setSectionResizeMode(
+            2, QHeaderView.ResizeMode.ResizeToContents)  # 原后缀列自适应内容
+        header.setSectionResizeMode(
+            3, QHeaderView.ResizeMode.ResizeToContents)  # 新后缀列自适应内容
+        header.setSectionResizeMode(
+            4, QHeaderView.ResizeMode.ResizeToContents)  # 操作列自适应内容
+        header.setSectionResizeMode(
+            5, QHeaderView.ResizeMode.ResizeToContents)  # 处理结果列自适应内容
+        for column in HistoryTableModel.METRIC_COLUMNS:
+            header.setSectionResizeMode(
+                column, QHeaderView.ResizeMode.ResizeToContents)  # 性能指标列自适应内容
+
+        # 最近几次处理的吞吐量和耗时趋势，筛选文件夹时只显示该文件夹的记录
+        trend_layout = QHBoxLayout()
+        self.throughput_sparkline = Sparkline("吞吐量", "文件/秒", "#2e7d32")
+        self.elapsed_sparkline = Sparkline("耗时", "秒", "#1565c0")
+        trend_layout.addWidget(self.throughput_sparkline)
+        trend_layout.addWidget(self.elapsed_sparkline)
+        layout.addLayout(trend_layout)
+        self.history_model.modelReset.connect(self.update_history_trends)
+        self.history_model.rowsInserted.connect(self.update_history_trends)
+
+        layout.addWidget(self.history_table)
+
+        # 添加清空历史按钮
+        button_layout = QHBoxLayout()
+
+        refresh_btn = QPushButton("刷新")
+        refresh_btn.clicked.connect(self.load_history)
+        button_layout.addWidget(refresh_btn)
+
+        self.undo_btn = QPushButton("撤销所选操作")
+        self.undo_btn.clicked.connect(self.undo_selected_run)
+        button_layout.addWidget(self.undo_btn)
+
+        export_metrics_btn = QPushButton("导出性能指标...")
+        export_metrics_btn.setToolTip("导出为 Prometheus 文本格式，供 node exporter 的 textfile collector 读取")
+        export_metrics_btn.clicked.connect(self.export_metrics)
+        button_layout.addWidget(export_metrics_btn)
+
+        clear_btn = QPushButton("清空历史")
+        clear_btn.clicked.connect(self.clear_history)
+        clear_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #ff4444;
+                color: white;
+                border: none;
+                padding: 5px;
+                border-radius: 3px;
+            }
+            QPushButton:hover {
+                background-color: #ff6666;
+            }
+            QPushButton:pressed {
+                background-color: #cc0000;
+            }
+        """)
+        button_layout.addWidget(clear_btn)
+
+        layout.addLayout(button_layout)
+
+        # 历史记录在窗口显示后由 StartupWorker 在后台加载
+
+    def load_history(self):
+        """加载历史记录，只读取第一页，其余滚动时再加载"""
+        try:
+            with rename_trace.span("gui.load_history"):
+                self.history_model.reload(self.history_filter_input.text().strip())
+        except Exception as e:
+            QMessageBox.warning(self, "警告", f"加载历史记录失败: {str(e)}")
+
+    def update_history_trends(self):
+        """根据已加载的历史记录更新趋势图"""
+        recent = self.history_model.recent_metrics(self.TREND_RUNS)
+        self.throughput_sparkline.set_values(m.get("files_per_second") for m in recent)
+        self.elapsed_sparkline.set_values(m.get("elapsed") for m in recent)
+
+    def export_metrics(self):
+        """把各文件夹最近一次处理的性能指标导出为 Prometheus 文本格式"""
+        path, _ = QFileDialog.getSaveFileName(
+            self, "导出性能指标", "rename_tools.prom", "Prometheus 文本格式 (*.prom);;所有文件 (*)")
+        if not path:
+            return
+        try:
+            rename_core.export_metrics(path)
+        except Exception as e:
+            QMessageBox.warning(self, "警告", f"导出性能指标失败: {str(e)}")
+            return
+        self.statusBar().showMessage(f'已导出性能指标: {path}')
+
+    def clear_history(self):
+        """清空历史记录"""
+        reply = QMessageBox.question(
+            self,
+            "确认清空",
+            "确定要清空所有历史记录吗？此操作不可恢复。",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            QMessageBox.StandardButton.No
+        )
+
+        if reply == QMessageBox.StandardButton.Yes:
+            try:
+                rename_core.clear_history()
+                self.history_model.reload()
+                QMessageBox.information(self, "成功", "历史记录已清空")
+            except Exception as e:
+                QMessageBox.warning(self, "警告", f"清空历史记录失败: {str(e)}")
+
+    def undo_selected_run(self):
+        """撤销历史表格中选中的处理"""
+        entry = self.history_model.entry(self.history_table.currentIndex().row())
+        if entry is None:
+            QMessageBox.warning(self, "警告", "请先选择要撤销的记录!")
+            return
+
+        run_id = entry.get("run_id")
+        if not run_id or entry.get("operation") == "undo":
+            QMessageBox.warning(self, "警告", "该记录没有重命名日志，无法撤销!")
+            return
+
+        reply = QMessageBox.question(
+            self,
+            "确认撤销",
+            f"确定要撤销 {entry['timestamp']} 在\n{entry['directory']}\n中的处理吗？",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            QMessageBox.StandardButton.No
+        )
+        if reply == QMessageBox.StandardButton.Yes:
+            self.start_undo(run_id)
+
+    def start_undo(self, run_id, after_undo=None):
+        """在后台线程中撤销一次处理"""
+        if self.undo_worker and self.undo_worker.isRunning():
+            QMessageBox.warning(self, "警告", "正在撤销其他操作，请稍候!")
+            return
+
+        self.log_display.clear()
+        self.log_sink = rename_core.LogSink()
+        self.undo_btn.setEnabled(False)
+        self.statusBar().showMessage('撤销中...')
+
+        self.undo_worker = UndoWorker(run_id, self.log_sink)
+        self.undo_worker.finished.connect(self.undo_finished)
+        if after_undo:
+            self.undo_worker.finished.connect(after_undo)
+        self.log_timer.start()
+        self.undo_worker.start()
+
+    def undo_finished(self, undone_count):
+        """撤销完成的回调"""
+        self.log_timer.stop()
+        self.flush_log()
+        self.undo_btn.setEnabled(True)
+        self.statusBar().showMessage(f'撤销完成! 成功撤销 {undone_count} 个文件')
+        self.load_history()
+        self.schedule_preview()
+
+    def check_interrupted_runs(self, runs):
+        """对被中断（例如程序崩溃）的处理，询问继续、回滚还是忽略"""
+        for header in runs:
+            run_id = header["run_id"]
+            params = header["params"]
+            box = QMessageBox(self)
+            box.setIcon(QMessageBox.Icon.Warning)
+            box.setWindowTitle("发现未完成的处理")
+            box.setText(
+                f"{header['timestamp']} 在\n{header['directory']}\n"
+                f"中的处理 ({params['old_suffix']} → {params['new_suffix'] or '移除'}) 没有正常结束。")
+            resume_btn = box.addButton("继续处理", QMessageBox.ButtonRole.AcceptRole)
+            rollback_btn = box.addButton("回滚", QMessageBox.ButtonRole.DestructiveRole)
+            box.addButton("忽略", QMessageBox.ButtonRole.RejectRole)
+            box.exec()
+
+            clicked = box.clickedButton()
+            if clicked is rollback_btn:
+                self.start_undo(
+                    run_id, lambda _, run_id=run_id: rename_journal.mark_recovered(run_id))
+                # 一次只处理一个中断的处理，其余的下次启动时再询问
+                return
+            rename_journal.mark_recovered(run_id)
+            if clicked is resume_btn:
+                # 用原参数重新处理，已完成的文件不再匹配原后缀
+                self.path_input.setText(header["directory"])
+                self.operation_mode.setCurrentIndex(
+                    self.operation_mode.findData(params["operation"]))
+                if params["operation"] == "rules":
+                    self.set_rules(params["rules"])
+                else:
+                    self.old_suffix_input.setText(params["old_suffix"])
+                    self.new_suffix_input.setText(params["new_suffix"])
+                self.recursive_checkbox.setChecked(params.get("recursive", False))
+                self.collision_mode.setCurrentIndex(max(0, self.collision_mode.findData(
+                    params.get("collision", rename_core.COLLISION_SKIP))))
+                self.include_input.setText(";".join(params.get("include", [])))
+                self.exclude_input.setText(";".join(params.get("exclude", [])))
+                self.start_processing()
+                return
+
+    def on_mode_changed(self, text):
+        """处理操作模式改变"""
+        # 根据模式显示/隐藏新后缀输入框和规则编辑区域
+        mode = self.operation_mode.currentData()
+        is_replace_mode = mode == "replace"
+        self.new_suffix_container.setVisible(is_replace_mode)
+        self.old_suffix_container.setVisible(mode != "rules")
+        self.rules_container.setVisible(mode == "rules")
+
+        # 按内容修正时原后缀是可选的筛选条件
+        if mode == "sniff":
+            self.old_suffix_label.setText("只检查后缀:")
+            self.old_suffix_input.setPlaceholderText('留空检查所有文件，例如: .jpg;.png')
+        else:
+            self.old_suffix_label.setText("原后缀:")
+            self.old_suffix_input.setPlaceholderText('例如: .pdf')
+
+        # 更新新后缀输入框的提示文本
+        if is_replace_mode:
+            self.new_suffix_input.setPlaceholderText('例如: .txt')
+
+        # 清空新后缀输入
+        if not is_replace_mode:
+            self.new_suffix_input.clear()
+
+        # 刷新预览
+        self.schedule_preview()
+
+    def add_rule_row(self):
+        """在规则表格末尾添加一行空规则"""
+        row = self.rules_table.rowCount()
+        self.rules_table.blockSignals(True)
+        self.rules_table.insertRow(row)
+        self.rules_table.setItem(row, 0, QTableWidgetItem(""))
+        self.rules_table.setItem(row, 1, QTableWidgetItem(""))
+        self.rules_table.blockSignals(False)
+        self.rules_table.setCurrentCell(row, 0)
+        self.rules_table.editItem(self.rules_table.item(row, 0))
+
+    def remove_rule_rows(self):
+        """删除选中的规则"""
+        rows = sorted({index.row() for index in self.rules_table.selectedIndexes()},
+                      reverse=True)
+        for row in rows:
+            self.rules_table.removeRow(row)
+        self.schedule_preview()
+
+    def set_rules(self, pairs):
+        """用 (原后缀, 新后缀) 列表填充规则表格"""
+        self.rules_table.blockSignals(True)
+        self.rules_table.setRowCount(len(pairs))
+        for row, (old_suffix, new_suffix) in enumerate(pairs):
+            self.rules_table.setItem(row, 0, QTableWidgetItem(old_suffix))
+            self.rules_table.setItem(row, 1, QTableWidgetItem(new_suffix))
+        self.rules_table.blockSignals(False)
+        self.schedule_preview()
+
+    def load_rules_file(self):
+        """从规则文件加载规则"""
+        path, _ = QFileDialog.getOpenFileName(
+            self, "选择规则文件", "", "规则文件 (*.txt *.rules);;所有文件 (*)")
+        if not path:
+            return
+        try:
+            self.set_rules(rename_core.load_rules(path))
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "警告", f"加载规则文件失败: {str(e)}")
+
+    def collect_name_filter(self):
+        """读取包含/排除通配符，返回 NameFilter"""
+        return rename_walk.NameFilter(
+            rename_walk.split_patterns(self.include_input.text()),
+            rename_walk.split_patterns(self.exclude_input.text()))
+
+    def collect_content_rules(self):
+        """按原后缀输入框中的筛选后缀创建按内容推断后缀的规则集"""
+        return rename_sniff.ContentRules(
+            self.path_input.text().strip(),
+            rename_walk.split_patterns(self.old_suffix_input.text()),
+            cache=self.sniff_cache)
+
+    def collect_rules(self):
+        """读取规则表格，返回 RuleSet，规则无效时抛出 ValueError"""
+        pairs = []
+        for row in range(self.rules_table.rowCount()):
+            old_item = self.rules_table.item(row, 0)
+            new_item = self.rules_table.item(row, 1)
+            old_suffix = old_item.text().strip() if old_item else ""
+            new_suffix = new_item.text().strip() if new_item else ""
+            if old_suffix:
+                pairs.append((old_suffix, new_suffix))
+        return rename_core.RuleSet(pairs)
+
+    def browse_folder(self):
+        """打开文件夹选择对话框"""
+        current_dir = self.path_input.text() or os.path.expanduser("~")
+        folder = QFileDialog.getExistingDirectory(
+            self,
+            "选择文件夹",
+            current_dir,
+            QFileDialog.Option.ShowDirsOnly
+        )
+        if folder:
+            self.path_input.setText(folder)
+            # 自动预览会通过 path_input 的 textChanged 信号触发
+
+    def schedule_preview(self):
+        """输入变化后延迟刷新预览，连续输入只触发一次"""
+        self.preview_timer.start()
+
+    def refresh_preview(self):
+        """自动刷新预览"""
+        mode = self.operation_mode.currentData()
+        # 如果没有选择目录或没有输入原后缀（规则），不进行预览
+        if mode == "rules":
+            has_suffix = any(self.rules_table.item(row, 0) and self.rules_table.item(row, 0).text().strip()
+                             for row in range(self.rules_table.rowCount()))
+        elif mode == "sniff":
+            # 按内容修正时不需要输入后缀
+            has_suffix = True
+        else:
+            has_suffix = bool(self.old_suffix_input.text().strip())
+        if not self.path_input.text().strip() or not has_suffix:
+            self.preview_model.clear()
+            return
+
+        # 在替换模式下，不需要等待新后缀就可以预览
+        if mode == "replace" and not self.new_suffix_input.text().strip():
+            # 显示原文件，新文件名暂时保持为空
+            self.preview_changes(show_new_name=False)
+        else:
+            # 正常预览
+            self.preview_changes(show_new_name=True)
+
+    def preview_changes(self, show_new_name=True):
+        """预览变更"""
+        self.preview_model.clear()
+        self.log_display.clear()
+        self.progress_bar.setVisible(False)
+
+        # 完整刷新期间不再增量更新，已开始的增量更新结果会被忽略
+        self.unwatch_directory()
+        if self.update_worker and self.update_worker.isRunning():
+            self.stale_preview_workers.append(self.update_worker)
+        self.update_worker = None
+
+        # 如果存在正在运行的预览线程，通知它停止，不在界面线程等待
+        if self.preview_worker and self.preview_worker.isRunning():
+            self.preview_worker.quit()
+            self.stale_preview_workers.append(self.preview_worker)
+        self.stale_preview_workers = [
+            w for w in self.stale_preview_workers if w.isRunning()]
+
+        # 创建预览线程
+        operation_mode = self.operation_mode.currentData()
+        rules = None
+        if operation_mode == "rules":
+            try:
+                rules = self.collect_rules()
+            except ValueError as e:
+                self.preview_worker = None
+                self.statusBar().showMessage(f'规则无效: {str(e)}')
+                return
+        elif operation_mode == "sniff":
+            rules = self.collect_content_rules()
+        self.preview_worker = RenameWorker(
+            self.path_input.text().strip(),
+            self.old_suffix_input.text().strip(),
+            self.new_suffix_input.text().strip(),
+            operation_mode,
+            preview_only=True,
+            show_new_name=show_new_name,
+            rules=rules,
+            snapshot_cache=self.snapshot_cache,
+            recursive=self.recursive_checkbox.isChecked(),
+            name_filter=self.collect_name_filter(),
+            collision=self.collision_mode.currentData()
+        )
+
+        self.preview_worker.progress.connect(self.update_preview_status)
+        self.preview_worker.preview_batch.connect(self.append_preview_batch)
+        self.preview_worker.preview_ready.connect(self.update_preview_table)
+        self.preview_worker.start()
+
+    def update_preview_status(self, message):
+        """在状态栏显示预览线程的扫描进度"""
+        if self.sender() is not self.preview_worker:
+            return
+        self.statusBar().showMessage(message)
+
+    def append_preview_batch(self, chunk, total_rows):
+        """扫描过程中追加一批预览结果"""
+        # 忽略已被取代的预览线程发来的结果
+        if self.sender() is not self.preview_worker:
+            return
+        with rename_trace.span("gui.append_preview_batch", rows=len(chunk)):
+            self.preview_model.append_plan(chunk)
+        self.statusBar().showMessage(f'预览中... 已找到 {total_rows} 个文件')
+
+    def update_preview_table(self, plan):
+        """更新预览表格，数据已在后台线程排序并分好组"""
+        # 忽略已被取代的预览线程发来的结果
+        if self.sender() is not self.preview_worker:
+            return
+        with rename_trace.span("gui.update_preview_table", rows=len(plan)):
+            self.preview_model.set_plan(plan)
+        self.statusBar().showMessage(f'预览: 共 {len(plan)} 个文件')
+        self.watch_directory()
+
+    def watch_directory(self):
+        """开始监视刚完成预览的文件夹（递归模式不监视）"""
+        self.unwatch_directory()
+        engine = self.preview_worker.engine
+        if engine.recursive or engine.snapshot is None:
+            return
+        self.dir_watcher.addPath(engine.directory)
+        # 列目录之后、开始监视之前的变化不会触发信号，这里补查一次
+        try:
+            if os.stat(engine.directory).st_mtime_ns != engine.snapshot.mtime_ns:
+                self.watch_timer.start()
+        except OSError:
+            pass
+
+    def unwatch_directory(self):
+        self.watch_timer.stop()
+        watched = self.dir_watcher.directories()
+        if watched:
+            self.dir_watcher.removePaths(watched)
+
+    def on_directory_changed(self, path):
+        """文件夹内容变化，连续的变化只触发一次更新"""
+        self.watch_timer.start()
+
+    def update_preview_incrementally(self):
+        """在后台计算文件夹的变化，完成后合并到预览中"""
+        if self.worker and self.worker.isRunning():
+            # 处理完成后会再触发一次
+            return
+        if self.preview_worker is None or self.preview_worker.isRunning():
+            return
+        if self.update_worker and self.update_worker.isRunning():
+            self.watch_timer.start()
+            return
+        self.update_worker = PreviewUpdateWorker(
+            self.preview_worker.engine, self.snapshot_cache)
+        self.update_worker.diff_ready.connect(self.apply_preview_diff)
+        self.update_worker.start()
+
+    def apply_preview_diff(self, diff):
+        """合并后台计算出的变化，变化太多时完整刷新"""
+        if self.sender() is not self.update_worker:
+            return
+        if diff is None:
+            self.refresh_preview()
+            return
+        snapshot, chunk, removed, recheck = diff
+        scroll_bar = self.preview_table.verticalScrollBar()
+        scroll = scroll_bar.value()
+        with rename_trace.span("gui.apply_preview_diff", added=len(chunk), removed=len(removed)):
+            self.preview_model.apply_diff(chunk, removed, recheck)
+        self.update_worker.engine.adopt_snapshot(snapshot)
+        scroll_bar.setValue(scroll)
+        self.statusBar().showMessage(
+            f'预览已更新: 新增 {len(chunk)} 个, 移除 {len(removed)} 个, '
+            f'共 {self.preview_model.rowCount()} 个文件')
+
+    def validate_inputs(self):
+        """验证输入"""
+        directory = self.path_input.text().strip()
+        old_suffix = self.old_suffix_input.text().strip()
+        new_suffix = self.new_suffix_input.text().strip()
+        operation_mode = self.operation_mode.currentData()
+
+        if not directory:
+            QMessageBox.warning(self, "警告", "请选择要处理的文件夹!")
+            return False
+
+        if not os.path.exists(directory):
+            QMessageBox.warning(self, "警告", "所选文件夹不存在!")
+            return False
+
+        if operation_mode == "rules":
+            try:
+                if not self.collect_rules():
+                    QMessageBox.warning(self, "警告", "请至少添加一条规则!")
+                    return False
+            except ValueError as e:
+                QMessageBox.warning(self, "警告", f"规则无效: {str(e)}")
+                return False
+            return True
+
+        if operation_mode == "sniff":
+            return True
+
+        if not old_suffix:
+            QMessageBox.warning(self, "警告", "请输入要处理的文件后缀!")
+            return False
+
+        if operation_mode == "replace" and not new_suffix:
+            QMessageBox.warning(self, "警告", "请输入新的文件后缀!")
+            return False
+
+        return True
+
+    def export_plan(self):
+        """把当前预览保存为计划文件"""
+        worker = self.preview_worker
+        if worker is None or worker.isRunning() or not self.preview_model.rowCount():
+            QMessageBox.warning(self, "警告", "请等待预览完成后再导出计划!")
+            return
+        if not worker.engine.show_new_name:
+            QMessageBox.warning(self, "警告", "请输入新的文件后缀!")
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self, "导出计划", "rename_plan.jsonl", "重命名计划 (*.jsonl);;所有文件 (*)")
+        if not path:
+            return
+        try:
+            count = write_plan(path, self.preview_model.plan, worker.engine.directory,
+                               worker.engine.job_params())
+        except OSError as e:
+            QMessageBox.warning(self, "警告", f"导出计划失败: {str(e)}")
+            return
+        self.statusBar().showMessage(f'已导出计划: {count} 个文件')
+
+    def apply_plan(self):
+        """选择计划文件并执行，文件夹输入框有内容时代替计划中记录的文件夹"""
+        path, _ = QFileDialog.getOpenFileName(
+            self, "选择计划文件", "", "重命名计划 (*.jsonl);;所有文件 (*)")
+        if not path:
+            return
+        try:
+            header = read_plan_header(path)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "警告", f"无法读取计划文件: {str(e)}")
+            return
+        directory = self.path_input.text().strip() or header["directory"]
+        reply = QMessageBox.question(
+            self, "执行计划",
+            f"将按 {header['created']} 生成的计划重命名\n{directory}\n中的文件，是否继续?")
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        self.launch_worker(plan_file=path, directory=directory)
+
+    def start_processing(self):
+        """开始处理文件"""
+        if not self.validate_inputs():
+            return
+        self.launch_worker()
+
+    def launch_worker(self, plan_file=None, directory=None):
+        """启动处理线程，plan_file 不为空时按计划文件执行"""
+        # 清空日志显示
+        self.log_display.clear()
+
+        # 显示并重置进度条
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(0)
+
+        # 禁用按钮,防止重复操作
+        self.start_btn.setEnabled(False)
+        self.apply_plan_btn.setEnabled(False)
+        self.statusBar().showMessage('处理中...')
+
+        # 获取操作模式
+        operation_mode = self.operation_mode.currentData()
+        rules = None
+        if operation_mode == "rules" and not plan_file:
+            rules = self.collect_rules()
+        elif operation_mode == "sniff" and not plan_file:
+            rules = self.collect_content_rules()
+
+        # 如存在正在运行的线程，先停止它
+        if self.worker and self.worker.isRunning():
+            with rename_trace.span("gui.wait_worker"):
+                self.worker.quit()
+                self.worker.wait()
+        self.log_sink = rename_core.LogSink()
+
+        daemon_client = None
+        if self.daemon_checkbox.isChecked():
+            daemon_client = rename_daemon.DaemonClient()
+            if not daemon_client.available():
+                daemon_client = None
+                self.log_sink.write("后台服务没有运行，改为在本程序中处理")
+
+        # 创建并启动工作线程
+        self.worker = RenameWorker(
+            directory or self.path_input.text().strip(),
+            self.old_suffix_input.text().strip(),
+            self.new_suffix_input.text().strip(),
+            operation_mode,
+            rules=rules,
+            # 实际处理不读取缓存，只在处理后使其失效
+            snapshot_cache=self.snapshot_cache,
+            log_sink=self.log_sink,
+            # 备份在工作线程中创建，不会阻塞界面
+            backup_mode=self.backup_mode.currentData() if self.backup_checkbox.isChecked() else None,
+            workers=self.workers_input.value(),
+            recursive=self.recursive_checkbox.isChecked(),
+            name_filter=self.collect_name_filter(),
+            plan_file=plan_file,
+            collision=self.collision_mode.currentData(),
+            daemon_client=daemon_client
+        )
+        self.worker.progress_value.connect(self.update_progress_value)
+        self.worker.finished.connect(self.process_finished)
+        self.log_timer.start()
+        self.worker.start()
+
+    def update_progress_value(self, value):
+        """更新进度条，总数未知时显示为忙碌状态"""
+        if value < 0:
+            self.progress_bar.setRange(0, 0)
+        else:
+            self.progress_bar.setRange(0, 100)
+            self.progress_bar.setValue(value)
+
+    def update_log(self, message):
+        """更新日志显示"""
+        self.log_display.append(message)
+
+    def flush_log(self):
+        """把缓冲区中的日志一次性显示到界面"""
+        if not self.log_sink:
+            return
+        lines, dropped = self.log_sink.drain()
+        if dropped:
+            lines.insert(0, f"... 省略 {dropped} 条日志，完整日志见 {rename_core.LOG_FILE}")
+        if lines:
+            self.log_display.append("\n".join(lines))
+
+    def process_finished(self, success_count):
+        """处理完成的回调"""
+        self.log_timer.stop()
+        self.flush_log()
+        self.update_progress_value(100)
+        # 处理期间忽略了文件夹变化，现在把重命名的结果合并到预览中
+        if self.dir_watcher.directories():
+            self.watch_timer.start()
+        self.start_btn.setEnabled(True)
+        self.apply_plan_btn.setEnabled(True)
+
+        # 刷新历史记录
+        self.load_history()
+        rename_trace.instant("gui.process_finished", success=success_count)
+
+        abort_reason = self.worker.engine.abort_reason if self.worker else None
+        if abort_reason:
+            self.statusBar().showMessage(f'已中止! 成功处理 {success_count} 个文件')
+            QMessageBox.warning(
+                self,
+                "已中止",
+                f"{abort_reason}\n中止前成功处理 {success_count} 个文件"
+            )
+            return
+
+        self.statusBar().showMessage(f'完成! 成功处理 {success_count} 个文件')
+        QMessageBox.information(
+            self,
+            "完成",
+            f"处理完成!\n成功处理 {success_count} 个文件"
+        )
+
+
+def run_gui():
+    """启动图形界面"""
+    app = QApplication(sys.argv)
+
+    # 设置应用样式
+    app.setStyle('Fusion')
+
+    # 设置了 RENAME_TRACE 时从启动开始记录性能跟踪
+    rename_trace.enable_from_env()
+    window = MainWindow()
+    if os.environ.get(STARTUP_PROBE_ENV):
+        # 启动时间测量（benchmarks/bench_startup.py）: 第一次绘制后输出标记，
+        # 再关闭窗口退出（closeEvent 会等待后台线程结束）
+        window.first_painted.connect(lambda: (print(STARTUP_PROBE_MARK, flush=True),
+                                              QTimer.singleShot(0, window.close)))
+    window.show()
+
+    return app.exec()
@@ -0,0 +1,198 @@
+"""基于 SQLite 的操作历史
+
+历史记录保存在 rename_history.db 中，按时间和文件夹建立索引，不限条数。
+按文件夹筛选是不区分大小写的前缀匹配，可以使用文件夹索引（COLLATE NOCASE）。
+首次打开时会把旧版 rename_history.json 中的记录导入数据库。每条记录的
+性能指标（rename_metrics.RunMetrics.to_dict）以 JSON 保存在 metrics 列中。
+"""
+import os
+import json
+import sqlite3
+import threading
+
+
+HISTORY_DB = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "rename_history.db")
+LEGACY_HISTORY_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "rename_history.json")
+
+# 历史记录的字段，与 RenameEngine.history_entry 的键一致
+COLUMNS = ("run_id", "timestamp", "directory", "old_suffix", "new_suffix",
+           "operation", "success_count", "total_files", "metrics")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT,
+    timestamp TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    old_suffix TEXT,
+    new_suffix TEXT,
+    operation TEXT,
+    success_count INTEGER,
+    total_files INTEGER,
+    metrics TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history (timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_history_directory_nocase
+    ON history (directory COLLATE NOCASE, timestamp);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _like_pattern(text):
+    """把筛选文本转换为 LIKE 前缀匹配模式
+
+    开头没有通配符，SQLite 可以把它转换为文件夹索引上的范围查询。
+    """
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{escaped}%"
+
+
+class HistoryStore:
+    """操作历史数据库
+
+    每次调用都使用独立的连接，工作线程写入和界面线程读取互不影响。
+    """
+
+    def __init__(self, path=HISTORY_DB, legacy_file=LEGACY_HISTORY_FILE):
+        self.path = path
+        self.legacy_file = legacy_file
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(SCHEMA)
+                    self._migrate(conn)
+                    self._import_legacy(conn)
+                    self._initialized = True
+        return conn
+
+    def _migrate(self, conn):
+        """为旧版本创建的数据库补充新增的列"""
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(history)")}
+        if "metrics" not in existing:
+            with conn:
+                conn.execute("ALTER TABLE history ADD COLUMN metrics TEXT")
+        # 旧的文件夹索引区分大小写，无法用于 LIKE 筛选
+        with conn:
+            conn.execute("DROP INDEX IF EXISTS idx_history_directory")
+
+    def _import_legacy(self, conn):
+        """导入旧版 JSON 历史记录，只导入一次"""
+        with conn:
+            done = conn.execute(
+                "SELECT value FROM meta WHERE key = 'legacy_imported'").fetchone()
+            if done:
+                return
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('legacy_imported', '1')")
+            if not self.legacy_file or not os.path.exists(self.legacy_file):
+                return
+            try:
+                with open(self.legacy_file, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"导入旧历史记录失败: {str(e)}")
+                return
+            # JSON 中新记录在前，按时间从旧到新插入
+            for entry in reversed(entries):
+                self._insert(conn, entry)
+
+    def _insert(self, conn, entry):
+        values = [entry.get(column) for column in COLUMNS]
+        if values[-1] is not None:
+            values[-1] = json.dumps(values[-1], ensure_ascii=False)
+        conn.execute(
+            f"INSERT INTO history ({', '.join(COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(COLUMNS))})", values)
+
+    def _entries(self, rows):
+        """把查询结果转换为字典列表，解析指标 JSON"""
+        entries = []
+        for row in rows:
+            entry = dict(row)
+            if entry["metrics"]:
+                try:
+                    entry["metrics"] = json.loads(entry["metrics"])
+                except ValueError:
+                    entry["metrics"] = None
+            entries.append(entry)
+        return entries
+
+    def _where(self, directory_filter):
+        if directory_filter:
+            return "WHERE directory LIKE ? ESCAPE '\\'", [_like_pattern(directory_filter)]
+        return "", []
+
+    def add(self, entry):
+        """添加一条历史记录"""
+        conn = self._connect()
+        try:
+            with conn:
+                self._insert(conn, entry)
+        finally:
+            conn.close()
+
+    def count(self, directory_filter=""):
+        """符合筛选条件的记录数"""
+        where, params = self._where(directory_filter)
+        conn = self._connect()
+        try:
+            return conn.execute(
+                f"SELECT COUNT(*) FROM history {where}", params).fetchone()[0]
+        finally:
+            conn.close()
+
+    def page(self, offset, limit, directory_filter=""):
+        """按时间从新到旧读取一页记录，返回字典列表"""
+        where, params = self._where(directory_filter)
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM history {where} "
+                "ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]).fetchall()
+            return self._entries(rows)
+        finally:
+            conn.close()
+
+    def latest_runs(self):
+        """每个文件夹每种操作最近一次的记录，按时间从新到旧，用于导出指标"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM history WHERE id IN "
+                "(SELECT MAX(id) FROM history GROUP BY directory, operation) "
+                "ORDER BY timestamp DESC, id DESC").fetchall()
+            return self._entries(rows)
+        finally:
+            conn.close()
+
+    def last_directory(self):
+        """最近一次处理的文件夹，没有记录时返回 None"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT directory FROM history "
+                "ORDER BY timestamp DESC, id DESC LIMIT 1").fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def clear(self):
+        """删除所有历史记录"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM history")
+        finally:
+            conn.close()
@@ -0,0 +1,306 @@
+"""重命名日志（journal）
+
+每次处理对应 journal 目录下的一个 JSON Lines 文件，只追加写入：
+
+    {"op": "begin", "run_id": ..., "directory": ..., "params": {...}}
+    {"op": "rename", "seq": 0, "old": "a.txt", "new": "a.md"}   重命名之前写入
+    {"op": "done", "seq": 0}                                      重命名成功之后写入
+    {"op": "failed", "seq": 1, "error": "..."}
+    {"op": "undone", "seq": 0}                                    撤销之后写入
+    {"op": "end", "success_count": 1}
+
+"rename" 记录在调用 os.rename 之前写入操作系统，即使进程崩溃也不会丢失；
+fsync 按批进行，不会为每个文件付出一次磁盘同步的代价。崩溃后只有
+"rename" 而没有结果的记录，通过检查文件是否存在来判断是否已经完成。
+
+写入日志的进程在日志打开期间持有它的文件锁，进程退出（包括崩溃）时
+系统自动释放。其他进程据此区分正在进行的处理（例如后台服务或命令行
+正在执行）和真正中断的处理。
+"""
+import os
+import json
+import uuid
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+from rename_fs import DirectoryRenamer
+
+
+JOURNAL_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "journal")
+FSYNC_INTERVAL = 1000  # 每写入多少条记录同步一次磁盘
+
+# 单个文件的状态
+STATE_PENDING = "pending"  # 已记录意图，结果未知
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+STATE_UNDONE = "undone"
+
+# Windows 的字节范围锁是强制的，锁住文件末尾之外的一个字节，不影响读取
+_LOCK_OFFSET = 0x7FFFFFFF
+
+
+def new_run_id():
+    """生成处理编号: 时间 + 随机后缀"""
+    return datetime.now().strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:8]
+
+
+def journal_path(run_id, journal_dir=JOURNAL_DIR):
+    return os.path.join(journal_dir, f"{run_id}.jsonl")
+
+
+def _try_lock(path):
+    """尝试以非阻塞方式锁住日志，成功时返回持有锁的文件描述符，否则返回 None
+
+    不支持文件锁的平台上总是返回 None；无法打开文件时抛出 OSError。
+    """
+    if fcntl is None and msvcrt is None:
+        return None
+    fd = os.open(path, os.O_RDWR)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            os.lseek(fd, _LOCK_OFFSET, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _unlock(fd):
+    """释放 _try_lock 获得的锁"""
+    if fd is None:
+        return
+    try:
+        if fcntl is None:
+            os.lseek(fd, _LOCK_OFFSET, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    except OSError:
+        pass
+    finally:
+        # flock 随文件描述符关闭释放
+        os.close(fd)
+
+
+def writer_alive(path):
+    """是否有进程正在写入该日志；不支持文件锁的平台上总是返回 False"""
+    if fcntl is None and msvcrt is None:
+        return False
+    try:
+        fd = _try_lock(path)
+    except OSError:
+        return False
+    if fd is None:
+        return True
+    _unlock(fd)
+    return False
+
+
+class RenameJournal:
+    """只追加写入的重命名日志"""
+
+    def __init__(self, path, fsync_interval=FSYNC_INTERVAL):
+        self.path = path
+        self.run_id = os.path.splitext(os.path.basename(path))[0]
+        self.fsync_interval = fsync_interval
+        self._file = open(path, 'a', encoding='utf-8')
+        # 打开期间持有锁，表明处理仍在进行；已被其他进程持有时（例如撤销
+        # 正在进行的处理）不影响写入
+        try:
+            self._lock_fd = _try_lock(path)
+        except OSError:
+            self._lock_fd = None
+        self._unsynced = 0
+        self._next_seq = 0
+
+    @classmethod
+    def create(cls, directory, params, run_id=None, journal_dir=JOURNAL_DIR):
+        """为一次新的处理创建日志并写入开始记录"""
+        os.makedirs(journal_dir, exist_ok=True)
+        run_id = run_id or new_run_id()
+        journal = cls(journal_path(run_id, journal_dir))
+        journal._write({
+            "op": "begin",
+            "run_id": run_id,
+            "directory": os.path.abspath(directory),
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "params": params
+        }, flush=True)
+        return journal
+
+    def _write(self, record, flush=False):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_interval:
+            self.sync()
+        elif flush:
+            self._file.flush()
+
+    def sync(self):
+        """把缓冲的记录写入磁盘"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def record_rename(self, old_name, new_name):
+        """在重命名之前记录意图，返回记录序号"""
+        seq = self._next_seq
+        self._next_seq += 1
+        # 写入操作系统后才能执行重命名，保证崩溃后可以找到这条记录
+        self._write({"op": "rename", "seq": seq,
+                    "old": old_name, "new": new_name}, flush=True)
+        return seq
+
+    def record_done(self, seq):
+        self._write({"op": "done", "seq": seq})
+
+    def record_failed(self, seq, error):
+        self._write({"op": "failed", "seq": seq, "error": error})
+
+    def record_undone(self, seq):
+        self._write({"op": "undone", "seq": seq})
+
+    def close(self, success_count=None):
+        """写入结束记录并关闭日志；success_count 为 None 时只关闭"""
+        if success_count is not None:
+            self._write({"op": "end", "success_count": success_count})
+        self.sync()
+        self._file.close()
+        _unlock(self._lock_fd)
+        self._lock_fd = None
+
+
+def read_journal(path):
+    """读取日志，返回 (开始记录, 是否已结束, {序号: 条目})
+
+    条目为 {"old", "new", "state"} 字典。崩溃时最后一行可能不完整，
+    会被忽略。
+    """
+    header = None
+    finished = False
+    entries = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            op = record.get("op")
+            if op == "begin":
+                header = record
+            elif op == "rename":
+                entries[record["seq"]] = {
+                    "old": record["old"], "new": record["new"],
+                    "state": STATE_PENDING}
+            elif op in ("done", "failed", "undone"):
+                entry = entries.get(record["seq"])
+                if entry is not None:
+                    entry["state"] = op
+            elif op in ("end", "recovered"):
+                finished = True
+    return header, finished, entries
+
+
+def read_header(run_id, journal_dir=JOURNAL_DIR):
+    """只读取日志的开始记录"""
+    with open(journal_path(run_id, journal_dir), 'r', encoding='utf-8') as f:
+        return json.loads(f.readline())
+
+
+def resolve_pending(directory, entry):
+    """判断结果未知的重命名是否已经完成"""
+    old_exists = os.path.lexists(os.path.join(directory, entry["old"]))
+    new_exists = os.path.lexists(os.path.join(directory, entry["new"]))
+    return STATE_DONE if new_exists and not old_exists else STATE_FAILED
+
+
+def incomplete_runs(journal_dir=JOURNAL_DIR):
+    """返回没有正常结束（例如程序崩溃）的处理的开始记录列表
+
+    写入进程仍然持有锁的日志属于正在进行的处理，不会返回。
+    """
+    if not os.path.isdir(journal_dir):
+        return []
+    runs = []
+    for name in sorted(os.listdir(journal_dir)):
+        if not name.endswith(".jsonl"):
+            continue
+        try:
+            header, finished, _ = read_journal(os.path.join(journal_dir, name))
+        except OSError:
+            continue
+        if header and not finished and not writer_alive(os.path.join(journal_dir, name)):
+            runs.append(header)
+    return runs
+
+
+def mark_recovered(run_id, journal_dir=JOURNAL_DIR):
+    """标记中断的处理已恢复（继续或回滚之后）"""
+    journal = RenameJournal(journal_path(run_id, journal_dir))
+    journal._write({"op": "recovered",
+                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+    journal.close()
+
+
+def undo_run(run_id, on_progress=None, only=None, journal_dir=JOURNAL_DIR, metrics=None):
+    """撤销一次处理，返回 (成功撤销数量, 需要撤销的数量)
+
+    按相反顺序把已完成的重命名改回原文件名，并在日志中追加 "undone"
+    记录，重复撤销不会重复操作。only 为原文件名集合时只撤销其中的文件。
+    设置了 metrics（rename_metrics.RunMetrics）时记录重命名次数和错误。
+    """
+    def report(message):
+        if on_progress:
+            on_progress(message)
+
+    path = journal_path(run_id, journal_dir)
+    header, _, entries = read_journal(path)
+    if header is None:
+        raise ValueError(f"日志不完整: {path}")
+    directory = header["directory"]
+
+    journal = RenameJournal(path)
+    renamer = DirectoryRenamer(directory)
+    undone_count = 0
+    total = 0
+    try:
+        for seq in sorted(entries, reverse=True):
+            entry = entries[seq]
+            if only is not None and entry["old"] not in only:
+                continue
+            state = entry["state"]
+            if state == STATE_PENDING:
+                state = resolve_pending(directory, entry)
+            if state != STATE_DONE:
+                continue
+
+            total += 1
+            try:
+                if metrics is not None:
+                    metrics.count("rename")
+                renamer.rename(entry["new"], entry["old"])
+                journal.record_undone(seq)
+                undone_count += 1
+                report(f"已撤销: {entry['new']} -> {entry['old']}")
+            except FileExistsError as e:
+                if metrics is not None:
+                    metrics.error(e)
+                report(f"警告: '{entry['old']}' 已存在，无法撤销")
+            except OSError as e:
+                if metrics is not None:
+                    metrics.error(e)
+                report(f"错误: 无法撤销 '{entry['new']}': {str(e)}")
+    finally:
+        renamer.close()
+        journal.close()
+    return undone_count, total
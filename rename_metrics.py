@@ -0,0 +1,242 @@
+"""每次处理的性能指标
+
+RunMetrics 在处理过程中累计各阶段耗时、系统调用次数和按 errno 分类的
+错误数，结束后与操作历史一起保存，用于观察处理是否变慢、哪些挂载点
+是瓶颈。历史记录也可以导出为 Prometheus 文本格式，供 node exporter 的
+textfile collector 读取:
+
+    python rename_files.py --export-metrics /var/lib/node_exporter/textfile/rename.prom
+
+设置 RENAME_METRICS_TEXTFILE 为 .prom 文件路径时，每次保存历史记录后
+自动重新导出。
+"""
+import os
+import sys
+import errno
+import time
+import threading
+from contextlib import contextmanager
+
+
+TEXTFILE_ENV = "RENAME_METRICS_TEXTFILE"
+METRIC_PREFIX = "rename_tools"
+
+
+def peak_memory_bytes():
+    """当前进程的峰值内存（常驻集），无法获取时返回 None
+
+    这是整个进程的峰值，图形界面中多次处理时只会增长。
+    """
+    try:
+        import resource
+    except ImportError:
+        return _windows_peak_memory()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位是 KB，macOS 上是字节
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _windows_peak_memory():
+    if sys.platform != "win32":
+        return None
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t),
+                    ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t),
+                    ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    try:
+        ok = ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.windll.kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb)
+    except (AttributeError, OSError):
+        return None
+    return counters.PeakWorkingSetSize if ok else None
+
+
+def error_key(error):
+    """错误的分类名称，例如 "EACCES"；没有 errno 的异常使用类名"""
+    code = getattr(error, "errno", None)
+    if code is None:
+        return type(error).__name__
+    return errno.errorcode.get(code, str(code))
+
+
+class RunMetrics:
+    """一次处理的指标，可以在多个线程中同时累计
+
+    实际处理时列目录、规划和重命名以流水线方式并行，阶段耗时是各阶段
+    自身花费的时间（并发重命名时为各线程之和），总和可能超过总耗时。
+    """
+
+    def __init__(self):
+        self.phases = {}  # 阶段 -> 秒
+        self.syscalls = {}  # 系统调用 -> 次数
+        self.errors = {}  # errno 名称 -> 次数
+        self.files = 0  # 需要处理的文件数
+        self.success = 0
+        self.elapsed = 0.0
+        self.peak_memory = None
+        self._start = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._start = time.perf_counter()
+
+    def finish(self, success, files):
+        """处理结束时调用，记录总耗时和峰值内存"""
+        if self._start is not None:
+            self.elapsed = time.perf_counter() - self._start
+        self.success = success
+        self.files = files
+        self.peak_memory = peak_memory_bytes()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def count(self, syscall, n=1):
+        if n:
+            with self._lock:
+                self.syscalls[syscall] = self.syscalls.get(syscall, 0) + n
+
+    def error(self, error):
+        key = error_key(error)
+        with self._lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    @property
+    def files_per_second(self):
+        return self.files / self.elapsed if self.elapsed > 0 else None
+
+    def to_dict(self):
+        """保存在历史记录中的字典"""
+        return {
+            "elapsed": round(self.elapsed, 6),
+            "files_per_second": (round(self.files_per_second, 1)
+                                 if self.files_per_second is not None else None),
+            "phases": {name: round(seconds, 6) for name, seconds in self.phases.items()},
+            "syscalls": dict(self.syscalls),
+            "errors": dict(self.errors),
+            "peak_memory": self.peak_memory,
+        }
+
+
+def summary_text(metrics):
+    """历史记录中指标的多行说明，用于提示信息"""
+    if not metrics:
+        return "没有记录性能指标"
+    lines = [f"总耗时: {metrics.get('elapsed', 0):.3f} 秒"]
+    if metrics.get("files_per_second") is not None:
+        lines.append(f"吞吐量: {metrics['files_per_second']:.0f} 个文件/秒")
+    for name, seconds in metrics.get("phases", {}).items():
+        lines.append(f"  {name}: {seconds:.3f} 秒")
+    if metrics.get("syscalls"):
+        lines.append("系统调用: " + ", ".join(
+            f"{name} {count}" for name, count in metrics["syscalls"].items()))
+    if metrics.get("errors"):
+        lines.append("错误: " + ", ".join(
+            f"{name} {count}" for name, count in metrics["errors"].items()))
+    if metrics.get("peak_memory"):
+        lines.append(f"进程峰值内存: {metrics['peak_memory'] / 1024 / 1024:.1f} MB")
+    return "\n".join(lines)
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{_label_value(value)}"' for key, value in labels.items()) + "}"
+
+
+def prometheus_text(entries):
+    """把每个文件夹每种操作最近一次处理的指标转换为 Prometheus 文本格式
+
+    entries 是历史记录字典，同一文件夹和操作只取第一条（调用方按时间从新
+    到旧传入）。没有记录指标的旧记录只导出文件数。峰值内存是整个进程的
+    峰值，不属于某个文件夹或操作，只导出最近一条带有该值的记录，不带标签。
+    """
+    latest = {}
+    process_peak = None
+    for entry in entries:
+        latest.setdefault((entry["directory"], entry.get("operation") or ""), entry)
+        if process_peak is None:
+            process_peak = (entry.get("metrics") or {}).get("peak_memory")
+
+    families = {}  # 指标名称 -> (类型, 说明, [样本行])
+
+    def sample(name, help_text, value, **labels):
+        if value is None:
+            return
+        full_name = f"{METRIC_PREFIX}_{name}"
+        family = families.setdefault(full_name, ("gauge", help_text, []))
+        family[2].append(f"{full_name}{_labels(**labels) if labels else ''} {value}")
+
+    for (directory, operation), entry in latest.items():
+        base = {"directory": directory, "operation": operation}
+        try:
+            timestamp = time.mktime(time.strptime(entry["timestamp"], "%Y-%m-%d %H:%M:%S"))
+        except (KeyError, TypeError, ValueError):
+            timestamp = None
+        sample("last_run_timestamp_seconds", "最近一次处理的时间", timestamp, **base)
+        sample("last_run_files", "最近一次处理需要处理的文件数",
+               entry.get("total_files"), **base)
+        sample("last_run_success_files", "最近一次处理成功的文件数",
+               entry.get("success_count"), **base)
+        metrics = entry.get("metrics")
+        if not metrics:
+            continue
+        sample("last_run_duration_seconds", "最近一次处理的总耗时",
+               metrics.get("elapsed"), **base)
+        sample("last_run_files_per_second", "最近一次处理的吞吐量",
+               metrics.get("files_per_second"), **base)
+        for phase, seconds in metrics.get("phases", {}).items():
+            sample("last_run_phase_seconds", "最近一次处理各阶段的耗时",
+                   seconds, **base, phase=phase)
+        for syscall, count in metrics.get("syscalls", {}).items():
+            sample("last_run_syscalls", "最近一次处理的系统调用次数",
+                   count, **base, syscall=syscall)
+        for code, count in metrics.get("errors", {}).items():
+            sample("last_run_errors", "最近一次处理按 errno 分类的错误数",
+                   count, **base, errno=code)
+    sample("process_peak_memory_bytes", "最近一次处理结束时所在进程的峰值内存（进程启动以来）",
+           process_peak)
+
+    lines = []
+    for name, (kind, help_text, samples) in families.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path, entries):
+    """写入 .prom 文件，先写临时文件再替换，collector 不会读到写了一半的文件"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(prometheus_text(entries))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
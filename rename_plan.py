@@ -0,0 +1,288 @@
+"""紧凑的列式重命名计划
+
+百万级文件的预览如果保存为 (原文件名, 新文件名, 状态) 元组列表，每行都有
+一个元组、两个字符串和重复的状态文本，内存占用可达数百 MB。RenamePlan
+按列保存:
+
+    stems       去掉原后缀的文件名，每个文件一个字符串
+    suffix_ids  原后缀（保留原大小写）在 suffixes 中的序号，相同后缀只保存一次
+    rule_ids    匹配的规则序号，新文件名由 stem 和规则的新后缀按需拼接
+    codes       状态码，每行 1 字节
+    groups      相似组号，-1 表示不属于任何组
+
+预览表格和命令行都从这里按行读取。
+
+计划可以保存为 JSON Lines 格式的计划文件，之后再逐行读取并执行:
+
+    {"format": "rename-plan", "version": 1, "directory": ..., "params": {...}}
+    {"dir": "", "mtime_ns": 1733562000000000000}   列目录时该文件夹的修改时间
+    ["a.txt", "a.md"]                               一次重命名: [原文件名, 新文件名]
+
+文件夹记录出现在该文件夹中的任何重命名之前。执行时文件夹的修改时间
+未变说明其中的文件没有增删，只有修改时间变化的文件夹中的条目需要重新检查。
+"""
+import os
+import json
+from array import array
+from datetime import datetime
+
+
+# 预览状态码及显示文本
+CODE_READY = 0
+CODE_EXISTS = 1
+CODE_WAITING = 2
+CODE_RENAME = 3  # 目标已存在，执行时按重名策略改用其他名称
+CODE_OVERWRITE = 4  # 目标已存在且较旧，执行时覆盖
+
+STATUS_READY = "可以处理"
+STATUS_EXISTS = "文件已存在"
+STATUS_WAITING = "等待输入新后缀"
+STATUS_RENAME = "已存在，将自动改名"
+STATUS_OVERWRITE = "已存在，将覆盖较旧的文件"
+STATUS_TEXTS = (STATUS_READY, STATUS_EXISTS, STATUS_WAITING,
+                STATUS_RENAME, STATUS_OVERWRITE)
+
+# 会被执行的状态，写入计划文件；冲突在执行时按重名策略重新处理
+ACTIONABLE_CODES = (CODE_READY, CODE_RENAME, CODE_OVERWRITE)
+
+PLAN_FORMAT = "rename-plan"
+PLAN_VERSION = 1
+
+
+class RenamePlan:
+    """按列保存的重命名计划
+
+    rules 为 SuffixRule 列表（RuleSet.rules），rule_ids 是其中的下标。
+    show_new_name 为 False 时新文件名一律为空。
+    """
+
+    def __init__(self, rules, show_new_name=True):
+        self.rules = rules
+        self.show_new_name = show_new_name
+        self.stems = []
+        self.suffixes = []
+        self._suffix_ids = {}
+        self.suffix_ids = array('I')
+        # 按内容匹配时每种 (实际后缀, 推荐后缀) 是一条规则，可能超过 65535 条
+        self.rule_ids = array('I')
+        self.codes = array('B')
+        self.groups = array('i')
+        self.dir_mtimes = {}  # 相对路径 -> 列目录时文件夹的修改时间
+
+    def __len__(self):
+        return len(self.stems)
+
+    def _intern_suffix(self, suffix):
+        suffix_id = self._suffix_ids.get(suffix)
+        if suffix_id is None:
+            suffix_id = self._suffix_ids[suffix] = len(self.suffixes)
+            self.suffixes.append(suffix)
+        return suffix_id
+
+    def add(self, file, rule_id, code):
+        """追加一行，file 必须以该规则的原后缀结尾（不区分大小写）"""
+        split = len(file) - len(self.rules[rule_id].old_suffix)
+        self.stems.append(file[:split])
+        self.suffix_ids.append(self._intern_suffix(file[split:]))
+        self.rule_ids.append(rule_id)
+        self.codes.append(code)
+        self.groups.append(-1)
+
+    def _copy_rows(self, other, start, end):
+        """追加另一个计划中 [start, end) 的行，两者的后缀序号必须一致"""
+        self.stems.extend(other.stems[start:end])
+        self.suffix_ids.extend(other.suffix_ids[start:end])
+        self.rule_ids.extend(other.rule_ids[start:end])
+        self.codes.extend(other.codes[start:end])
+        self.groups.extend(other.groups[start:end])
+
+    def merged(self, removed_rows, chunk):
+        """返回删除 removed_rows 中的行、插入 chunk 中各行后的新计划，以及新增行的行号列表
+
+        本计划和 chunk 都必须已排序，结果仍然有序，新增行未分组。没有变化的
+        行按片段整段复制，各列只重建一次，不会像逐行插入删除那样每次都移动
+        后面的所有行。
+        """
+        removed_rows = set(removed_rows)
+        positions = [self.find(chunk.old_name(i).lower())[1] for i in range(len(chunk))]
+        plan = RenamePlan(self.rules, self.show_new_name)
+        plan.suffixes = list(self.suffixes)
+        plan._suffix_ids = dict(self._suffix_ids)
+        plan.dir_mtimes = dict(self.dir_mtimes)
+        plan.dir_mtimes.update(chunk.dir_mtimes)
+        remap = [plan._intern_suffix(suffix) for suffix in chunk.suffixes]
+
+        inserted = []
+        start = 0
+        i = 0
+        for cut in sorted(removed_rows.union(positions, [len(self)])):
+            plan._copy_rows(self, start, cut)
+            # 插入位置为 cut 的新行排在原第 cut 行之前
+            while i < len(positions) and positions[i] == cut:
+                inserted.append(len(plan))
+                plan.stems.append(chunk.stems[i])
+                plan.suffix_ids.append(remap[chunk.suffix_ids[i]])
+                plan.rule_ids.append(chunk.rule_ids[i])
+                plan.codes.append(chunk.codes[i])
+                plan.groups.append(-1)
+                i += 1
+            start = cut + 1 if cut in removed_rows else cut
+        return plan, inserted
+
+    def extend(self, other):
+        """追加另一个使用相同规则的计划中的所有行"""
+        remap = [self._intern_suffix(suffix) for suffix in other.suffixes]
+        self.stems.extend(other.stems)
+        self.suffix_ids.extend(array('I', (remap[i] for i in other.suffix_ids)))
+        self.rule_ids.extend(other.rule_ids)
+        self.codes.extend(other.codes)
+        self.groups.extend(other.groups)
+        self.dir_mtimes.update(other.dir_mtimes)
+
+    def old_name(self, row):
+        return self.stems[row] + self.suffixes[self.suffix_ids[row]]
+
+    def new_name(self, row):
+        if not self.show_new_name:
+            return ""
+        return self.stems[row] + self.rules[self.rule_ids[row]].new_suffix
+
+    def status(self, row):
+        return STATUS_TEXTS[self.codes[row]]
+
+    def group(self, row):
+        """相似组号，不属于任何组时返回 None"""
+        group = self.groups[row]
+        return None if group < 0 else group
+
+    def row(self, row):
+        """(原文件名, 新文件名, 状态文本)"""
+        return self.old_name(row), self.new_name(row), self.status(row)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self.row(row)
+
+    def iter_old_names(self):
+        for row in range(len(self)):
+            yield self.old_name(row)
+
+    def find(self, key):
+        """已排序的计划中小写原文件名等于 key 的行范围 (起始行, 结束行)
+
+        结束行也是保持排序时插入该名称的位置。
+        """
+        start, end = 0, len(self)
+        while start < end:
+            mid = (start + end) // 2
+            if self.old_name(mid).lower() < key:
+                start = mid + 1
+            else:
+                end = mid
+        end = start
+        while end < len(self) and self.old_name(end).lower() == key:
+            end += 1
+        return start, end
+
+    def set_groups(self, groups):
+        """设置相似组号，groups 为与行一一对应的组号或 None"""
+        self.groups = array('i', (-1 if group is None else group for group in groups))
+
+    def sorted(self):
+        """返回按原文件名排序（不区分大小写）的新计划，字符串不会被复制"""
+        order = sorted(range(len(self)), key=lambda row: self.old_name(row).lower())
+        plan = RenamePlan(self.rules, self.show_new_name)
+        plan.suffixes = list(self.suffixes)
+        plan._suffix_ids = dict(self._suffix_ids)
+        plan.stems = [self.stems[row] for row in order]
+        plan.suffix_ids = array('I', (self.suffix_ids[row] for row in order))
+        plan.rule_ids = array('I', (self.rule_ids[row] for row in order))
+        plan.codes = array('B', (self.codes[row] for row in order))
+        plan.groups = array('i', (self.groups[row] for row in order))
+        plan.dir_mtimes = dict(self.dir_mtimes)
+        return plan
+
+
+class PlanWriter:
+    """逐行写入计划文件，出错时删除写了一半的文件"""
+
+    def __init__(self, path, directory, params):
+        self.path = path
+        self.count = 0
+        self._file = open(path, 'w', encoding='utf-8')
+        self._write({
+            "format": PLAN_FORMAT,
+            "version": PLAN_VERSION,
+            "directory": os.path.abspath(directory),
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "params": params
+        })
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def add_dir(self, rel_dir, mtime_ns):
+        """记录文件夹在列目录时的修改时间"""
+        self._write({"dir": rel_dir, "mtime_ns": mtime_ns})
+
+    def add(self, old_name, new_name):
+        self._write([old_name, new_name])
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        if exc_type is not None:
+            os.remove(self.path)
+
+
+def write_plan(path, plan, directory, params):
+    """把计划中会被执行的行写入计划文件，返回写入的行数"""
+    with PlanWriter(path, directory, params) as writer:
+        for rel_dir, mtime_ns in plan.dir_mtimes.items():
+            writer.add_dir(rel_dir, mtime_ns)
+        for row in range(len(plan)):
+            if plan.codes[row] in ACTIONABLE_CODES:
+                writer.add(plan.old_name(row), plan.new_name(row))
+    return writer.count
+
+
+def read_plan_header(path):
+    """读取计划文件的开始记录，格式不对时抛出 ValueError"""
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            header = None
+    if not isinstance(header, dict) or header.get("format") != PLAN_FORMAT:
+        raise ValueError(f"不是重命名计划文件: {path}")
+    if header.get("version") != PLAN_VERSION:
+        raise ValueError(f"不支持的计划文件版本: {header.get('version')}")
+    return header
+
+
+def iter_plan_file(path):
+    """逐行读取计划文件（跳过开始记录），不会把整个文件读入内存
+
+    产出 ("dir", 相对路径, 修改时间) 或 ("rename", 原文件名, 新文件名)。
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        f.readline()
+        for line_no, line in enumerate(f, 2):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if isinstance(record, dict):
+                    item = "dir", record["dir"], record["mtime_ns"]
+                else:
+                    old_name, new_name = record
+                    item = "rename", old_name, new_name
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"计划文件第 {line_no} 行格式错误: {str(e)}")
+            yield item
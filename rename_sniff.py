@@ -0,0 +1,241 @@
+"""按文件内容识别类型并推断正确的后缀
+
+只读取每个文件开头的 SNIFF_BYTES 个字节，与常见格式的魔数比较。
+识别结果按 (设备, inode, 大小, 修改时间) 缓存，文件未变时重复预览
+不会再次读取文件内容。
+"""
+import os
+import stat
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from rename_core import SuffixRule, normalize_suffix
+
+
+SNIFF_BYTES = 512  # 每个文件最多读取的字节数
+SNIFF_WORKERS = 8  # 并行读取文件头的线程数
+SNIFF_CHUNK = 256  # 每个线程任务处理的文件数，避免为每个文件创建一个任务
+
+
+class FileType:
+    """一种文件格式: 推荐的后缀，以及视为正确、不需要修改的后缀"""
+
+    def __init__(self, suffix, *aliases):
+        self.suffix = suffix
+        self.accepted = frozenset((suffix,) + aliases)
+
+
+JPEG = FileType(".jpg", ".jpeg", ".jpe", ".jfif")
+PNG = FileType(".png")
+GIF = FileType(".gif")
+BMP = FileType(".bmp", ".dib")
+TIFF = FileType(".tif", ".tiff", ".dng", ".cr2", ".nef", ".arw", ".orf", ".rw2")
+WEBP = FileType(".webp")
+HEIC = FileType(".heic", ".heif", ".avif")
+PSD = FileType(".psd", ".psb")
+PDF = FileType(".pdf", ".ai")
+# docx/xlsx/jar 等都是 ZIP 格式，仅凭文件头无法可靠区分，这些后缀都视为正确
+ZIP = FileType(".zip", ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp",
+               ".epub", ".jar", ".apk", ".xpi", ".whl", ".kmz", ".3mf", ".ipa")
+GZIP = FileType(".gz", ".tgz")
+SEVEN_ZIP = FileType(".7z")
+RAR = FileType(".rar")
+MP4 = FileType(".mp4", ".m4v", ".m4p", ".3gp", ".3g2", ".f4v")
+MOV = FileType(".mov", ".qt")
+M4A = FileType(".m4a", ".m4b", ".aac")
+MKV = FileType(".mkv", ".mka", ".mks", ".mk3d")
+WEBM = FileType(".webm")
+AVI = FileType(".avi")
+WAV = FileType(".wav", ".wave")
+MP3 = FileType(".mp3")
+OGG = FileType(".ogg", ".oga", ".ogv", ".opus", ".spx")
+FLAC = FileType(".flac")
+SQLITE = FileType(".sqlite", ".sqlite3", ".db", ".db3")
+
+# ftyp 盒子中的主品牌 -> 类型，未列出的品牌按 MP4 处理
+FTYP_BRANDS = {
+    b"qt  ": MOV,
+    b"M4A ": M4A, b"M4B ": M4A,
+    b"heic": HEIC, b"heix": HEIC, b"heim": HEIC, b"heis": HEIC,
+    b"hevc": HEIC, b"mif1": HEIC, b"msf1": HEIC, b"avif": HEIC,
+}
+
+# 固定偏移处的魔数: (偏移, 字节, 类型)
+SIGNATURES = (
+    (0, b"\xff\xd8\xff", JPEG),
+    (0, b"\x89PNG\r\n\x1a\n", PNG),
+    (0, b"GIF87a", GIF),
+    (0, b"GIF89a", GIF),
+    (0, b"II*\x00", TIFF),
+    (0, b"MM\x00*", TIFF),
+    (0, b"8BPS", PSD),
+    (0, b"%PDF-", PDF),
+    (0, b"PK\x03\x04", ZIP),
+    (0, b"PK\x05\x06", ZIP),
+    (0, b"\x1f\x8b", GZIP),
+    (0, b"7z\xbc\xaf\x27\x1c", SEVEN_ZIP),
+    (0, b"Rar!\x1a\x07", RAR),
+    (0, b"ID3", MP3),
+    (0, b"OggS", OGG),
+    (0, b"fLaC", FLAC),
+    (0, b"SQLite format 3\x00", SQLITE),
+)
+
+
+def detect_type(header):
+    """根据文件开头的字节判断格式，无法识别时返回 None"""
+    for offset, magic, file_type in SIGNATURES:
+        if header.startswith(magic, offset):
+            return file_type
+
+    if header[4:8] == b"ftyp":
+        return FTYP_BRANDS.get(header[8:12], MP4)
+    if header.startswith(b"RIFF"):
+        return {b"WAVE": WAV, b"AVI ": AVI, b"WEBP": WEBP}.get(header[8:12])
+    if header.startswith(b"\x1a\x45\xdf\xa3"):
+        # EBML 头中的 DocType 区分 WebM 和 Matroska
+        return WEBM if b"webm" in header[:64] else MKV
+    if header.startswith(b"BM") and len(header) >= 18 and \
+            int.from_bytes(header[14:18], "little") in (12, 40, 52, 56, 108, 124):
+        return BMP
+    if len(header) >= 2 and header[0] == 0xff and header[1] in (0xfb, 0xf3, 0xf2):
+        # 没有 ID3 标签的 MP3 帧同步字
+        return MP3
+    return None
+
+
+def read_header(path, size=SNIFF_BYTES):
+    """只读取文件开头的 size 个字节（无缓冲，不会多读）"""
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        return os.read(fd, size)
+    finally:
+        os.close(fd)
+
+
+class SniffCache:
+    """按 (设备, inode, 大小, 修改时间) 缓存识别结果，按最近使用淘汰
+
+    重命名不会改变这些属性，所以文件改名后结果仍然有效。
+    """
+
+    def __init__(self, max_entries=200000):
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """返回 (是否命中, 识别结果)"""
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return True, self._results[key]
+        return False, None
+
+    def put(self, key, file_type):
+        with self._lock:
+            self._results[key] = file_type
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+
+class ContentRules:
+    """按文件内容推断后缀的规则集，接口与 RuleSet 相同
+
+    文件内容与后缀不符时，匹配到一条 "实际后缀 -> 推荐后缀" 的规则；
+    规则在遇到新的组合时追加到 rules 中，已有规则的序号不变。
+    suffixes 不为空时只检查这些后缀的文件。
+    """
+
+    def __init__(self, directory, suffixes=(), cache=None, workers=SNIFF_WORKERS):
+        self.directory = directory
+        self.suffixes = [normalize_suffix(suffix) for suffix in suffixes if suffix.strip()]
+        self._suffix_filter = {suffix.lower() for suffix in self.suffixes}
+        self.cache = cache if cache is not None else SniffCache()
+        self.workers = workers
+        self.rules = []
+        self._rule_ids = {}  # (实际后缀, 推荐后缀) -> 规则序号
+        self._matches = {}  # 文件名 -> 规则序号或 None，本次处理内有效
+        self.stat_count = 0  # 识别过的文件数，每个文件一次 stat，用于性能指标
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.rules)
+
+    def _accepts(self, file):
+        if not self._suffix_filter:
+            return True
+        return os.path.splitext(file)[1].lower() in self._suffix_filter
+
+    def _detect(self, file):
+        """识别文件格式，优先使用缓存；不是普通文件或无法读取时返回 None"""
+        path = os.path.join(self.directory, file)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        hit, file_type = self.cache.get(key)
+        if not hit:
+            try:
+                file_type = detect_type(read_header(path))
+            except OSError:
+                return None
+            self.cache.put(key, file_type)
+        return file_type
+
+    def _resolve(self, file):
+        """返回需要修改后缀时的规则序号，否则返回 None"""
+        file_type = self._detect(file)
+        if file_type is None:
+            return None
+        suffix = os.path.splitext(file)[1]
+        if suffix.lower() in file_type.accepted:
+            return None
+        pair = (suffix, file_type.suffix)
+        with self._lock:
+            rule_id = self._rule_ids.get(pair)
+            if rule_id is None:
+                rule_id = self._rule_ids[pair] = len(self.rules)
+                self.rules.append(SuffixRule(*pair, exact=True))
+        return rule_id
+
+    def _resolve_many(self, files):
+        return [self._resolve(file) for file in files]
+
+    def prefetch(self, names):
+        """用线程池并行识别一批文件，之后的 match_id 直接使用结果"""
+        todo = [name for name in names
+                if name not in self._matches and self._accepts(name)]
+        if not todo:
+            return
+        self.stat_count += len(todo)
+        chunks = [todo[i:i + SNIFF_CHUNK] for i in range(0, len(todo), SNIFF_CHUNK)]
+        if len(chunks) == 1 or self.workers <= 1:
+            results = map(self._resolve_many, chunks)
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(self._resolve_many, chunks))
+        for chunk, rule_ids in zip(chunks, results):
+            self._matches.update(zip(chunk, rule_ids))
+
+    def match_id(self, file):
+        """返回匹配的规则序号，没有匹配时返回 None"""
+        if file in self._matches:
+            return self._matches[file]
+        if not self._accepts(file):
+            return None
+        self.stat_count += 1
+        rule_id = self._matches[file] = self._resolve(file)
+        return rule_id
+
+    def match(self, file):
+        rule_id = self.match_id(file)
+        return None if rule_id is None else self.rules[rule_id]
+
+    def as_pairs(self):
+        return [[rule.old_suffix, rule.new_suffix] for rule in self.rules]
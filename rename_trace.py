@@ -0,0 +1,258 @@
+"""可选的性能跟踪
+
+默认关闭，此时 span() 只多一次判断。通过环境变量或界面中的"诊断"菜单
+打开后，各阶段的耗时、界面线程的卡顿（附带调用栈）以及可选的 cProfile
+结果都写入跟踪文件，可以直接附在问题报告中。
+
+跟踪文件使用 Chrome Trace Event 格式（JSON 数组，每行一个事件），可以用
+chrome://tracing 或 https://ui.perfetto.dev 打开；程序卡死或崩溃时文件末尾
+缺少 "]" 也能被这些工具读取。
+
+    RENAME_TRACE=1                  打开跟踪，写入 logs/trace_<时间>.json
+    RENAME_TRACE=/path/trace.json   写入指定的文件
+    RENAME_TRACE_PROFILE=1          同时用 cProfile 分析每次预览和处理
+    RENAME_TRACE_STALL_MS=200       界面线程卡顿超过多少毫秒时记录
+"""
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import datetime
+
+
+TRACE_ENV = "RENAME_TRACE"
+PROFILE_ENV = "RENAME_TRACE_PROFILE"
+STALL_ENV = "RENAME_TRACE_STALL_MS"
+TRACE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+DEFAULT_STALL_MS = 200
+
+
+class TraceWriter:
+    """逐行写入跟踪事件，可以在多个线程中同时使用
+
+    每个事件写入后立即 flush，程序卡死时已记录的事件不会丢失。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'w', encoding='utf-8')
+        self._file.write("[\n")
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        self._threads = set()  # 已写入线程名称的线程
+        self.write({"name": "process_name", "ph": "M",
+                    "args": {"name": f"rename-tools {' '.join(sys.argv[1:])}".strip()}})
+
+    def to_us(self, perf_time):
+        """把 time.perf_counter() 的值转换为跟踪文件中的微秒时间戳"""
+        return round((perf_time - self._origin) * 1e6, 1)
+
+    def now_us(self):
+        return self.to_us(time.perf_counter())
+
+    def write(self, event):
+        tid = event.setdefault("tid", threading.get_ident())
+        event["pid"] = self._pid
+        line = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is None:
+                return
+            if tid not in self._threads:
+                # 第一次遇到的线程先写入线程名称，查看器中按名称显示
+                self._threads.add(tid)
+                name = next((t.name for t in threading.enumerate() if t.ident == tid), str(tid))
+                self._file.write(json.dumps({
+                    "name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid,
+                    "args": {"name": name}}, ensure_ascii=False) + ",\n")
+            self._file.write(line + ",\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            trace_file, self._file = self._file, None
+        if trace_file is not None:
+            trace_file.write(json.dumps({
+                "name": "trace_end", "ph": "i", "s": "g", "ts": self.now_us(),
+                "pid": self._pid, "tid": threading.get_ident()}) + "\n]\n")
+            trace_file.close()
+
+
+_writer = None  # 打开跟踪时的 TraceWriter
+_profile = False  # 是否用 cProfile 分析每次运行
+_profile_count = 0
+_state_lock = threading.Lock()
+
+
+def default_trace_path():
+    return os.path.join(TRACE_DIR, datetime.now().strftime("trace_%Y%m%d_%H%M%S.json"))
+
+
+def enable(path=None, profile=False):
+    """打开跟踪，返回跟踪文件路径；已经打开时返回当前的文件"""
+    global _writer, _profile
+    with _state_lock:
+        if _writer is None:
+            _writer = TraceWriter(path or default_trace_path())
+        _profile = profile
+        return _writer.path
+
+
+def enable_from_env():
+    """按环境变量打开跟踪，没有设置时返回 None"""
+    value = os.environ.get(TRACE_ENV, "").strip()
+    if value in ("", "0"):
+        return None
+    profile = os.environ.get(PROFILE_ENV, "").strip() not in ("", "0")
+    return enable(None if value == "1" else value, profile)
+
+
+def disable():
+    """关闭跟踪并结束跟踪文件，返回文件路径"""
+    global _writer
+    with _state_lock:
+        writer, _writer = _writer, None
+    if writer is None:
+        return None
+    writer.close()
+    return writer.path
+
+
+def set_profile(profile):
+    global _profile
+    _profile = profile
+
+
+def is_enabled():
+    return _writer is not None
+
+
+def trace_path():
+    writer = _writer
+    return writer.path if writer else None
+
+
+def stall_threshold_ms():
+    try:
+        return max(1, int(os.environ.get(STALL_ENV, DEFAULT_STALL_MS)))
+    except ValueError:
+        return DEFAULT_STALL_MS
+
+
+@contextmanager
+def span(name, **args):
+    """记录一段代码的耗时，产出的字典可以在结束前补充参数（例如处理的数量）
+
+    跟踪关闭时什么也不记录。
+    """
+    writer = _writer
+    if writer is None:
+        yield args
+        return
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        end = time.perf_counter()
+        writer.write({"name": name, "ph": "X", "ts": writer.to_us(start),
+                      "dur": round((end - start) * 1e6, 1), "args": args})
+
+
+def instant(name, **args):
+    """记录一个瞬时事件"""
+    writer = _writer
+    if writer is not None:
+        writer.write({"name": name, "ph": "i", "s": "t", "ts": writer.now_us(), "args": args})
+
+
+@contextmanager
+def profile(name):
+    """打开跟踪且选择了 cProfile 时分析这段代码，结果保存在跟踪文件旁边
+
+    cProfile 只分析调用它的线程。同一时间只能有一个分析器（例如预览
+    和处理同时进行时），后开始的那个不分析并记录一个事件。
+    """
+    global _profile_count
+    writer = _writer
+    if writer is None or not _profile:
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        instant("profile_unavailable", run=name, reason=str(e))
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        with _state_lock:
+            _profile_count += 1
+            count = _profile_count
+        path = f"{os.path.splitext(writer.path)[0]}.{name}.{count}.prof"
+        profiler.dump_stats(path)
+        instant("profile", run=name, file=path)
+
+
+class StallDetector:
+    """检测界面线程的卡顿
+
+    界面线程用定时器定期调用 beat()。事件循环被阻塞时心跳停止，检测
+    线程发现心跳超过阈值没有更新就立即记录一次界面线程的调用栈（这样
+    永远不恢复的卡死也能留下记录）；恢复后 beat() 再记录整个卡顿的时长。
+    """
+
+    def __init__(self, threshold_ms=DEFAULT_STALL_MS, thread_id=None):
+        self.threshold = threshold_ms / 1000
+        self.thread_id = thread_id or threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._captured_beat = None  # 已经抓取过调用栈的那次心跳
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._last_beat = time.perf_counter()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._watch, name="stall-detector", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def beat(self):
+        """在界面线程中调用"""
+        now = time.perf_counter()
+        last, self._last_beat = self._last_beat, now
+        gap = now - last
+        writer = _writer
+        if writer is not None and gap > self.threshold:
+            writer.write({"name": "gui_stall", "ph": "X", "ts": writer.to_us(last),
+                          "dur": round(gap * 1e6, 1), "args": {"ms": round(gap * 1000)}})
+
+    def _watch(self):
+        interval = max(0.01, self.threshold / 4)
+        while not self._stop.wait(interval):
+            last = self._last_beat
+            if time.perf_counter() - last <= self.threshold or self._captured_beat == last:
+                continue
+            self._captured_beat = last
+            frame = sys._current_frames().get(self.thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            writer = _writer
+            if writer is not None:
+                # 以界面线程的身份记录，查看器中显示在界面线程的时间线上
+                writer.write({"name": "gui_stall_detected", "ph": "i", "s": "t",
+                              "ts": writer.now_us(), "tid": self.thread_id,
+                              "args": {"threshold_ms": round(self.threshold * 1000),
+                                       "stack": stack}})
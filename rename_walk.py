@@ -0,0 +1,129 @@
+"""递归模式使用的并行目录遍历和文件名筛选"""
+import os
+import re
+import time
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+WALK_WORKERS = 8  # 并行扫描子文件夹的线程数
+
+
+def split_patterns(text):
+    """把 "*.jpg; IMG_*" 这样的文本拆分为通配符列表"""
+    return [p.strip() for p in re.split(r"[;,]", text or "") if p.strip()]
+
+
+def _compile_patterns(patterns):
+    """把多个通配符编译为一个不区分大小写的正则表达式"""
+    if not patterns:
+        return None
+    return re.compile("|".join(fnmatch.translate(p) for p in patterns),
+                      re.IGNORECASE)
+
+
+class NameFilter:
+    """按文件名通配符筛选
+
+    include 为空时接受所有文件，否则文件名需匹配其中之一；
+    匹配 exclude 的文件会被跳过，匹配 exclude 的文件夹不会进入。
+    只比较名称本身（不含上级目录），不区分大小写。
+    """
+
+    def __init__(self, include=(), exclude=()):
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self._include = _compile_patterns(self.include)
+        self._exclude = _compile_patterns(self.exclude)
+
+    def __bool__(self):
+        return bool(self.include or self.exclude)
+
+    def accepts_file(self, path):
+        name = os.path.basename(path)
+        if self._exclude and self._exclude.match(name):
+            return False
+        return not self._include or bool(self._include.match(name))
+
+    def accepts_dir(self, name):
+        return not (self._exclude and self._exclude.match(name))
+
+
+class TreeWalker:
+    """用线程池并行扫描目录树
+
+    每个子文件夹的 scandir 作为一个任务提交到线程池，扫描完成后立即
+    产出结果并提交它的子文件夹，因此结果边扫描边产出。
+    """
+
+    def __init__(self, root, name_filter=None, workers=WALK_WORKERS,
+                 should_continue=None, on_error=None):
+        self.root = root
+        self.name_filter = name_filter
+        self.workers = max(1, workers)
+        self.should_continue = should_continue or (lambda: True)
+        self.on_error = on_error  # on_error(相对路径, 异常)，子文件夹无法读取时调用
+        self.dirs_scanned = 0
+        self.entries_scanned = 0
+        self.start_time = None
+
+    @property
+    def dirs_per_second(self):
+        if not self.start_time:
+            return 0.0
+        elapsed = time.monotonic() - self.start_time
+        return self.dirs_scanned / elapsed if elapsed > 0 else 0.0
+
+    def _scan(self, rel_dir):
+        """扫描一个文件夹，返回 (相对路径, 修改时间, 名称列表, 子文件夹名称集合)
+
+        修改时间在列目录之前读取，列目录期间的变化会使它与之后读取的值不同。
+        """
+        path = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        mtime_ns = os.stat(path).st_mtime_ns
+        names = []
+        dir_names = set()
+        with os.scandir(path) as entries:
+            for entry in entries:
+                names.append(entry.name)
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dir_names.add(entry.name)
+                except OSError:
+                    pass
+        return rel_dir, mtime_ns, names, dir_names
+
+    def walk(self):
+        """逐个产出 (相对路径, 修改时间, 名称列表, 子文件夹名称集合)，根目录的相对路径为 ""
+
+        should_continue() 返回 False 时取消尚未开始的扫描并停止。
+        """
+        self.start_time = time.monotonic()
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            pending = {pool.submit(self._scan, ""): ""}
+            while pending:
+                if not self.should_continue():
+                    return
+                done, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rel_dir = pending.pop(future)
+                    try:
+                        rel_dir, mtime_ns, names, dir_names = future.result()
+                    except OSError as e:
+                        if not rel_dir:
+                            raise
+                        if self.on_error:
+                            self.on_error(rel_dir, e)
+                        continue
+
+                    self.dirs_scanned += 1
+                    self.entries_scanned += len(names)
+                    for name in dir_names:
+                        if self.name_filter and not self.name_filter.accepts_dir(name):
+                            continue
+                        sub_dir = os.path.join(rel_dir, name) if rel_dir else name
+                        pending[pool.submit(self._scan, sub_dir)] = sub_dir
+                    yield rel_dir, mtime_ns, names, dir_names
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
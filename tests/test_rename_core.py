@@ -0,0 +1,561 @@
+"""rename_core.RenameEngine 执行阶段和预览增量更新的测试"""
+import os
+import sys
+import json
+import errno
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rename_fs  # noqa: E402
+import rename_core  # noqa: E402
+from rename_core import RenameEngine  # noqa: E402
+from rename_plan import STATUS_READY, STATUS_EXISTS  # noqa: E402
+
+
+class EngineTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        # 备份创建在文件夹旁边，所以文件夹放在临时目录的下一层
+        self.directory = os.path.join(tmp.name, "files")
+        os.mkdir(self.directory)
+
+    def write(self, name, content=""):
+        with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def engine(self, **kwargs):
+        engine = RenameEngine(self.directory, "txt", "md", "replace", journal_dir=None, **kwargs)
+        self.messages = []
+        engine.on_progress = self.messages.append
+        return engine
+
+
+class NonAtomicTest(EngineTestCase):
+    """不覆盖的原子重命名不可用时，重命名前仍然检查目标"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(rename_fs, "_noreplace_rename", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_existing_target_is_skipped(self):
+        self.write("a.txt", "new")
+        self.write("a.md", "PRECIOUS")
+        self.write("b.txt")
+        self.assertEqual(self.engine().execute(), (1, 2))
+        self.assertEqual(self.read("a.md"), "PRECIOUS")
+        self.assertEqual(self.read("a.txt"), "new")
+        self.assertIn("警告: 'a.md' 已存在，跳过", self.messages)
+
+    def test_numbering_still_avoids_existing_target(self):
+        self.write("a.txt", "new")
+        self.write("a.md", "PRECIOUS")
+        engine = self.engine(collision=rename_core.COLLISION_NUMBER)
+        self.assertEqual(engine.execute(), (1, 1))
+        self.assertEqual(self.read("a.md"), "PRECIOUS")
+        self.assertEqual(self.read("a (1).md"), "new")
+
+
+class StreamingExecuteTest(EngineTestCase):
+    """实际处理边列目录边重命名，不使用目录快照缓存"""
+
+    def test_snapshot_cache_is_not_used(self):
+        for i in range(3):
+            self.write(f"{i}.txt")
+        cache = rename_core.SnapshotCache()
+
+        def materialize(*args):
+            raise AssertionError("实际处理不应一次列出整个目录")
+
+        with mock.patch.object(rename_core, "scan_directory", materialize), \
+                mock.patch.object(rename_core.SnapshotCache, "get", materialize):
+            engine = self.engine(snapshot_cache=cache)
+            self.assertEqual(engine.execute(), (3, 3))
+        self.assertEqual(engine.metrics.syscalls.get("scandir"), 1)
+
+    def test_progress_has_a_total(self):
+        count = rename_core.PIPELINE_BATCH_SIZE * 2 + 10
+        for i in range(count):
+            self.write(f"{i}.txt")
+        values = []
+        engine = self.engine()
+        engine.on_progress_value = values.append
+        self.assertEqual(engine.execute(), (count, count))
+        self.assertEqual(values[0], -1)
+        self.assertEqual(values[-1], 100)
+        self.assertTrue(any(0 <= value < 100 for value in values))
+        self.assertEqual(values[1:], sorted(values[1:]))
+
+
+class NameAllocatorTest(unittest.TestCase):
+    """为重名文件分配编号名称"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def touch(self, *names):
+        for name in names:
+            path = os.path.join(self.directory, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'w').close()
+
+    def test_numbers_increase(self):
+        self.touch("a.md")
+        allocator = rename_core.NameAllocator(self.directory, case_insensitive=False)
+        self.assertEqual(allocator.allocate("a.md"), "a (1).md")
+        self.assertEqual(allocator.allocate("a.md"), "a (2).md")
+        self.assertIn("a (2).md", allocator)
+
+    def test_existing_numbered_names_are_skipped(self):
+        self.touch("a.md", "a (1).md", "a (2).md", "a (4).md")
+        allocator = rename_core.NameAllocator(self.directory, case_insensitive=False)
+        self.assertEqual(allocator.allocate("a.md"), "a (3).md")
+        self.assertEqual(allocator.allocate("a.md"), "a (5).md")
+
+    def test_case_insensitive(self):
+        self.touch("A.md", "A (1).md")
+        allocator = rename_core.NameAllocator(self.directory, case_insensitive=True)
+        self.assertIn("a.md", allocator)
+        self.assertEqual(allocator.allocate("a.md"), "a (2).md")
+        # 只有大小写不同的基础名称共用编号
+        self.assertEqual(allocator.allocate("A.md"), "A (3).md")
+
+    def test_case_sensitive(self):
+        self.touch("A (1).md")
+        allocator = rename_core.NameAllocator(self.directory, case_insensitive=False)
+        self.assertNotIn("a (1).md", allocator)
+        self.assertEqual(allocator.allocate("a.md"), "a (1).md")
+
+    def test_relative_paths(self):
+        self.touch("sub/a.md", "a (1).md")
+        allocator = rename_core.NameAllocator(self.directory, case_insensitive=False)
+        self.assertEqual(allocator.allocate(os.path.join("sub", "a.md")),
+                         os.path.join("sub", "a (1).md"))
+
+    def test_lists_lazily_and_reports_errors(self):
+        allocator = rename_core.NameAllocator(os.path.join(self.directory, "missing"))
+        allocator.add("a.md")
+        self.assertFalse(allocator.known_taken("a.md"))
+        self.assertEqual(allocator.dirs_listed, 0)
+        with self.assertRaises(OSError):
+            allocator.allocate("a.md")
+
+
+class CollisionTest(EngineTestCase):
+    """非跳过策略只在真的重名时才列目录"""
+
+    def test_no_collision_does_not_list(self):
+        self.write("a.txt")
+        engine = self.engine(collision=rename_core.COLLISION_NUMBER)
+        self.assertEqual(engine.execute(), (1, 1))
+        self.assertEqual(engine.metrics.syscalls.get("listdir", 0), 0)
+
+    def test_number_after_collision(self):
+        self.write("a.txt", "new")
+        self.write("a.md", "PRECIOUS")
+        self.write("a (1).md", "PRECIOUS 1")
+        engine = self.engine(collision=rename_core.COLLISION_NUMBER)
+        self.assertEqual(engine.execute(), (1, 1))
+        self.assertEqual(self.read("a.md"), "PRECIOUS")
+        self.assertEqual(self.read("a (1).md"), "PRECIOUS 1")
+        self.assertEqual(self.read("a (2).md"), "new")
+        self.assertEqual(engine.metrics.syscalls.get("listdir"), 1)
+
+    def test_two_sources_same_target(self):
+        self.write("a.txt", "txt")
+        self.write("a.md", "PRECIOUS")
+        engine = RenameEngine(self.directory, "", "", "rules", journal_dir=None,
+                              rules=[(".txt", ".md"), (".markdown", ".md")],
+                              collision=rename_core.COLLISION_NUMBER)
+        self.write("a.markdown", "markdown")
+        engine.on_progress = lambda message: None
+        self.assertEqual(engine.execute(), (2, 2))
+        self.assertEqual(sorted(os.listdir(self.directory)), ["a (1).md", "a (2).md", "a.md"])
+        self.assertEqual(self.read("a.md"), "PRECIOUS")
+
+    def test_overwrite_older(self):
+        self.write("a.md", "old")
+        self.write("a.txt", "new")
+        os.utime(os.path.join(self.directory, "a.md"), (0, 0))
+        engine = self.engine(collision=rename_core.COLLISION_OVERWRITE_OLDER)
+        self.assertEqual(engine.execute(), (1, 1))
+        self.assertEqual(os.listdir(self.directory), ["a.md"])
+        self.assertEqual(self.read("a.md"), "new")
+
+    def test_unreadable_folder_is_not_treated_as_empty(self):
+        self.write("a.txt", "new")
+        self.write("a.md", "PRECIOUS")
+
+        def listdir(path):
+            raise PermissionError(13, "Permission denied", path)
+
+        engine = self.engine(collision=rename_core.COLLISION_NUMBER)
+        with mock.patch.object(rename_core.os, "listdir", listdir):
+            self.assertEqual(engine.execute(), (0, 1))
+        self.assertEqual(self.read("a.md"), "PRECIOUS")
+        self.assertEqual(self.read("a.txt"), "new")
+        self.assertTrue(any(m.startswith("错误: 无法列出") for m in self.messages))
+
+
+class AbortTest(EngineTestCase):
+    """备份失败时中止处理，与用户停止区分开"""
+
+    def test_backup_failure_mid_run(self):
+        for name in ("a.txt", "b.txt", "c.txt"):
+            self.write(name)
+        added = []
+
+        def add(writer, old, new):
+            if added:
+                raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+            added.append(old)
+
+        with mock.patch.object(rename_core.BackupWriter, "add", add):
+            engine = self.engine(backup_mode=rename_core.BACKUP_MANIFEST)
+            success_count, total_files = engine.execute()
+        self.assertEqual((success_count, total_files), (1, 2))
+        self.assertFalse(engine.is_running)
+        self.assertIn("已停止处理", engine.abort_reason)
+        self.assertIsNotNone(engine.history_entry(success_count, total_files))
+
+    def test_user_stop_has_no_abort_reason(self):
+        self.write("a.txt")
+        engine = self.engine()
+        engine.stop()
+        engine.execute()
+        self.assertIsNone(engine.abort_reason)
+
+
+class DiffPreviewTest(EngineTestCase):
+    """目录变化后的增量预览与完整重新预览的结果一致"""
+
+    def setUp(self):
+        super().setUp()
+        for name in ("abc1.txt", "abc2.txt", "x.txt", "x.md", "zz.txt"):
+            self.write(name)
+        self.cache = rename_core.SnapshotCache()
+
+    def full_preview(self):
+        """与 GUI 相同: 排序并分组的完整预览"""
+        self.cache.invalidate(self.directory)
+        engine = self.engine(snapshot_cache=self.cache)
+        plan = engine.preview().sorted()
+        plan.set_groups(rename_core.group_similar_names(plan.iter_old_names()))
+        return engine, plan
+
+    def apply_changes(self, change):
+        engine, plan = self.full_preview()
+        old_snapshot = engine.snapshot
+        change()
+        self.cache.invalidate(self.directory)
+        new_snapshot = self.cache.get(self.directory)
+        chunk, removed, recheck = engine.diff_preview(old_snapshot, new_snapshot)
+        # 后台计算不切换引擎的快照
+        self.assertIs(engine.snapshot, old_snapshot)
+        merged, _ = rename_core.merge_preview_diff(plan, chunk, removed, recheck, 100)
+        engine.adopt_snapshot(new_snapshot)
+        self.assertIs(engine.names, new_snapshot.index)
+        return merged
+
+    def groups(self, plan):
+        members = {}
+        for row in range(len(plan)):
+            if plan.group(row) is not None:
+                members.setdefault(plan.group(row), []).append(plan.old_name(row))
+        return sorted(members.values())
+
+    def assert_matches_full_preview(self, plan):
+        _, expected = self.full_preview()
+        self.assertEqual(list(plan), list(expected))
+        self.assertEqual(self.groups(plan), self.groups(expected))
+
+    def test_added_files_are_inserted_in_order_and_grouped(self):
+        def change():
+            self.write("abc3.txt")
+            self.write("b.txt")
+            self.write("zz.md")
+        plan = self.apply_changes(change)
+        self.assertEqual(plan.row(plan.find("zz.txt")[0]), ("zz.txt", "zz.md", STATUS_EXISTS))
+        self.assert_matches_full_preview(plan)
+        self.assertEqual(self.groups(plan), [["abc1.txt", "abc2.txt", "abc3.txt"]])
+
+    def test_removed_files_leave_their_group(self):
+        def change():
+            os.remove(os.path.join(self.directory, "abc2.txt"))
+            os.remove(os.path.join(self.directory, "zz.txt"))
+        plan = self.apply_changes(change)
+        self.assert_matches_full_preview(plan)
+        self.assertEqual(self.groups(plan), [])
+
+    def test_renamed_target_updates_status(self):
+        def change():
+            os.rename(os.path.join(self.directory, "x.md"), os.path.join(self.directory, "y.md"))
+            os.rename(os.path.join(self.directory, "abc1.txt"), os.path.join(self.directory, "abd.txt"))
+        _, plan = self.full_preview()
+        self.assertEqual(plan.status(plan.find("x.txt")[0]), STATUS_EXISTS)
+        plan = self.apply_changes(change)
+        self.assertEqual(plan.status(plan.find("x.txt")[0]), STATUS_READY)
+        self.assert_matches_full_preview(plan)
+
+    def test_many_changes_in_one_batch(self):
+        def change():
+            for i in range(50):
+                self.write(f"abc{i:02d}.txt")
+            for name in ("abc1.txt", "x.md", "zz.txt"):
+                os.remove(os.path.join(self.directory, name))
+        self.assert_matches_full_preview(self.apply_changes(change))
+
+
+class SnapshotCacheTest(EngineTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write("a.txt")
+        self.cache = rename_core.SnapshotCache()
+
+    def backdate(self, path, seconds=60):
+        mtime_ns = os.stat(path).st_mtime_ns - seconds * 10**9
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+        return mtime_ns
+
+    def test_reuses_listing_of_settled_directory(self):
+        self.backdate(self.directory)
+        snapshot = self.cache.get(self.directory)
+        self.assertTrue(snapshot.trusted)
+        self.assertIs(self.cache.get(self.directory), snapshot)
+
+    def test_recently_modified_directory_is_listed_again(self):
+        # 同一时间粒度内的下一次变化可能不改变修改时间
+        snapshot = self.cache.get(self.directory)
+        self.assertFalse(snapshot.trusted)
+        self.write("b.txt")
+        mtime_ns = snapshot.mtime_ns
+        os.utime(self.directory, ns=(mtime_ns, mtime_ns))
+        self.assertIn("b.txt", self.cache.get(self.directory).index)
+
+    def test_replaced_directory_with_same_mtime_is_listed_again(self):
+        mtime_ns = self.backdate(self.directory)
+        self.assertNotIn("b.txt", self.cache.get(self.directory).index)
+        os.rename(self.directory, self.directory + ".old")
+        os.mkdir(self.directory)
+        self.write("b.txt")
+        os.utime(self.directory, ns=(mtime_ns, mtime_ns))
+        self.assertIn("b.txt", self.cache.get(self.directory).index)
+
+
+class RuleSetTest(unittest.TestCase):
+    def test_longest_suffix_wins(self):
+        rules = rename_core.RuleSet([(".gz", ".gzip"), (".tar.gz", ".tgz")])
+        self.assertEqual(rules.match("a.tar.gz").apply("a.tar.gz"), "a.tgz")
+        self.assertEqual(rules.match("a.gz").apply("a.gz"), "a.gzip")
+        # 顺序不影响结果
+        rules = rename_core.RuleSet([(".tar.gz", ".tgz"), (".gz", ".gzip")])
+        self.assertEqual(rules.match("b.tar.gz").apply("b.tar.gz"), "b.tgz")
+        self.assertIsNone(rules.match("gz"))
+        self.assertIsNone(rules.match("a.tar"))
+
+    def test_matching_ignores_case_and_keeps_stem(self):
+        rules = rename_core.RuleSet([("TXT", "md")])
+        self.assertEqual(rules.rules[0].old_suffix, ".TXT")
+        self.assertEqual(rules.match_id("Read.Me.txt"), 0)
+        self.assertEqual(rules.match("Read.Me.tXt").apply("Read.Me.tXt"), "Read.Me.md")
+        self.assertEqual(rules.match("a.txt").apply("a.txt"), "a.md")
+
+    def test_duplicate_suffix_differing_in_case_is_rejected(self):
+        with self.assertRaises(ValueError):
+            rename_core.RuleSet([(".txt", ".md"), ("TXT", ".rst")])
+
+    def test_empty_old_suffix_is_rejected(self):
+        with self.assertRaises(ValueError):
+            rename_core.RuleSet([("  ", ".md")])
+
+    def test_removal_rule(self):
+        rules = rename_core.RuleSet([(".bak",)])
+        self.assertEqual(rules.match("a.txt.BAK").apply("a.txt.BAK"), "a.txt")
+        self.assertEqual(rules.as_pairs(), [[".bak", ""]])
+
+
+class LoadRulesTest(unittest.TestCase):
+    def load(self, text):
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix=".rules",
+                                         delete=False) as f:
+            f.write(text)
+        self.addCleanup(os.remove, f.name)
+        return rename_core.load_rules(f.name)
+
+    def test_formats_and_comments(self):
+        rules = self.load("# 注释\n"
+                          "\n"
+                          "txt md\n"
+                          ".tar.gz -> .tgz  # 行尾注释\n"
+                          ".bak\n"
+                          ".tmp ->\n"
+                          "jpeg->jpg\n")
+        self.assertEqual(rules, [("txt", "md"), (".tar.gz", ".tgz"), (".bak", ""),
+                                 (".tmp", ""), ("jpeg", "jpg")])
+        self.assertEqual(len(rename_core.RuleSet(rules)), 5)
+
+    def test_malformed_lines_report_line_number(self):
+        for line in ("a b c", "-> .md", "a b -> c", "a -> b c"):
+            with self.subTest(line=line):
+                with self.assertRaisesRegex(ValueError, "第 2 行"):
+                    self.load("txt md\n" + line + "\n")
+
+    def test_duplicates_are_reported_when_compiled(self):
+        rules = self.load(".txt .md\n.TXT .rst\n")
+        with self.assertRaises(ValueError):
+            rename_core.RuleSet(rules)
+
+
+class PlanFileExecuteTest(EngineTestCase):
+    """导出计划文件后按计划执行"""
+
+    def setUp(self):
+        super().setUp()
+        for name in ("a.txt", "b.txt", "c.txt", "c.md"):
+            self.write(name, name)
+        self.plan_path = os.path.join(os.path.dirname(self.directory), "plan.jsonl")
+
+    def export(self):
+        self.assertEqual(self.engine().export_plan(self.plan_path), (2, 1))
+
+    def plan_engine(self):
+        engine = RenameEngine.from_plan_file(self.plan_path, journal_dir=None)
+        self.messages = []
+        engine.on_progress = self.messages.append
+        return engine
+
+    def test_export_then_apply(self):
+        self.export()
+        engine = self.plan_engine()
+        self.assertEqual(engine.directory, os.path.abspath(self.directory))
+        self.assertEqual(engine.suffix_summary(), (".txt", ".md"))
+        self.assertEqual(engine.execute(), (2, 2))
+        self.assertEqual(sorted(os.listdir(self.directory)), ["a.md", "b.md", "c.md", "c.txt"])
+        self.assertEqual(self.read("a.md"), "a.txt")
+        # 修改时间未变，不逐个检查原文件
+        self.assertFalse(any("有变化" in message for message in self.messages))
+
+    def test_directory_changed_after_export(self):
+        self.export()
+        os.remove(os.path.join(self.directory, "a.txt"))
+        self.write("d.txt")
+        engine = self.plan_engine()
+        self.assertEqual(engine.execute(), (1, 2))
+        self.assertIn("警告: 'a.txt' 已不存在，跳过", self.messages)
+        # 生成计划之后新增的文件不在计划中
+        self.assertEqual(sorted(os.listdir(self.directory)), ["b.md", "c.md", "c.txt", "d.txt"])
+
+    def test_truncated_plan_aborts(self):
+        self.export()
+        with open(self.plan_path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        with open(self.plan_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines[:-1])
+            f.write(lines[-1][:5])
+        engine = self.plan_engine()
+        self.assertEqual(engine.execute(), (1, 1))
+        self.assertIn("读取计划文件失败", engine.abort_reason)
+        # 最后一行之前的重命名已经执行
+        old_name, new_name = json.loads(lines[-2])
+        names = os.listdir(self.directory)
+        self.assertIn(new_name, names)
+        self.assertNotIn(old_name, names)
+        self.assertEqual(len([name for name in names if name.endswith(".txt")]), 2)
+
+
+def baseline_group_similar_names(names):
+    """f68949d 中 update_preview_table 的 O(N²) 分组，颜色序号改为不循环的组号"""
+    similar_texts = {}
+    for i, old_name in enumerate(names):
+        name_without_ext = os.path.splitext(old_name)[0]
+        for existing_name in similar_texts.keys():
+            common_prefix = os.path.commonprefix(
+                [existing_name.lower(), name_without_ext.lower()])
+            if len(common_prefix) >= 3:
+                similar_texts[existing_name].append(i)
+                break
+        else:
+            similar_texts[name_without_ext] = [i]
+
+    groups = [None] * len(names)
+    color_index = 0
+    for indices in similar_texts.values():
+        if len(indices) > 1:
+            for idx in indices:
+                groups[idx] = color_index
+            color_index += 1
+    return groups
+
+
+class GroupSimilarNamesTest(unittest.TestCase):
+    """与原来逐个比较最长公共前缀的实现结果相同"""
+
+    def assert_same_as_baseline(self, names):
+        self.assertEqual(rename_core.group_similar_names(iter(names)),
+                         baseline_group_similar_names(names))
+
+    def test_mixed_case_and_short_names(self):
+        names = ["ABC1.txt", "abc2.TXT", "Abd.txt", "ab.txt", "ab.md", "a", ".txt",
+                 "abd.md", "ABDx", "x.y.z", "X.Y.W", "x.y", "", "İstanbul.txt",
+                 "i̇st.txt", "abc"]
+        self.assert_same_as_baseline(names)
+        self.assert_same_as_baseline(sorted(names, key=str.lower))
+        groups = rename_core.group_similar_names(names)
+        self.assertEqual(groups[0], groups[1])
+        self.assertIsNone(groups[3])
+
+    def test_random_names(self):
+        rng = random.Random(4)
+        for _ in range(50):
+            names = ["".join(rng.choice("aAbB.") for _ in range(rng.randint(0, 6)))
+                     + rng.choice(("", ".txt", ".MD"))
+                     for _ in range(rng.randint(0, 60))]
+            self.assert_same_as_baseline(names)
+
+
+class ManifestBackupTest(EngineTestCase):
+    def read_manifest(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_each_record_is_readable_before_close(self):
+        writer = rename_core.BackupWriter(self.directory, rename_core.BACKUP_MANIFEST)
+        self.addCleanup(os.remove, writer.path)
+        writer.add("a.txt", "a.md")
+        # 处理中途（例如崩溃时）清单已经是完整的行
+        records = self.read_manifest(writer.path)
+        self.assertEqual(records[0]["directory"], self.directory)
+        self.assertEqual(records[1:], [{"old": "a.txt", "new": "a.md"}])
+        writer.add("a.txt", "a (1).md")
+        writer.close()
+        self.assertEqual(self.read_manifest(writer.path)[1:], [
+            {"old": "a.txt", "new": "a.md"}, {"old": "a.txt", "new": "a (1).md"}])
+
+    def test_execute_with_manifest_backup(self):
+        self.write("a.txt")
+        self.write("b.txt")
+        engine = self.engine(backup_mode=rename_core.BACKUP_MANIFEST)
+        self.assertEqual(engine.execute(), (2, 2))
+        parent = os.path.dirname(self.directory)
+        manifests = [name for name in os.listdir(parent) if name.endswith(".jsonl")]
+        self.assertEqual(len(manifests), 1)
+        self.assertTrue(manifests[0].startswith("files_backup_"))
+        records = self.read_manifest(os.path.join(parent, manifests[0]))
+        self.assertEqual(sorted((r["old"], r["new"]) for r in records[1:]),
+                         [("a.txt", "a.md"), ("b.txt", "b.md")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+"""rename_daemon.RenameDaemon 任务调度的测试（不启动 socket）"""
+import os
+import sys
+import stat
+import time
+import socket
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rename_daemon  # noqa: E402
+from rename_daemon import RenameDaemon  # noqa: E402
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class SchedulingTest(unittest.TestCase):
+    """同一文件夹的任务依次执行，但不会占住执行线程"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dirs = []
+        for name in ("a", "b"):
+            path = os.path.join(tmp.name, name)
+            os.mkdir(path)
+            open(os.path.join(path, "x.txt"), 'w').close()
+            self.dirs.append(path)
+
+        self.daemon = RenameDaemon(os.path.join(tmp.name, "daemon.sock"),
+                                   concurrency=2, max_queue=3)
+        self.release = threading.Event()
+        run_job = self.daemon._run_job
+
+        def slow_run_job(job):
+            if job.job_id == 1:
+                self.release.wait(5)
+            run_job(job)
+
+        self.daemon._run_job = slow_run_job
+        for i in range(self.daemon.concurrency):
+            worker = threading.Thread(target=self.daemon._worker, daemon=True)
+            worker.start()
+            self.daemon._workers.append(worker)
+        self.addCleanup(self.daemon._stop_workers)
+        self.addCleanup(self.release.set)
+
+    def submit(self, directory):
+        return self.daemon.submit({"directory": directory, "old_suffix": ".txt",
+                                   "new_suffix": ".md", "preview": True})
+
+    def test_busy_folder_does_not_block_other_folders(self):
+        first = self.submit(self.dirs[0])
+        second = self.submit(self.dirs[0])
+        other = self.submit(self.dirs[1])
+        # 两个执行线程，一个在处理 a，另一个取到排在 a 之后的任务后应继续执行 b
+        self.assertTrue(wait_until(lambda: other.done))
+        self.assertEqual(other.state, rename_daemon.STATE_FINISHED)
+        self.assertFalse(first.done)
+        self.assertEqual(second.state, rename_daemon.STATE_QUEUED)
+        self.assertEqual(self.daemon.status()["queued"], 1)
+
+        self.release.set()
+        self.assertTrue(wait_until(lambda: second.done))
+        self.assertEqual(second.state, rename_daemon.STATE_FINISHED)
+        # 文件夹空闲后不再保留记录
+        self.assertTrue(wait_until(lambda: not self.daemon._busy_dirs))
+        self.assertEqual(self.daemon.status()["queued"], 0)
+
+    def test_deferred_jobs_count_towards_queue_limit(self):
+        self.submit(self.dirs[0])
+        self.assertTrue(wait_until(lambda: self.daemon._busy_dirs))
+        for _ in range(3):
+            self.submit(self.dirs[0])
+        with self.assertRaises(rename_daemon.DaemonError):
+            self.submit(self.dirs[1])
+
+    def test_cancel_deferred_job(self):
+        self.submit(self.dirs[0])
+        second = self.submit(self.dirs[0])
+        self.assertTrue(wait_until(lambda: self.daemon._deferred == 1))
+        self.assertTrue(second.cancel())
+        self.release.set()
+        self.assertTrue(wait_until(lambda: not self.daemon._busy_dirs))
+        self.assertEqual(second.state, rename_daemon.STATE_CANCELLED)
+
+
+
+@unittest.skipUnless(rename_daemon.is_supported(), "不支持 Unix socket")
+class BindTest(unittest.TestCase):
+    """监听 socket 时的权限和残留文件处理"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.socket_path = os.path.join(tmp.name, "daemon.sock")
+        self.daemon = RenameDaemon(self.socket_path)
+
+    def bind(self):
+        server = self.daemon._bind()
+        self.addCleanup(server.server_close)
+        return server
+
+    def test_socket_is_private_from_creation(self):
+        # 不依赖 bind 之后的 chmod
+        with mock.patch.object(rename_daemon.os, "chmod"):
+            self.bind()
+        self.assertEqual(stat.S_IMODE(os.stat(self.socket_path).st_mode) & 0o077, 0)
+
+    def test_regular_file_is_not_removed(self):
+        with open(self.socket_path, 'w') as f:
+            f.write("data")
+        with self.assertRaises(rename_daemon.DaemonError):
+            self.daemon._bind()
+        with open(self.socket_path) as f:
+            self.assertEqual(f.read(), "data")
+
+    def test_stale_socket_is_replaced(self):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.socket_path)
+        stale.close()
+        self.bind()
+        self.assertTrue(stat.S_ISSOCK(os.lstat(self.socket_path).st_mode))
+
+
+
+@unittest.skipUnless(rename_daemon.is_supported(), "不支持 Unix socket")
+class ClientTest(unittest.TestCase):
+    """客户端把异常的回复转换为 DaemonError"""
+
+    def serve_once(self, reply):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "daemon.sock")
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(server.close)
+        server.bind(path)
+        server.listen(1)
+
+        def answer():
+            conn, _ = server.accept()
+            with conn:
+                conn.makefile("rb").readline()
+                conn.sendall(reply)
+
+        thread = threading.Thread(target=answer, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        return rename_daemon.DaemonClient(path)
+
+    def test_truncated_reply(self):
+        client = self.serve_once(b'{"event": "po')
+        with self.assertRaises(rename_daemon.DaemonError):
+            client.request("ping")
+
+    def test_reply_is_not_an_object(self):
+        client = self.serve_once(b'[1, 2]\n')
+        with self.assertRaises(rename_daemon.DaemonError):
+            client.request("ping")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""rename_fs.DirectoryRenamer 的测试"""
+import os
+import sys
+import errno
+import ctypes
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rename_fs  # noqa: E402
+from rename_fs import DirectoryRenamer  # noqa: E402
+
+
+def _unsupported_rename(*args):
+    """模拟文件系统不支持 RENAME_NOREPLACE 时 renameat2 的返回"""
+    ctypes.set_errno(errno.EINVAL)
+    return -1
+
+
+class UnsupportedFlagTest(unittest.TestCase):
+    """不覆盖标志不受支持时退回普通 rename，也不能覆盖已存在的文件"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = self.tmp.name
+        patcher = mock.patch.object(rename_fs, "_noreplace_rename", _unsupported_rename)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, content):
+        with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def test_existing_target_is_not_overwritten(self):
+        self.write("a.txt", "new")
+        self.write("a.md", "PRECIOUS")
+        with DirectoryRenamer(self.directory) as renamer:
+            # 第一次调用才发现标志不受支持，这一次也必须检查目标
+            self.assertTrue(renamer.atomic)
+            with self.assertRaises(FileExistsError):
+                renamer.rename("a.txt", "a.md")
+            self.assertFalse(renamer.atomic)
+            # 之后的调用走普通 rename，同样要检查
+            with self.assertRaises(FileExistsError):
+                renamer.rename("a.txt", "a.md")
+        self.assertEqual(self.read("a.md"), "PRECIOUS")
+        self.assertEqual(self.read("a.txt"), "new")
+
+    def test_dangling_symlink_counts_as_existing(self):
+        if not hasattr(os, "symlink"):
+            self.skipTest("不支持符号链接")
+        self.write("a.txt", "new")
+        os.symlink("missing", os.path.join(self.directory, "a.md"))
+        with DirectoryRenamer(self.directory) as renamer:
+            with self.assertRaises(FileExistsError):
+                renamer.rename("a.txt", "a.md")
+        self.assertTrue(os.path.islink(os.path.join(self.directory, "a.md")))
+
+    def test_free_target_is_renamed(self):
+        self.write("a.txt", "new")
+        with DirectoryRenamer(self.directory) as renamer:
+            renamer.rename("a.txt", "a.md")
+            self.write("b.txt", "b")
+            renamer.rename("b.txt", "b.md")
+        self.assertEqual(sorted(os.listdir(self.directory)), ["a.md", "b.md"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""rename_history.HistoryStore 的测试"""
+import os
+import sys
+import json
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rename_history import HistoryStore  # noqa: E402
+
+
+def entry(i, directory="/data/inbox", **fields):
+    return {"run_id": f"run{i}", "timestamp": f"2024-01-01 00:00:{i:02d}",
+            "directory": directory, "old_suffix": ".txt", "new_suffix": ".md",
+            "operation": "replace", "success_count": i, "total_files": i, **fields}
+
+
+class HistoryStoreTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.db = os.path.join(tmp.name, "history.db")
+        self.legacy = os.path.join(tmp.name, "history.json")
+
+    def store(self):
+        return HistoryStore(self.db, self.legacy)
+
+    def test_pages_newest_first(self):
+        store = self.store()
+        for i in range(25):
+            store.add(entry(i))
+        self.assertEqual(store.count(), 25)
+        first = store.page(0, 10)
+        self.assertEqual([e["run_id"] for e in first], [f"run{i}" for i in range(24, 14, -1)])
+        last = store.page(20, 10)
+        self.assertEqual([e["run_id"] for e in last], [f"run{i}" for i in range(4, -1, -1)])
+        self.assertEqual(store.last_directory(), "/data/inbox")
+
+    def test_metrics_round_trip(self):
+        store = self.store()
+        store.add(entry(1, metrics={"elapsed": 1.5}))
+        store.add(entry(2))
+        entries = store.page(0, 10)
+        self.assertIsNone(entries[0]["metrics"])
+        self.assertEqual(entries[1]["metrics"], {"elapsed": 1.5})
+
+    def test_filter_is_case_insensitive_prefix(self):
+        store = self.store()
+        store.add(entry(1, "/data/inbox"))
+        store.add(entry(2, "/Data/Archive"))
+        store.add(entry(3, "/backup/data"))
+        store.add(entry(4, "/data_x"))
+        self.assertEqual(store.count("/data"), 3)
+        self.assertEqual([e["run_id"] for e in store.page(0, 10, "/DATA/")], ["run2", "run1"])
+        # 通配符按字面匹配
+        self.assertEqual([e["run_id"] for e in store.page(0, 10, "/data_")], ["run4"])
+        self.assertEqual(store.count("data"), 0)
+
+    def test_filter_uses_directory_index(self):
+        store = self.store()
+        store.add(entry(1))
+        where, params = store._where("/data")
+        conn = sqlite3.connect(self.db)
+        try:
+            plan = conn.execute(
+                f"EXPLAIN QUERY PLAN SELECT COUNT(*) FROM history {where}", params).fetchall()
+        finally:
+            conn.close()
+        self.assertIn("idx_history_directory_nocase", " ".join(row[-1] for row in plan))
+
+    def test_legacy_json_imported_once(self):
+        with open(self.legacy, 'w', encoding='utf-8') as f:
+            # 旧版 JSON 中新记录在前
+            json.dump([entry(2), entry(1)], f)
+        store = self.store()
+        self.assertEqual([e["run_id"] for e in store.page(0, 10)], ["run2", "run1"])
+
+        with open(self.legacy, 'w', encoding='utf-8') as f:
+            json.dump([entry(3)], f)
+        store.clear()
+        self.assertEqual(self.store().count(), 0)
+
+    def test_old_database_is_migrated(self):
+        conn = sqlite3.connect(self.db)
+        conn.executescript("""
+            CREATE TABLE history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT, timestamp TEXT NOT NULL,
+                directory TEXT NOT NULL, old_suffix TEXT, new_suffix TEXT, operation TEXT,
+                success_count INTEGER, total_files INTEGER);
+            CREATE INDEX idx_history_directory ON history (directory, timestamp);
+        """)
+        conn.close()
+        store = self.store()
+        store.add(entry(1, metrics={"elapsed": 1.0}))
+        self.assertEqual(store.page(0, 1)[0]["metrics"], {"elapsed": 1.0})
+        conn = sqlite3.connect(self.db)
+        try:
+            indexes = {row[1] for row in conn.execute("PRAGMA index_list(history)")}
+        finally:
+            conn.close()
+        self.assertNotIn("idx_history_directory", indexes)
+        self.assertIn("idx_history_directory_nocase", indexes)
+
+
+if __name__ == "__main__":
+    unittest.main()
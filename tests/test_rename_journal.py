@@ -0,0 +1,94 @@
+"""rename_journal 中断处理检测和撤销的测试"""
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rename_fs  # noqa: E402
+import rename_journal  # noqa: E402
+from rename_journal import RenameJournal  # noqa: E402
+
+
+@unittest.skipUnless(rename_journal.fcntl or rename_journal.msvcrt, "不支持文件锁")
+class IncompleteRunsTest(unittest.TestCase):
+    """写入进程仍在运行的日志不算中断"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.journal_dir = tmp.name
+
+    def run_ids(self):
+        return [header["run_id"] for header in rename_journal.incomplete_runs(self.journal_dir)]
+
+    def test_live_journal_is_skipped(self):
+        journal = RenameJournal.create(self.journal_dir, {}, journal_dir=self.journal_dir)
+        self.addCleanup(lambda: journal._file.closed or journal.close())
+        journal.record_rename("a.txt", "a.md")
+        self.assertTrue(rename_journal.writer_alive(journal.path))
+        self.assertEqual(self.run_ids(), [])
+
+    def test_abandoned_journal_is_reported(self):
+        journal = RenameJournal.create(self.journal_dir, {}, journal_dir=self.journal_dir)
+        journal.record_rename("a.txt", "a.md")
+        # 不写结束记录就关闭，相当于进程崩溃后锁被释放
+        journal.close()
+        self.assertFalse(rename_journal.writer_alive(journal.path))
+        self.assertEqual(self.run_ids(), [journal.run_id])
+
+        rename_journal.mark_recovered(journal.run_id, self.journal_dir)
+        self.assertEqual(self.run_ids(), [])
+
+
+class UndoTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.journal_dir = os.path.join(tmp.name, "journal")
+        self.directory = os.path.join(tmp.name, "files")
+        os.mkdir(self.directory)
+        journal = RenameJournal.create(self.directory, {}, journal_dir=self.journal_dir)
+        for old_name, new_name in (("a.txt", "a.md"), ("b.txt", "b.md")):
+            self.write(new_name, old_name)
+            journal.record_done(journal.record_rename(old_name, new_name))
+        journal.close(2)
+        self.run_id = journal.run_id
+
+    def write(self, name, content):
+        with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def undo(self):
+        self.messages = []
+        return rename_journal.undo_run(self.run_id, on_progress=self.messages.append,
+                                       journal_dir=self.journal_dir)
+
+    def test_undo_keeps_file_that_took_the_original_name(self):
+        self.write("a.txt", "PRECIOUS")
+        self.assertEqual(self.undo(), (1, 2))
+        self.assertEqual(self.read("a.txt"), "PRECIOUS")
+        self.assertEqual(self.read("a.md"), "a.txt")
+        self.assertEqual(self.read("b.txt"), "b.txt")
+        self.assertIn("警告: 'a.txt' 已存在，无法撤销", self.messages)
+        # 再次撤销只处理剩下的文件
+        os.remove(os.path.join(self.directory, "a.txt"))
+        self.assertEqual(self.undo(), (1, 1))
+        self.assertEqual(self.read("a.txt"), "a.txt")
+
+    def test_undo_without_atomic_rename(self):
+        with mock.patch.object(rename_fs, "_noreplace_rename", None):
+            self.write("a.txt", "PRECIOUS")
+            self.assertEqual(self.undo(), (1, 2))
+        self.assertEqual(self.read("a.txt"), "PRECIOUS")
+        self.assertIn("警告: 'a.txt' 已存在，无法撤销", self.messages)
+
+
+if __name__ == "__main__":
+    unittest.main()
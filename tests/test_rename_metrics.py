@@ -0,0 +1,68 @@
+"""rename_metrics 导出 Prometheus 文本格式的测试"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rename_metrics import prometheus_text  # noqa: E402
+
+
+def entry(directory, operation, timestamp, total_files, metrics=None):
+    return {"directory": directory, "operation": operation, "timestamp": timestamp,
+            "total_files": total_files, "success_count": total_files, "metrics": metrics}
+
+
+class PrometheusTextTest(unittest.TestCase):
+    def samples(self, text, name):
+        return [line for line in text.splitlines()
+                if line.startswith(f"rename_tools_{name}{{") or line.startswith(f"rename_tools_{name} ")]
+
+    def test_label_values_are_escaped(self):
+        text = prometheus_text([entry('C:\\data\\"new"\nline', "replace",
+                                      "2024-01-01 10:00:00", 3)])
+        self.assertEqual(self.samples(text, "last_run_files"), [
+            'rename_tools_last_run_files{directory="C:\\\\data\\\\\\"new\\"\\nline",'
+            'operation="replace"} 3'])
+
+    def test_only_latest_entry_per_directory_and_operation(self):
+        text = prometheus_text([
+            entry("/a", "replace", "2024-01-03 10:00:00", 30),
+            entry("/a", "undo", "2024-01-02 10:00:00", 20),
+            entry("/a", "replace", "2024-01-01 10:00:00", 10),
+            entry("/b", None, "2024-01-01 10:00:00", 5),
+        ])
+        self.assertEqual(self.samples(text, "last_run_files"), [
+            'rename_tools_last_run_files{directory="/a",operation="replace"} 30',
+            'rename_tools_last_run_files{directory="/a",operation="undo"} 20',
+            'rename_tools_last_run_files{directory="/b",operation=""} 5'])
+        # 每个指标只有一组 HELP 和 TYPE
+        self.assertEqual(text.count("# TYPE rename_tools_last_run_files gauge"), 1)
+
+    def test_run_metrics_and_process_peak_memory(self):
+        metrics = {"elapsed": 1.5, "files_per_second": 20.0, "phases": {"rename": 1.2},
+                   "syscalls": {"rename": 30}, "errors": {"EACCES": 2},
+                   "peak_memory": 2048}
+        text = prometheus_text([
+            entry("/a", "replace", "2024-01-03 10:00:00", 30),  # 没有指标的旧格式
+            entry("/b", "replace", "2024-01-02 10:00:00", 20, metrics),
+            entry("/c", "replace", "2024-01-01 10:00:00", 10, dict(metrics, peak_memory=1024)),
+        ])
+        self.assertEqual(self.samples(text, "last_run_duration_seconds"), [
+            'rename_tools_last_run_duration_seconds{directory="/b",operation="replace"} 1.5',
+            'rename_tools_last_run_duration_seconds{directory="/c",operation="replace"} 1.5'])
+        self.assertIn('rename_tools_last_run_errors{directory="/b",operation="replace",'
+                      'errno="EACCES"} 2', text)
+        self.assertIn('rename_tools_last_run_phase_seconds{directory="/b",operation="replace",'
+                      'phase="rename"} 1.2', text)
+        # 峰值内存属于进程，只导出最近的一个值，不带文件夹和操作标签
+        self.assertEqual(self.samples(text, "process_peak_memory_bytes"),
+                         ["rename_tools_process_peak_memory_bytes 2048"])
+        self.assertNotIn("last_run_peak_memory", text)
+
+    def test_empty_history(self):
+        self.assertEqual(prometheus_text([]), "\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+"""rename_plan 中计划和计划文件的测试"""
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rename_core import RuleSet, SuffixRule  # noqa: E402
+from rename_plan import (RenamePlan, PlanWriter, write_plan, read_plan_header,  # noqa: E402
+                         iter_plan_file, CODE_READY, CODE_EXISTS, CODE_RENAME,
+                         STATUS_READY, STATUS_EXISTS)
+
+
+class RenamePlanTest(unittest.TestCase):
+    def setUp(self):
+        self.rules = RuleSet([(".txt", ".md"), (".tar.gz", ".tgz")]).rules
+
+    def plan(self, names, code=CODE_READY):
+        plan = RenamePlan(self.rules)
+        for name in names:
+            plan.add(name, 1 if name.lower().endswith(".tar.gz") else 0, code)
+        return plan
+
+    def test_rows_round_trip(self):
+        plan = self.plan(["b.TXT", "a.tar.gz", "c.Txt"])
+        plan.codes[2] = CODE_EXISTS
+        self.assertEqual(list(plan), [("b.TXT", "b.md", STATUS_READY),
+                                      ("a.tar.gz", "a.tgz", STATUS_READY),
+                                      ("c.Txt", "c.md", STATUS_EXISTS)])
+        self.assertEqual(list(plan.iter_old_names()), ["b.TXT", "a.tar.gz", "c.Txt"])
+        # 原后缀保留原大小写，相同的后缀只保存一次
+        self.assertEqual(sorted(plan.suffixes), [".TXT", ".Txt", ".tar.gz"])
+        self.assertIsNone(plan.group(0))
+
+    def test_hidden_new_names(self):
+        plan = RenamePlan(self.rules, show_new_name=False)
+        plan.add("a.txt", 0, CODE_READY)
+        self.assertEqual(plan.row(0), ("a.txt", "", STATUS_READY))
+
+    def test_extend_remaps_suffixes(self):
+        plan = self.plan(["a.tar.gz"])
+        plan.extend(self.plan(["b.txt", "c.tar.gz"]))
+        self.assertEqual(list(plan.iter_old_names()), ["a.tar.gz", "b.txt", "c.tar.gz"])
+        self.assertEqual(len(plan.suffixes), 2)
+
+    def test_sorted_ignores_case_and_keeps_columns(self):
+        plan = self.plan(["b.txt", "A.txt", "c.txt", "a2.txt"])
+        plan.codes[1] = CODE_EXISTS
+        plan.set_groups([None, 3, None, 3])
+        result = plan.sorted()
+        self.assertEqual(list(result.iter_old_names()), ["A.txt", "a2.txt", "b.txt", "c.txt"])
+        self.assertEqual(result.status(0), STATUS_EXISTS)
+        self.assertEqual([result.group(row) for row in range(4)], [3, 3, None, None])
+        # 原计划不变
+        self.assertEqual(plan.old_name(0), "b.txt")
+
+    def test_find(self):
+        plan = self.plan(["a.txt", "B.txt", "b.txt", "d.txt"]).sorted()
+        self.assertEqual(plan.find("b.txt"), (1, 3))
+        self.assertEqual(plan.find("a.txt"), (0, 1))
+        # 不存在时返回保持排序的插入位置
+        self.assertEqual(plan.find("c.txt"), (3, 3))
+        self.assertEqual(plan.find("0.txt"), (0, 0))
+        self.assertEqual(plan.find("z.txt"), (4, 4))
+        self.assertEqual(RenamePlan(self.rules).find("a.txt"), (0, 0))
+
+    def test_merged_inserts_and_removes_in_one_pass(self):
+        plan = self.plan(["b.txt", "d.txt", "f.txt"]).sorted()
+        plan.set_groups([None, 0, 0])
+        chunk = self.plan(["a.txt", "c.txt", "e.txt", "g.txt"]).sorted()
+        chunk.codes[1] = CODE_EXISTS
+        merged, inserted = plan.merged([0, 2], chunk)
+        self.assertEqual(list(merged.iter_old_names()), ["a.txt", "c.txt", "d.txt", "e.txt", "g.txt"])
+        self.assertEqual(inserted, [0, 1, 3, 4])
+        self.assertEqual(merged.status(1), STATUS_EXISTS)
+        # 原有行保留分组，新增行未分组
+        self.assertEqual([merged.group(row) for row in range(5)], [None, None, 0, None, None])
+        self.assertEqual(len(plan), 3)
+
+    def test_merged_inserts_before_removed_row_at_same_position(self):
+        plan = self.plan(["a.txt", "c.txt"]).sorted()
+        merged, inserted = plan.merged([1], self.plan(["b.txt", "c.TXT"]).sorted())
+        self.assertEqual(list(merged.iter_old_names()), ["a.txt", "b.txt", "c.TXT"])
+        self.assertEqual(inserted, [1, 2])
+        merged, inserted = plan.merged([], RenamePlan(self.rules))
+        self.assertEqual(list(merged.iter_old_names()), ["a.txt", "c.txt"])
+        self.assertEqual(inserted, [])
+
+    def test_rule_ids_beyond_16_bits(self):
+        rules = [SuffixRule(f".s{i}", ".md") for i in range(70000)]
+        plan = RenamePlan(rules)
+        plan.add("a.s69999", 69999, CODE_READY)
+        self.assertEqual(plan.sorted().row(0), ("a.s69999", "a.md", STATUS_READY))
+
+
+class PlanFileTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "plan.jsonl")
+        self.rules = RuleSet([(".txt", ".md")]).rules
+
+    def test_round_trip_writes_actionable_rows_only(self):
+        plan = RenamePlan(self.rules)
+        plan.add("a.txt", 0, CODE_READY)
+        plan.add("b.txt", 0, CODE_EXISTS)
+        plan.add("c.txt", 0, CODE_RENAME)
+        plan.dir_mtimes[""] = 123
+        self.assertEqual(write_plan(self.path, plan, "/data", {"operation": "replace"}), 2)
+        header = read_plan_header(self.path)
+        self.assertEqual(header["directory"], os.path.abspath("/data"))
+        self.assertEqual(header["params"], {"operation": "replace"})
+        self.assertEqual(list(iter_plan_file(self.path)),
+                         [("dir", "", 123), ("rename", "a.txt", "a.md"),
+                          ("rename", "c.txt", "c.md")])
+
+    def test_writer_removes_partial_file_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with PlanWriter(self.path, "/data", {}) as writer:
+                writer.add("a.txt", "a.md")
+                raise RuntimeError
+        self.assertFalse(os.path.exists(self.path))
+
+    def write_lines(self, *lines):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            for line in lines:
+                f.write(line + "\n")
+
+    def test_header_is_checked(self):
+        for header in ("", "not json", json.dumps(["a", "b"]),
+                       json.dumps({"format": "other", "version": 1})):
+            with self.subTest(header=header):
+                self.write_lines(header)
+                with self.assertRaisesRegex(ValueError, "不是重命名计划文件"):
+                    read_plan_header(self.path)
+        self.write_lines(json.dumps({"format": "rename-plan", "version": 99}))
+        with self.assertRaisesRegex(ValueError, "不支持的计划文件版本"):
+            read_plan_header(self.path)
+
+    def test_malformed_lines_report_line_number(self):
+        header = json.dumps({"format": "rename-plan", "version": 1})
+        for line in ('["a.txt", "a', '["a.txt"]', '{"dir": ""}', '42'):
+            with self.subTest(line=line):
+                self.write_lines(header, '["ok.txt", "ok.md"]', "", line)
+                entries = iter_plan_file(self.path)
+                self.assertEqual(next(entries), ("rename", "ok.txt", "ok.md"))
+                with self.assertRaisesRegex(ValueError, "第 4 行"):
+                    list(entries)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+"""rename_sniff 按内容识别文件类型的测试"""
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rename_sniff  # noqa: E402
+from rename_core import RenameEngine  # noqa: E402
+from rename_plan import STATUS_READY  # noqa: E402
+from rename_sniff import ContentRules, SniffCache, detect_type  # noqa: E402
+
+PNG_HEADER = b"\x89PNG\r\n\x1a\n" + b"\x00" * 16
+JPEG_HEADER = b"\xff\xd8\xff\xe0" + b"\x00" * 16
+PDF_HEADER = b"%PDF-1.7\n"
+
+
+def ftyp(brand):
+    return b"\x00\x00\x00\x18ftyp" + brand + b"\x00\x00\x02\x00"
+
+
+def riff(subtype):
+    return b"RIFF\x24\x00\x00\x00" + subtype + b"\x00" * 8
+
+
+def bmp(dib_size):
+    return b"BM" + b"\x00" * 12 + dib_size.to_bytes(4, "little") + b"\x00" * 8
+
+
+class DetectTypeTest(unittest.TestCase):
+    def test_fixed_signatures(self):
+        self.assertIs(detect_type(PNG_HEADER), rename_sniff.PNG)
+        self.assertIs(detect_type(JPEG_HEADER), rename_sniff.JPEG)
+        self.assertIs(detect_type(PDF_HEADER), rename_sniff.PDF)
+        self.assertIs(detect_type(b"PK\x03\x04"), rename_sniff.ZIP)
+        self.assertIs(detect_type(b"SQLite format 3\x00"), rename_sniff.SQLITE)
+        self.assertIsNone(detect_type(b""))
+        self.assertIsNone(detect_type(b"plain text"))
+
+    def test_ftyp_brands(self):
+        self.assertIs(detect_type(ftyp(b"qt  ")), rename_sniff.MOV)
+        self.assertIs(detect_type(ftyp(b"M4A ")), rename_sniff.M4A)
+        self.assertIs(detect_type(ftyp(b"M4B ")), rename_sniff.M4A)
+        self.assertIs(detect_type(ftyp(b"heic")), rename_sniff.HEIC)
+        self.assertIs(detect_type(ftyp(b"avif")), rename_sniff.HEIC)
+        # 未列出的品牌按 MP4 处理
+        self.assertIs(detect_type(ftyp(b"isom")), rename_sniff.MP4)
+        self.assertIs(detect_type(ftyp(b"mp42")), rename_sniff.MP4)
+
+    def test_riff_subtypes(self):
+        self.assertIs(detect_type(riff(b"WAVE")), rename_sniff.WAV)
+        self.assertIs(detect_type(riff(b"AVI ")), rename_sniff.AVI)
+        self.assertIs(detect_type(riff(b"WEBP")), rename_sniff.WEBP)
+        self.assertIsNone(detect_type(riff(b"CDXA")))
+
+    def test_ebml_doc_type(self):
+        ebml = b"\x1a\x45\xdf\xa3\x9f\x42\x86\x81\x01\x42\x82\x84"
+        self.assertIs(detect_type(ebml + b"webm\x42\x87\x81\x04"), rename_sniff.WEBM)
+        self.assertIs(detect_type(ebml + b"matroska\x42\x87\x81\x04"), rename_sniff.MKV)
+
+    def test_bmp_requires_known_dib_size(self):
+        for dib_size in (12, 40, 124):
+            self.assertIs(detect_type(bmp(dib_size)), rename_sniff.BMP)
+        # 以 "BM" 开头的文本不是位图
+        self.assertIsNone(detect_type(bmp(7)))
+        self.assertIsNone(detect_type(b"BMW owners"))
+
+    def test_mp3(self):
+        self.assertIs(detect_type(b"ID3\x04\x00"), rename_sniff.MP3)
+        for second in (0xfb, 0xf3, 0xf2):
+            self.assertIs(detect_type(bytes([0xff, second, 0x90, 0x00])), rename_sniff.MP3)
+        self.assertIsNone(detect_type(b"\xff\xfe"))
+        self.assertIsNone(detect_type(b"\xff"))
+
+
+class ContentRulesTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+        self.write("photo.txt", PNG_HEADER)
+        self.write("other.txt", PNG_HEADER)
+        self.write("pic.PNG", PNG_HEADER)
+        self.write("scan", JPEG_HEADER)
+        self.write("notes.txt", b"hello")
+        os.mkdir(os.path.join(self.directory, "folder.txt"))
+
+    def write(self, name, data):
+        with open(os.path.join(self.directory, name), 'wb') as f:
+            f.write(data)
+
+    def new_names(self, rules, names):
+        return {name: rules.match(name).apply(name) for name in names if rules.match(name)}
+
+    def test_rules_for_mismatched_suffixes(self):
+        rules = ContentRules(self.directory)
+        names = sorted(os.listdir(self.directory))
+        self.assertEqual(self.new_names(rules, names), {
+            "other.txt": "other.png", "photo.txt": "photo.png", "scan": "scan.jpg"})
+        # 相同的 (实际后缀, 推荐后缀) 共用一条规则
+        self.assertEqual(rules.match_id("photo.txt"), rules.match_id("other.txt"))
+        self.assertEqual(sorted(map(tuple, rules.as_pairs())), [("", ".jpg"), (".txt", ".png")])
+
+    def test_empty_suffix_rule(self):
+        rules = ContentRules(self.directory)
+        rule = rules.match("scan")
+        self.assertEqual((rule.old_suffix, rule.new_suffix), ("", ".jpg"))
+        engine = RenameEngine(self.directory, "", "", "sniff", rules=rules, journal_dir=None)
+        plan = engine.preview()
+        self.assertIn(("scan", "scan.jpg", STATUS_READY), list(plan))
+        self.assertEqual(engine.execute(), (3, 3))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, "scan.jpg")))
+
+    def test_suffix_filter(self):
+        rules = ContentRules(self.directory, ["TXT"])
+        self.assertIsNone(rules.match("scan"))
+        self.assertEqual(rules.match("photo.txt").apply("photo.txt"), "photo.png")
+
+    def test_prefetch_in_parallel_matches_serial(self):
+        names = sorted(os.listdir(self.directory))
+        serial = ContentRules(self.directory, workers=1)
+        parallel = ContentRules(self.directory, workers=4)
+        with mock.patch.object(rename_sniff, "SNIFF_CHUNK", 1):
+            parallel.prefetch(names)
+        self.assertEqual(self.new_names(parallel, names), self.new_names(serial, names))
+
+    def test_cache_is_reused_after_rename(self):
+        cache = SniffCache()
+        ContentRules(self.directory, cache=cache).prefetch(["photo.txt"])
+        os.rename(os.path.join(self.directory, "photo.txt"),
+                  os.path.join(self.directory, "renamed.txt"))
+        with mock.patch.object(rename_sniff, "read_header") as read_header:
+            rules = ContentRules(self.directory, cache=cache)
+            self.assertEqual(rules.match("renamed.txt").apply("renamed.txt"), "renamed.png")
+        read_header.assert_not_called()
+
+        # 内容改变（大小不同）时重新读取
+        self.write("renamed.txt", JPEG_HEADER + b"more")
+        rules = ContentRules(self.directory, cache=cache)
+        self.assertEqual(rules.match("renamed.txt").apply("renamed.txt"), "renamed.jpg")
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = SniffCache(max_entries=2)
+        cache.put(1, "a")
+        cache.put(2, "b")
+        self.assertEqual(cache.get(1), (True, "a"))
+        cache.put(3, "c")
+        self.assertEqual(cache.get(2), (False, None))
+        self.assertEqual(cache.get(1), (True, "a"))
+
+
+if __name__ == "__main__":
+    unittest.main()